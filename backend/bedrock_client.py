@@ -0,0 +1,156 @@
+"""
+Async invocation layer for Amazon Bedrock
+Runs the blocking boto3 calls on a bounded thread pool so the event loop stays free
+"""
+
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncGenerator, Dict, Optional
+
+import boto3
+from loguru import logger
+
+from connections import BEDROCK_READ_TIMEOUT, client_config
+
+BEDROCK_REGION = os.getenv("BEDROCK_REGION", "us-east-1")
+BEDROCK_MAX_CONCURRENCY = int(os.getenv("BEDROCK_MAX_CONCURRENCY", "256"))
+
+# Sentinel pushed by the reader thread once a response stream is exhausted
+_STREAM_END = object()
+
+
+class BedrockInvoker:
+    """Awaitable wrapper around a bedrock-runtime client.
+
+    Each call runs on a dedicated thread pool sized to ``max_concurrency``,
+    so one worker can hold that many Bedrock calls in flight while still
+    serving other routes.  Calls beyond the limit wait on a semaphore
+    instead of piling up inside the executor queue.
+    """
+
+    def __init__(self, client: Optional[Any] = None, max_concurrency: int = BEDROCK_MAX_CONCURRENCY,
+                 region_name: str = BEDROCK_REGION):
+        self.max_concurrency = max_concurrency
+        self.client = client or boto3.client(
+            'bedrock-runtime',
+            region_name=region_name,
+            config=client_config(max_concurrency, BEDROCK_READ_TIMEOUT, max_attempts=1)
+        )
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="bedrock")
+        # Created on first use: before 3.10 a semaphore binds to the loop current when it is built,
+        # and the module-level invoker is built at import, before the serving loop exists
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+
+    def _invoke_blocking(self, model_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        response = self.client.invoke_model(
+            modelId=model_id,
+            body=json.dumps(body),
+            contentType="application/json"
+        )
+        # Reading the body is network I/O too, so it stays on the worker thread
+        return json.loads(response['body'].read())
+
+    def _stream_blocking(self, model_id: str, body: Dict[str, Any], loop: asyncio.AbstractEventLoop,
+                         queue: asyncio.Queue, stop: threading.Event) -> None:
+        def put(item: Any) -> None:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                pass  # Event loop already closed, nobody is listening
+
+        try:
+            response = self.client.invoke_model_with_response_stream(
+                modelId=model_id,
+                body=json.dumps(body),
+                contentType="application/json"
+            )
+            stream = response['body']
+            try:
+                for event in stream:
+                    if stop.is_set():
+                        break
+                    chunk = event.get('chunk')
+                    if chunk:
+                        put(json.loads(chunk['bytes']))
+            finally:
+                stream.close()
+        except Exception as e:
+            put(e)
+        finally:
+            put(_STREAM_END)
+
+    def _loop_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def _acquire(self) -> None:
+        self.waiting += 1
+        try:
+            await self._loop_semaphore().acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def _release(self, *_: Any) -> None:
+        self.in_flight -= 1
+        self.completed += 1
+        self._semaphore.release()
+
+    async def invoke_model(self, model_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Invoke a model and return the decoded response body"""
+        await self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._invoke_blocking, model_id, body)
+        finally:
+            self._release()
+
+    async def invoke_model_stream(self, model_id: str, body: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
+        """Invoke a model with a response stream, yielding decoded chunks as they arrive"""
+        await self._acquire()
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        try:
+            reader = loop.run_in_executor(self._executor, self._stream_blocking, model_id, body, loop, queue, stop)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the reader thread has closed the stream,
+        # even if the consumer stops iterating early
+        reader.add_done_callback(self._release)
+
+        try:
+            while True:
+                item = await queue.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+
+    def shutdown(self) -> None:
+        """Stop accepting work and release the worker threads"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        logger.info("Bedrock invoker shut down")
+
+    def stats(self) -> Dict[str, Any]:
+        """Get invoker statistics"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed
+        }
@@ -0,0 +1,279 @@
+"""
+Benchmarks for the Prompt Tune backend
+Uses a local stand-in for bedrock-runtime so results don't depend on AWS
+
+Usage:
+    python benchmark.py concurrency --requests 200 --latency 0.5
+    python benchmark.py stream --chunks 50 --chunk-latency 0.02
+    python benchmark.py adapters --iterations 100000
+    python benchmark.py cache --entries 100000
+    python benchmark.py cache-ops --sizes 100,10000,1000000
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import time
+import timeit
+import tracemalloc
+from typing import Dict, List
+
+from loguru import logger
+
+from bedrock_client import BedrockInvoker
+from cache import PromptCache
+from model_adapters import get_adapter
+
+
+class FakeEventStream:
+    """Iterable of Claude-style stream events, one every ``chunk_latency`` seconds"""
+
+    def __init__(self, pieces: List[str], chunk_latency: float):
+        self.pieces = pieces
+        self.chunk_latency = chunk_latency
+
+    def __iter__(self):
+        for piece in self.pieces:
+            time.sleep(self.chunk_latency)
+            event = {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}}
+            yield {"chunk": {"bytes": json.dumps(event).encode()}}
+        metrics = {"inputTokenCount": 300, "outputTokenCount": len(self.pieces)}
+        yield {"chunk": {"bytes": json.dumps({"type": "message_stop", "amazon-bedrock-invocationMetrics": metrics}).encode()}}
+
+    def close(self):
+        pass
+
+
+class FakeBedrockClient:
+    """Blocking stand-in for bedrock-runtime.
+
+    ``latency`` is the time to a complete response; the streaming API emits
+    ``chunks`` pieces of the same text spread evenly over that time.
+    """
+
+    def __init__(self, latency: float = 0.5, chunks: int = 1):
+        self.latency = latency
+        self.chunks = chunks
+        self.text = json.dumps({"reasoning_trace": ["Step 1: ok"], "optimized_prompt": "ok"})
+
+    def _pieces(self) -> List[str]:
+        size = max(1, len(self.text) // self.chunks + 1)
+        return [self.text[i:i + size] for i in range(0, len(self.text), size)]
+
+    def invoke_model(self, modelId: str, body: str, contentType: str = "application/json") -> Dict:
+        time.sleep(self.latency)
+        payload = {
+            "content": [{"text": self.text}],
+            "usage": {"input_tokens": 300, "output_tokens": 120}
+        }
+        return {"body": io.BytesIO(json.dumps(payload).encode())}
+
+    def invoke_model_with_response_stream(self, modelId: str, body: str,
+                                          contentType: str = "application/json") -> Dict:
+        pieces = self._pieces()
+        return {"body": FakeEventStream(pieces, self.latency / len(pieces))}
+
+
+async def _blocking_call(client: FakeBedrockClient, model_id: str, body: Dict) -> Dict:
+    # The pre-invoker code path: a sync boto3 call made directly inside a coroutine
+    response = client.invoke_model(modelId=model_id, body=json.dumps(body), contentType="application/json")
+    return json.loads(response['body'].read())
+
+
+async def _run_concurrent(call, requests: int) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(call() for _ in range(requests)))
+    return time.perf_counter() - started
+
+
+async def bench_concurrency(requests: int, latency: float, max_concurrency: int) -> None:
+    model_id = "anthropic.claude-3-haiku-20240307-v1:0"
+    body = {"messages": [{"role": "user", "content": "hi"}], "max_tokens": 10}
+    client = FakeBedrockClient(latency)
+
+    before = await _run_concurrent(lambda: _blocking_call(client, model_id, body), requests)
+
+    invoker = BedrockInvoker(client=client, max_concurrency=max_concurrency)
+    after = await _run_concurrent(lambda: invoker.invoke_model(model_id, body), requests)
+    invoker.shutdown()
+
+    print(f"{requests} concurrent calls, {latency * 1000:.0f}ms simulated Bedrock latency")
+    print(f"  blocking in event loop: {before:8.2f}s  {requests / before:8.1f} req/s")
+    print(f"  BedrockInvoker({max_concurrency:>4}): {after:8.2f}s  {requests / after:8.1f} req/s")
+    print(f"  speedup: {before / after:.1f}x")
+
+
+async def bench_stream(chunks: int, chunk_latency: float) -> None:
+    model_id = "anthropic.claude-3-haiku-20240307-v1:0"
+    body = {"messages": [{"role": "user", "content": "hi"}], "max_tokens": 10}
+    client = FakeBedrockClient(latency=chunks * chunk_latency, chunks=chunks)
+    invoker = BedrockInvoker(client=client, max_concurrency=4)
+
+    started = time.perf_counter()
+    await invoker.invoke_model(model_id, body)
+    buffered_ttfb = time.perf_counter() - started
+
+    started = time.perf_counter()
+    streamed_ttfb = None
+    async for _ in invoker.invoke_model_stream(model_id, body):
+        if streamed_ttfb is None:
+            streamed_ttfb = time.perf_counter() - started
+    streamed_total = time.perf_counter() - started
+    invoker.shutdown()
+
+    print(f"{chunks} chunks, {chunk_latency * 1000:.0f}ms between chunks")
+    print(f"  invoke_model time to first byte:        {buffered_ttfb * 1000:8.1f}ms")
+    print(f"  response stream time to first byte:    {streamed_ttfb * 1000:8.1f}ms")
+    print(f"  response stream time to last byte:     {streamed_total * 1000:8.1f}ms")
+
+
+# One representative model id, response body and stream chunk per adapter family
+ADAPTER_SAMPLES = {
+    "amazon.nova-lite-v1:0": (
+        {"output": {"message": {"content": [{"text": "ok"}]}}, "usage": {"inputTokens": 300, "outputTokens": 120}},
+        {"contentBlockDelta": {"delta": {"text": "ok"}, "contentBlockIndex": 0}}
+    ),
+    "anthropic.claude-3-haiku-20240307-v1:0": (
+        {"content": [{"text": "ok"}], "usage": {"input_tokens": 300, "output_tokens": 120}},
+        {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "ok"}}
+    ),
+    "meta.llama3-8b-instruct-v1:0": (
+        {"generation": "ok", "prompt_token_count": 300, "generation_token_count": 120},
+        {"generation": "ok"}
+    ),
+    "amazon.titan-text-express-v1": (
+        {"inputTextTokenCount": 300, "results": [{"outputText": "ok", "tokenCount": 120}]},
+        {"outputText": "ok", "index": 0}
+    ),
+    "cohere.command-light-text-v14": (
+        {"generations": [{"text": "ok"}]},
+        {"generations": [{"text": "ok"}]}
+    ),
+}
+
+
+def bench_adapters(iterations: int) -> None:
+    print(f"Per-call cost over {iterations} iterations (microseconds)")
+    print(f"  {'model':42} {'resolve':>8} {'body':>8} {'parse':>8} {'chunk':>8} {'usage':>8}")
+    for model_id, (response, chunk) in ADAPTER_SAMPLES.items():
+        adapter = get_adapter(model_id)
+        timings = [
+            timeit.timeit(lambda: get_adapter(model_id), number=iterations),
+            timeit.timeit(lambda: adapter.build_body("prompt", 1000, 0.7), number=iterations),
+            timeit.timeit(lambda: adapter.parse_response(response), number=iterations),
+            timeit.timeit(lambda: adapter.decode_stream_chunk(chunk), number=iterations),
+            timeit.timeit(lambda: adapter.extract_usage(response), number=iterations),
+        ]
+        cells = " ".join(f"{t / iterations * 1e6:8.3f}" for t in timings)
+        print(f"  {model_id:42} {cells}")
+
+
+def _sample_result(i: int) -> Dict:
+    """A result shaped and sized like a real optimization"""
+    steps = ["Analysis", "Requirements", "Structure", "Optimization", "Validation"]
+    return {
+        "optimized_prompt": f"You are an expert assistant for request {i}. "
+                            + "Follow these instructions carefully. " * 30,
+        "reasoning_trace": [f"Step {n + 1}: {step} - " + "identified the key intent and constraints. " * 4
+                            for n, step in enumerate(steps)],
+        "model_used": "claude-haiku",
+        "timestamp": "2024-01-01T00:00:00",
+        "cost_estimate": 0.000412
+    }
+
+
+def _fill(cache: Dict, entries: int, set_item) -> float:
+    """Memory in MB held after adding ``entries`` results through ``set_item``"""
+    tracemalloc.start()
+    for i in range(entries):
+        set_item(cache, i)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / 1024 / 1024
+
+
+def bench_cache(entries: int) -> None:
+    logger.disable("cache")  # one log line per set would dominate the timings
+    def set_dict(cache, i):
+        cache[str(i)] = {"result": _sample_result(i), "timestamp": time.time()}
+
+    def set_cache(cache, i):
+        cache.set(f"write prompt {i}", "", "claude-haiku", _sample_result(i))
+
+    unbounded_mb = _fill({}, entries, set_dict)
+    print(f"{entries} results of ~{len(json.dumps(_sample_result(0)))} bytes of JSON each")
+    print(f"  unbounded dict of result dicts:      {unbounded_mb:8.1f} MB")
+
+    for label, cache in [
+        ("PromptCache, uncompressed", PromptCache(max_entries=entries, max_bytes=1 << 40, compress_min_bytes=0)),
+        ("PromptCache, compressed", PromptCache(max_entries=entries, max_bytes=1 << 40)),
+        ("PromptCache, 16 MB budget", PromptCache(max_entries=entries, max_bytes=16 << 20)),
+    ]:
+        used_mb = _fill(cache, entries, set_cache)
+        print(f"  {label + ':':36} {used_mb:8.1f} MB  accounted {cache.bytes / 1024 / 1024:6.1f} MB  "
+              f"{len(cache.cache):>7} entries  {cache.evictions:>7} evicted")
+
+    cache = PromptCache(max_entries=entries, max_bytes=1 << 40)
+    for i in range(entries):
+        set_cache(cache, i)
+    get_us = timeit.timeit(lambda: cache.get("write prompt 7", "", "claude-haiku"), number=10000) / 10000 * 1e6
+    set_us = timeit.timeit(lambda: set_cache(cache, 7), number=10000) / 10000 * 1e6
+    print(f"  compressed get {get_us:.1f}us, set {set_us:.1f}us at {entries} entries")
+
+
+def bench_cache_ops(sizes: List[int]) -> None:
+    logger.disable("cache")
+    small = {"optimized_prompt": "ok", "reasoning_trace": [], "cost_estimate": 0.0}
+    print("Per-call cost by cache size (microseconds)")
+    print(f"  {'entries':>9} {'set':>8} {'get':>8} {'stats':>8}")
+    for size in sizes:
+        cache = PromptCache(max_entries=size, max_bytes=1 << 40)
+        for i in range(size):
+            cache.set(str(i), "", "m", small)
+        # Sets past the limit evict, as they would in a full cache under load
+        counter = iter(range(size, size * 2 + 100000))
+        set_us = timeit.timeit(lambda: cache.set(str(next(counter)), "", "m", small), number=10000) / 10000 * 1e6
+        get_us = timeit.timeit(lambda: cache.get(str(size - 1), "", "m"), number=10000) / 10000 * 1e6
+        stats_us = timeit.timeit(cache.stats, number=1000) / 1000 * 1e6
+        print(f"  {size:>9} {set_us:8.2f} {get_us:8.2f} {stats_us:8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt Tune backend benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    concurrency = subparsers.add_parser("concurrency", help="Concurrent Bedrock call throughput")
+    concurrency.add_argument("--requests", type=int, default=200)
+    concurrency.add_argument("--latency", type=float, default=0.5)
+    concurrency.add_argument("--max-concurrency", type=int, default=256)
+
+    stream = subparsers.add_parser("stream", help="Time to first byte, buffered vs response stream")
+    stream.add_argument("--chunks", type=int, default=50)
+    stream.add_argument("--chunk-latency", type=float, default=0.02)
+
+    adapters = subparsers.add_parser("adapters", help="Model adapter overhead, per family")
+    adapters.add_argument("--iterations", type=int, default=100000)
+
+    cache = subparsers.add_parser("cache", help="PromptCache memory use against an unbounded dict")
+    cache.add_argument("--entries", type=int, default=100000)
+
+    cache_ops = subparsers.add_parser("cache-ops", help="PromptCache set/get/stats cost as the cache grows")
+    cache_ops.add_argument("--sizes", default="100,10000,1000000")
+
+    args = parser.parse_args()
+
+    if args.command == "concurrency":
+        asyncio.run(bench_concurrency(args.requests, args.latency, args.max_concurrency))
+    elif args.command == "stream":
+        asyncio.run(bench_stream(args.chunks, args.chunk_latency))
+    elif args.command == "adapters":
+        bench_adapters(args.iterations)
+    elif args.command == "cache":
+        bench_cache(args.entries)
+    elif args.command == "cache-ops":
+        bench_cache_ops([int(size) for size in args.sizes.split(",")])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Offline bulk prompt optimization over JSONL
+Streams input lines through the backend's Bedrock call path with a bounded number of calls in flight,
+appending results as they finish and checkpointing completed ids so an interrupted run can resume
+
+Usage:
+    python bulk_optimize.py prompts.jsonl results.jsonl --concurrency 8
+    python bulk_optimize.py ../requests.jsonl results.jsonl --id-field request_id --text-field body
+    python bulk_optimize.py prompts.jsonl results.jsonl --endpoint-url http://localhost:4566  # local stub
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+import boto3
+from fastapi import HTTPException
+from loguru import logger
+
+from bedrock_client import BEDROCK_REGION, BedrockInvoker
+from json_stream import parse_optimization_response
+from main import (
+    DEFAULT_MODEL, JSON_STOP_SEQUENCES, MODELS, SYSTEM_PROMPT, PromptRequest, build_user_prompt, call_bedrock_model,
+    prompt_tokens, usage_cost
+)
+from tokens import token_accounting
+
+BULK_MAX_RETRIES = 3
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """Ids already completed by an earlier run"""
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def read_items(path: str, id_field: str, text_field: str, context_field: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield ``(item_id, record)`` per input line without loading the whole file"""
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping line {line_number}: not valid JSON")
+                continue
+            if not record.get(text_field):
+                logger.warning(f"Skipping line {line_number}: no '{text_field}' field")
+                continue
+            item_id = str(record.get(id_field) or f"line-{line_number}")
+            yield item_id, {"description": record[text_field], "context": record.get(context_field) or ""}
+
+
+async def optimize_item(item: Dict[str, Any], model: str, max_tokens: int,
+                        invoker: Optional[BedrockInvoker], max_retries: int = BULK_MAX_RETRIES) -> Dict[str, Any]:
+    """Optimize one prompt, waiting out 429/503 responses that say when to come back"""
+    request = PromptRequest(description=item["description"], context=item["context"], model=model,
+                            max_tokens=max_tokens)
+    model_id = MODELS[model]
+    user_prompt = build_user_prompt(request)
+
+    for attempt in range(max_retries + 1):
+        try:
+            result = await call_bedrock_model(model_id, user_prompt, request.max_tokens, request.temperature,
+                                              invoker, system=SYSTEM_PROMPT, stop_sequences=JSON_STOP_SEQUENCES)
+            break
+        except HTTPException as e:
+            retry_after = (e.headers or {}).get("Retry-After")
+            if retry_after is None or attempt == max_retries:
+                raise
+            await asyncio.sleep(float(retry_after))
+
+    reasoning_trace, optimized_prompt = parse_optimization_response(result["text"])
+    usage = token_accounting.resolve(result["usage"], prompt_tokens(request), result["text"])
+    return {
+        "optimized_prompt": optimized_prompt,
+        "reasoning_trace": reasoning_trace,
+        "model_used": model,
+        "timestamp": datetime.now().isoformat(),
+        "cost_estimate": usage_cost(model_id, usage)
+    }
+
+
+async def run_bulk(input_path: str, output_path: str, checkpoint_path: str, model: str = DEFAULT_MODEL,
+                   concurrency: int = 8, max_tokens: int = 1000, id_field: str = "id",
+                   text_field: str = "description", context_field: str = "context",
+                   invoker: Optional[BedrockInvoker] = None) -> Dict[str, int]:
+    """Optimize every input line not yet in the checkpoint.
+
+    Each result is appended to ``output_path`` and flushed before its id is
+    appended to ``checkpoint_path``, so a crash can at worst repeat the one
+    item caught between the two writes.  Failed items are not checkpointed
+    and are picked up again by the next run.
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown model '{model}', expected one of {', '.join(MODELS)}")
+
+    done = load_checkpoint(checkpoint_path)
+    counts = {"skipped": 0, "succeeded": 0, "failed": 0}
+    in_flight: Set[asyncio.Task] = set()
+
+    with open(output_path, "a") as output, open(checkpoint_path, "a") as checkpoint:
+        async def process(item_id: str, item: Dict[str, Any]) -> None:
+            try:
+                result = await optimize_item(item, model, max_tokens, invoker)
+            except Exception as e:
+                counts["failed"] += 1
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                logger.error(f"Item {item_id} failed: {detail}")
+                return
+            output.write(json.dumps({"id": item_id, **item, **result}) + "\n")
+            output.flush()
+            checkpoint.write(item_id + "\n")
+            checkpoint.flush()
+            done.add(item_id)
+            counts["succeeded"] += 1
+
+        try:
+            for item_id, item in read_items(input_path, id_field, text_field, context_field):
+                if item_id in done:
+                    counts["skipped"] += 1
+                    continue
+                # Read ahead only as far as there is room for another call
+                while len(in_flight) >= concurrency:
+                    _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                in_flight.add(asyncio.ensure_future(process(item_id, item)))
+            if in_flight:
+                await asyncio.wait(in_flight)
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimize prompts from a JSONL file with checkpoint/resume")
+    parser.add_argument("input", help="JSONL file with one prompt request per line")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--checkpoint", help="File of completed ids (default: <output>.checkpoint)")
+    parser.add_argument("--model", default=DEFAULT_MODEL, choices=list(MODELS))
+    parser.add_argument("--concurrency", type=int, default=8, help="Bedrock calls in flight")
+    parser.add_argument("--max-tokens", type=int, default=1000)
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--text-field", default="description")
+    parser.add_argument("--context-field", default="context")
+    parser.add_argument("--endpoint-url", help="Bedrock runtime endpoint, e.g. a local stub")
+    args = parser.parse_args()
+
+    invoker = None
+    if args.endpoint_url:
+        client = boto3.client("bedrock-runtime", region_name=BEDROCK_REGION, endpoint_url=args.endpoint_url)
+        invoker = BedrockInvoker(client=client, max_concurrency=args.concurrency)
+
+    counts = asyncio.run(run_bulk(
+        args.input, args.output, args.checkpoint or f"{args.output}.checkpoint", args.model,
+        args.concurrency, args.max_tokens, args.id_field, args.text_field, args.context_field, invoker
+    ))
+    print(f"Done: {counts['succeeded']} optimized, {counts['skipped']} already done, {counts['failed']} failed")
+    if invoker:
+        invoker.shutdown()
+
+
+if __name__ == "__main__":
+    main()
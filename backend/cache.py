@@ -1,91 +1,463 @@
 """
 Simple in-memory cache for prompt optimization results
+Bounded by entry count and bytes with LRU eviction; large results are stored zlib-compressed
+Expiry is tracked in a min-heap on the monotonic clock and reaped a few entries at a time
+Past its soft TTL an entry may still be served stale, flagged so the caller can refresh it, until its hard TTL
+An optional shared L2 store is read through on L1 misses and written behind on sets
+Keys ignore case, whitespace and edge punctuation; an optional index serves near-duplicate prompts
+Entries can be snapshotted to disk and, after a restart, read back lazily from the mapped snapshot
 """
 
+import asyncio
 import hashlib
+import heapq
+import itertools
 import json
-from datetime import datetime, timedelta
-from typing import Dict, Optional, Any
+import os
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Any, Tuple
 from loguru import logger
 
+from cache_backends import CacheBackend, WriteBehind, l2_from_env
+from cache_snapshot import SnapshotEntry, SnapshotReader, write_snapshot
+from similarity import CACHE_SIMILARITY_ENABLED, NearDuplicateIndex, canonicalize
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", "64"))
+# Results whose JSON is at least this long are compressed; 0 turns compression off
+CACHE_COMPRESS_MIN_BYTES = int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "1024"))
+# Expired entries removed per set, so reaping cost never depends on cache size
+CACHE_REAP_BATCH = int(os.getenv("CACHE_REAP_BATCH", "16"))
+# How long past its TTL an entry can be served stale while it is refreshed; 0 turns this off
+CACHE_STALE_MINUTES = float(os.getenv("CACHE_STALE_MINUTES", "30"))
+# Where to keep the warm-restart snapshot; empty turns snapshots off
+CACHE_SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH", "")
+CACHE_SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("CACHE_SNAPSHOT_INTERVAL_SECONDS", "300"))
+
+# Interpreter memory per entry besides its payload: key string, entry object and the OrderedDict node
+ENTRY_OVERHEAD_BYTES = 320
+
+
+class CacheEntry:
+    __slots__ = ("payload", "compressed", "size", "fresh_until", "expires_at")
+
+    def __init__(self, payload: bytes, compressed: bool, size: int, fresh_until: float, expires_at: float):
+        self.payload = payload
+        self.compressed = compressed
+        self.size = size
+        self.fresh_until = fresh_until
+        self.expires_at = expires_at
+
+
 class PromptCache:
-    def __init__(self, ttl_minutes: int = 60):
-        self.cache: Dict[str, Dict[str, Any]] = {}
-        self.ttl = timedelta(minutes=ttl_minutes)
-    
+    def __init__(self, ttl_minutes: int = 60, max_entries: int = CACHE_MAX_ENTRIES,
+                 max_bytes: int = int(CACHE_MAX_MB * 1024 * 1024),
+                 compress_min_bytes: int = CACHE_COMPRESS_MIN_BYTES, reap_batch: int = CACHE_REAP_BATCH,
+                 l2: Optional[CacheBackend] = None, similar: Optional[NearDuplicateIndex] = None,
+                 stale_minutes: float = CACHE_STALE_MINUTES, snapshot_path: str = CACHE_SNAPSHOT_PATH):
+        # Least recently used first
+        self.cache: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        # (expires_at, key), soonest first; items for replaced or evicted entries are skipped when popped
+        self._expiry: List[Tuple[float, str]] = []
+        self.ttl_seconds = ttl_minutes * 60
+        self.stale_seconds = stale_minutes * 60
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compress_min_bytes = compress_min_bytes
+        self.reap_batch = reap_batch
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.compressed_entries = 0
+        self.bytes_saved_by_compression = 0
+        self.l2 = l2
+        self._l2_writer = WriteBehind(l2) if l2 is not None else None
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.l2_errors = 0
+        # Only entries set in this process are indexed; L2 fills are served by exact key
+        self.similar = similar
+        self.snapshot_path = snapshot_path
+        # Loaded snapshot; entries move into L1 as they are looked up
+        self._snapshot: Optional[SnapshotReader] = None
+        self.snapshot_loaded = 0
+        self.snapshot_hits = 0
+        self.snapshots_saved = 0
+        self.snapshot_errors = 0
+        self.last_snapshot_entries = 0
+        self.last_snapshot_ms = 0.0
+
     def _generate_key(self, description: str, context: str, model: str) -> str:
         """Generate a cache key from prompt parameters"""
-        content = f"{description}|{context}|{model}"
+        content = f"{canonicalize(description)}|{canonicalize(context)}|{model}"
         return hashlib.md5(content.encode()).hexdigest()
-    
+
+    def key(self, description: str, context: str, model: str) -> str:
+        """Public cache key for a request, also used to coalesce identical requests"""
+        return self._generate_key(description, context, model)
+
+    def _encode(self, result: Dict[str, Any]) -> CacheEntry:
+        payload = json.dumps(result, separators=(",", ":")).encode()
+        compressed = False
+        if self.compress_min_bytes and len(payload) >= self.compress_min_bytes:
+            packed = zlib.compress(payload, 6)
+            if len(packed) < len(payload):
+                self.bytes_saved_by_compression += len(payload) - len(packed)
+                payload, compressed = packed, True
+        fresh_until = time.monotonic() + self.ttl_seconds
+        return CacheEntry(payload, compressed, len(payload) + ENTRY_OVERHEAD_BYTES, fresh_until,
+                          fresh_until + self.stale_seconds)
+
+    @staticmethod
+    def _decode(entry: CacheEntry) -> Dict[str, Any]:
+        return json.loads(zlib.decompress(entry.payload) if entry.compressed else entry.payload)
+
+    def _remove(self, key: str) -> None:
+        entry = self.cache.pop(key)
+        self.bytes -= entry.size
+        self.compressed_entries -= entry.compressed
+        if self.similar is not None:
+            self.similar.remove(key)
+
+    def _reap(self, limit: int) -> None:
+        """Remove up to ``limit`` expired entries, soonest expiry first"""
+        now = time.monotonic()
+        heap = self._expiry
+        while limit > 0 and heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            entry = self.cache.get(key)
+            if entry is not None and entry.expires_at == expires_at:
+                self._remove(key)
+                self.expirations += 1
+                limit -= 1
+
+        # Evicted and overwritten entries leave items behind; rebuild once they outnumber the live ones
+        if len(heap) > 2 * len(self.cache) + 64:
+            self._expiry = [(entry.expires_at, key) for key, entry in self.cache.items()]
+            heapq.heapify(self._expiry)
+
+    def _serve(self, key: str, entry: CacheEntry, allow_stale: bool) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """``(result, stale)`` for a live entry; past its soft TTL only with ``allow_stale``"""
+        stale = time.monotonic() >= entry.fresh_until
+        if stale and not allow_stale:
+            return None, False
+        self.cache.move_to_end(key)
+        if stale:
+            self.stale_hits += 1
+            logger.info(f"Serving stale cache entry for key: {key[:8]}...")
+        return self._decode(entry), stale
+
+    def _get_l1(self, key: str, allow_stale: bool) -> Tuple[Optional[Dict[str, Any]], bool]:
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, False
+
+        # Check if expired
+        if time.monotonic() >= entry.expires_at:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            logger.info(f"Cache expired for key: {key[:8]}...")
+            return None, False
+
+        result, stale = self._serve(key, entry, allow_stale)
+        if result is None:
+            self.misses += 1
+        elif not stale:
+            self.hits += 1
+            logger.info(f"Cache hit for key: {key[:8]}...")
+        return result, stale
+
+    def _get_l2(self, key: str) -> Optional[Tuple[bytes, bool, float, float]]:
+        """Blocking L2 lookup; a failing store counts as a miss"""
+        try:
+            found = self.l2.get(key)
+        except Exception as e:
+            self.l2_errors += 1
+            logger.warning(f"Cache {self.l2.name} read failed: {str(e)}")
+            found = None
+        if found is None:
+            self.l2_misses += 1
+        else:
+            self.l2_hits += 1
+        return found
+
+    def _get_snapshot(self, key: str) -> Optional[SnapshotEntry]:
+        if self._snapshot is None:
+            return None
+        found = self._snapshot.take(key)
+        if found is not None:
+            self.snapshot_hits += 1
+        if not len(self._snapshot):
+            self._drop_snapshot()
+        return found
+
+    def _fill(self, key: str, found: SnapshotEntry, allow_stale: bool,
+              source: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Copy an L2 or snapshot entry into L1 with the TTLs it was written with"""
+        payload, compressed, fresh_until, expires_at = found
+        offset = time.monotonic() - time.time()
+        entry = CacheEntry(payload, compressed, len(payload) + ENTRY_OVERHEAD_BYTES, fresh_until + offset,
+                           expires_at + offset)
+        self._store(key, entry)
+        logger.info(f"Cache {source} hit for key: {key[:8]}...")
+        return self._serve(key, entry, allow_stale) if key in self.cache else (self._decode(entry), False)
+
     def get(self, description: str, context: str, model: str) -> Optional[Dict[str, Any]]:
-        """Get cached result if available and not expired"""
+        """Get cached result if available and not expired, reading through to L2 (blocking)"""
+        key = self._generate_key(description, context, model)
+        result, _ = self._get_l1(key, False)
+        if result is not None:
+            return result
+        found = self._get_snapshot(key)
+        if found:
+            result, _ = self._fill(key, found, False, "snapshot")
+            if result is not None:
+                return result
+        found = self._get_l2(key) if self.l2 is not None else None
+        if found:
+            result, _ = self._fill(key, found, False, self.l2.name)
+        return result if result is not None else self._get_similar(description, context, model)
+
+    async def lookup(self, description: str, context: str, model: str,
+                     allow_stale: bool = False) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """``(result, stale)`` for the event loop; the L2 lookup runs on a worker thread.
+
+        With ``allow_stale`` an entry past its TTL but within the stale window
+        is returned with ``stale`` set; the caller is expected to refresh it.
+        """
         key = self._generate_key(description, context, model)
-        
-        if key not in self.cache:
+        result, stale = self._get_l1(key, allow_stale)
+        if result is not None:
+            return result, stale
+        found = self._get_snapshot(key)
+        if found:
+            result, stale = self._fill(key, found, allow_stale, "snapshot")
+            if result is not None:
+                return result, stale
+        found = await asyncio.to_thread(self._get_l2, key) if self.l2 is not None else None
+        if found:
+            result, stale = self._fill(key, found, allow_stale, self.l2.name)
+            if result is not None:
+                return result, stale
+        return self._get_similar(description, context, model), False
+
+    async def get_async(self, description: str, context: str, model: str) -> Optional[Dict[str, Any]]:
+        """``get`` for the event loop"""
+        result, _ = await self.lookup(description, context, model)
+        return result
+
+    def record_refresh(self, succeeded: bool) -> None:
+        """Account a background refresh of a stale entry"""
+        self.refreshes += 1
+        self.refresh_failures += not succeeded
+
+    def _get_similar(self, description: str, context: str, model: str) -> Optional[Dict[str, Any]]:
+        """A live L1 result for a near-duplicate prompt, if similarity lookup is on"""
+        if self.similar is None:
             return None
-        
-        cached_item = self.cache[key]
-        
-        # Check if expired
-        if datetime.now() - cached_item['timestamp'] > self.ttl:
-            del self.cache[key]
-            logger.info(f"Cache expired for key: {key[:8]}...")
+        match = self.similar.query(model, f"{description}\n{context}")
+        entry = self.cache.get(match[0]) if match else None
+        if entry is None or time.monotonic() >= entry.fresh_until:
+            self.similar.record(None)
             return None
-        
-        logger.info(f"Cache hit for key: {key[:8]}...")
-        return cached_item['result']
-    
+
+        key, similarity = match
+        self.similar.record(similarity)
+        self.cache.move_to_end(key)
+        logger.info(f"Cache near hit ({similarity:.2f} similar) for key: {key[:8]}...")
+        return self._decode(entry)
+
     def set(self, description: str, context: str, model: str, result: Dict[str, Any]) -> None:
-        """Cache a result"""
+        """Cache a result, evicting the least recently used entries to stay within budget"""
         key = self._generate_key(description, context, model)
-        
-        self.cache[key] = {
-            'result': result,
-            'timestamp': datetime.now()
-        }
-        
-        logger.info(f"Cached result for key: {key[:8]}...")
-        
-        # Clean up old entries periodically
-        self._cleanup()
-    
-    def _cleanup(self) -> None:
-        """Remove expired entries"""
-        if len(self.cache) < 100:  # Only cleanup when cache gets large
+        entry = self._encode(result)
+        if self._l2_writer is not None:
+            offset = time.time() - time.monotonic()
+            self._l2_writer.put(key, entry.payload, entry.compressed, entry.fresh_until + offset,
+                                entry.expires_at + offset)
+        self._store(key, entry)
+        if key in self.cache:
+            if self.similar is not None:
+                self.similar.add(key, model, f"{description}\n{context}")
+            logger.info(f"Cached result for key: {key[:8]}...")
+
+    def _store(self, key: str, entry: CacheEntry) -> None:
+        if entry.size > self.max_bytes:
+            logger.warning(f"Not caching {entry.size}-byte result for key: {key[:8]}..., over the cache budget")
             return
-        
-        now = datetime.now()
-        expired_keys = [
-            key for key, item in self.cache.items()
-            if now - item['timestamp'] > self.ttl
-        ]
-        
-        for key in expired_keys:
-            del self.cache[key]
-        
-        if expired_keys:
-            logger.info(f"Cleaned up {len(expired_keys)} expired cache entries")
-    
+
+        if key in self.cache:
+            self._remove(key)
+        if self._snapshot is not None:
+            # A newer result supersedes the snapshot's copy
+            self._snapshot.discard(key)
+        self.cache[key] = entry
+        heapq.heappush(self._expiry, (entry.expires_at, key))
+        self.bytes += entry.size
+        self.compressed_entries += entry.compressed
+
+        while len(self.cache) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self.cache)))
+            self.evictions += 1
+        self._reap(self.reap_batch)
+
     def clear(self) -> None:
-        """Clear all cache entries"""
-        self.cache.clear()
+        """Clear all cache entries, in L2 as well"""
+        self._clear_l1()
+        self._clear_l2()
+        logger.info("Cache cleared")
+
+    async def clear_async(self) -> None:
+        """``clear`` for the event loop; waiting out pending writes and clearing L2 run on a worker thread"""
+        self._clear_l1()
+        await asyncio.to_thread(self._clear_l2)
         logger.info("Cache cleared")
-    
+
+    def _clear_l1(self) -> None:
+        self.cache.clear()
+        self._expiry = []
+        self.bytes = 0
+        self.compressed_entries = 0
+        if self.similar is not None:
+            self.similar.clear()
+        self._drop_snapshot()
+
+    def _clear_l2(self) -> None:
+        if self.l2 is not None:
+            self._l2_writer.flush()
+            self.l2.clear()
+
+    def load_snapshot(self) -> int:
+        """Map the snapshot at ``snapshot_path``; entries are copied into L1 only when looked up.
+
+        Entries keep the TTLs they were cached with, so ones that expired
+        while the process was down are never served. Returns the number of
+        live entries found.
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+        self._drop_snapshot()
+        try:
+            self._snapshot = SnapshotReader(self.snapshot_path)
+        except (OSError, ValueError) as e:
+            self.snapshot_errors += 1
+            logger.warning(f"Cache snapshot {self.snapshot_path} not loaded: {str(e)}")
+            return 0
+        self.snapshot_loaded = self._snapshot.loaded
+        logger.info(f"Loaded cache snapshot with {self.snapshot_loaded} live entries from {self.snapshot_path}")
+        return self.snapshot_loaded
+
+    def snapshot_entries(self) -> Iterable[Tuple[str, SnapshotEntry]]:
+        """Live L1 entries, plus snapshot entries not yet looked up, with wall-clock TTLs.
+
+        Which entries is decided on the calling thread without copying any
+        payload; entries from the loaded snapshot are copied out of the
+        mapping only when the result is iterated, so call this on the event
+        loop and iterate it where the snapshot is written.
+        """
+        offset = time.time() - time.monotonic()
+        now = time.monotonic()
+        entries = [(key, (entry.payload, entry.compressed, entry.fresh_until + offset, entry.expires_at + offset))
+                   for key, entry in self.cache.items() if entry.expires_at > now]
+        if self._snapshot is None:
+            return entries
+        return itertools.chain(entries, self._snapshot.entries(exclude=self.cache))
+
+    def save_snapshot(self, entries: Optional[Iterable[Tuple[str, SnapshotEntry]]] = None) -> int:
+        """Write ``entries`` (by default ``snapshot_entries()``) to ``snapshot_path``; blocking"""
+        if not self.snapshot_path:
+            return 0
+        started = time.perf_counter()
+        try:
+            written = write_snapshot(self.snapshot_path, self.snapshot_entries() if entries is None else entries)
+        except (OSError, ValueError) as e:  # ValueError: the loaded snapshot was closed mid-write
+            self.snapshot_errors += 1
+            logger.warning(f"Cache snapshot {self.snapshot_path} not written: {str(e)}")
+            return 0
+        self.snapshots_saved += 1
+        self.last_snapshot_entries = written
+        self.last_snapshot_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Wrote cache snapshot with {written} entries in {self.last_snapshot_ms:.1f}ms")
+        return written
+
+    def _drop_snapshot(self) -> None:
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+
+    def close(self) -> None:
+        """Finish pending L2 writes and release the store and any loaded snapshot"""
+        self._drop_snapshot()
+        if self.l2 is not None:
+            self._l2_writer.close()
+            self.l2.close()
+
     def stats(self) -> Dict[str, Any]:
-        """Get cache statistics"""
-        now = datetime.now()
-        active_entries = sum(
-            1 for item in self.cache.values()
-            if now - item['timestamp'] <= self.ttl
-        )
-        
+        """Get cache statistics from running counters.
+
+        Entries past their TTL count as active until reaped; ``expired_entries``
+        is the number removed for having expired.
+        """
+        self._reap(self.reap_batch)
+        hits = self.hits + self.stale_hits + self.l2_hits + self.snapshot_hits
+        hits += self.similar.near_hits if self.similar is not None else 0
+        lookups = self.hits + self.stale_hits + self.misses
+        tiers = {"l1": {"hits": self.hits, "misses": self.misses}}
+        if self.l2 is not None:
+            tiers["l2"] = {
+                "backend": self.l2.name,
+                "hits": self.l2_hits,
+                "misses": self.l2_misses,
+                "errors": self.l2_errors,
+                "writes": self._l2_writer.writes,
+                "pending_writes": self._l2_writer.pending,
+                "dropped_writes": self._l2_writer.dropped,
+                "write_errors": self._l2_writer.errors
+            }
+        if self.snapshot_path:
+            tiers["snapshot"] = {
+                "path": self.snapshot_path,
+                "loaded": self.snapshot_loaded,
+                "pending": len(self._snapshot) if self._snapshot is not None else 0,
+                "hits": self.snapshot_hits,
+                "saved": self.snapshots_saved,
+                "last_entries": self.last_snapshot_entries,
+                "last_ms": round(self.last_snapshot_ms, 2),
+                "errors": self.snapshot_errors
+            }
+
         return {
             "total_entries": len(self.cache),
-            "active_entries": active_entries,
-            "expired_entries": len(self.cache) - active_entries,
-            "ttl_minutes": self.ttl.total_seconds() / 60
+            "active_entries": len(self.cache),
+            "expired_entries": self.expirations,
+            "ttl_minutes": self.ttl_seconds / 60,
+            "stale_minutes": self.stale_seconds / 60,
+            "stale_hits": self.stale_hits,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "max_entries": self.max_entries,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "compressed_entries": self.compressed_entries,
+            "bytes_saved_by_compression": self.bytes_saved_by_compression,
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "tiers": tiers,
+            "similarity": self.similar.stats() if self.similar is not None else {"enabled": False}
         }
 
 # Global cache instance
-prompt_cache = PromptCache(ttl_minutes=30)  # 30 minute TTL
+prompt_cache = PromptCache(  # 30 minute TTL
+    ttl_minutes=30, l2=l2_from_env(), similar=NearDuplicateIndex() if CACHE_SIMILARITY_ENABLED else None
+)
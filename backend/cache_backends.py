@@ -0,0 +1,225 @@
+"""
+Shared second-level stores for the prompt cache
+Workers and instances pointed at the same store reuse each other's optimizations; values are the L1 payload bytes
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+from loguru import logger
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+CACHE_L2 = os.getenv("CACHE_L2", "").lower()  # "", "sqlite" or "redis"
+CACHE_L2_PATH = os.getenv("CACHE_L2_PATH", "prompt_cache.sqlite3")
+# Only used with CACHE_L2=redis, which needs the optional redis package (see requirements.txt)
+CACHE_L2_URL = os.getenv("CACHE_L2_URL", "redis://localhost:6379/0")
+CACHE_L2_TIMEOUT = float(os.getenv("CACHE_L2_TIMEOUT", "0.05"))
+CACHE_L2_MAX_PENDING_WRITES = int(os.getenv("CACHE_L2_MAX_PENDING_WRITES", "10000"))
+
+# First byte of a stored value: whether the rest is zlib-compressed JSON or plain JSON
+_COMPRESSED = b"z"
+_PLAIN = b"j"
+
+
+def pack(payload: bytes, compressed: bool) -> bytes:
+    return (_COMPRESSED if compressed else _PLAIN) + payload
+
+
+def unpack(value: bytes) -> Tuple[bytes, bool]:
+    return value[1:], value[:1] == _COMPRESSED
+
+
+class CacheBackend:
+    """Base L2 store; expiry times are wall-clock so they mean the same in every process.
+
+    ``fresh_until`` is the soft TTL, after which an entry may only be served
+    stale; ``expires_at`` is the hard TTL, after which it is gone.
+    """
+
+    name = "generic"
+
+    def get(self, key: str) -> Optional[Tuple[bytes, bool, float, float]]:
+        """``(payload, compressed, fresh_until, expires_at)`` for an entry not yet expired, else None"""
+        raise NotImplementedError
+
+    def set(self, key: str, payload: bytes, compressed: bool, fresh_until: float, expires_at: float) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteBackend(CacheBackend):
+    """Single-file store shared by the workers on one host"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = CACHE_L2_PATH, purge_every: int = 1000):
+        self.path = path
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=CACHE_L2_TIMEOUT * 20, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        """Create the table, or migrate one written before entries had a soft TTL"""
+        # Immediate, so workers opening the file together don't both migrate it
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(prompt_cache)")}
+            if columns and "fresh_until" not in columns:
+                # Existing entries get no stale window
+                self._db.execute("ALTER TABLE prompt_cache ADD COLUMN fresh_until REAL NOT NULL DEFAULT 0")
+                self._db.execute("UPDATE prompt_cache SET fresh_until = expires_at")
+                logger.info(f"Migrated L2 cache table in {self.path} to add fresh_until")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS prompt_cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, fresh_until REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS prompt_cache_expiry ON prompt_cache (expires_at)")
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+    def get(self, key: str) -> Optional[Tuple[bytes, bool, float, float]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, fresh_until, expires_at FROM prompt_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        payload, compressed = unpack(row[0])
+        return payload, compressed, row[1], row[2]
+
+    def set(self, key: str, payload: bytes, compressed: bool, fresh_until: float, expires_at: float) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO prompt_cache (key, value, fresh_until, expires_at) VALUES (?, ?, ?, ?)",
+                (key, pack(payload, compressed), fresh_until, expires_at)
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._db.execute("DELETE FROM prompt_cache WHERE expires_at <= ?", (time.time(),))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM prompt_cache")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class RedisBackend(CacheBackend):
+    """Store shared across instances over the Redis protocol.
+
+    ``client`` is anything with redis-py's ``get``/``set``/``delete``/``scan_iter``;
+    without one, a client is created from ``url`` (requires the redis package).
+    """
+
+    name = "redis"
+
+    def __init__(self, client: Optional[Any] = None, url: str = CACHE_L2_URL, prefix: str = "prompt-cache:"):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("CACHE_L2=redis needs the redis package installed")
+            client = redis.Redis.from_url(url, socket_timeout=CACHE_L2_TIMEOUT,
+                                          socket_connect_timeout=CACHE_L2_TIMEOUT)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Tuple[bytes, bool, float, float]]:
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        # Redis expires the key itself; both TTLs travel in the value so other tiers can honor them too
+        fresh_until, expires_at = float(value[:20]), float(value[20:40])
+        payload, compressed = unpack(value[40:])
+        return payload, compressed, fresh_until, expires_at
+
+    def set(self, key: str, payload: bytes, compressed: bool, fresh_until: float, expires_at: float) -> None:
+        ttl_ms = int((expires_at - time.time()) * 1000)
+        if ttl_ms <= 0:
+            return
+        value = f"{fresh_until:<20.6f}{expires_at:<20.6f}".encode() + pack(payload, compressed)
+        self.client.set(self.prefix + key, value, px=ttl_ms)
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+def l2_from_env() -> Optional[CacheBackend]:
+    """The L2 store selected by CACHE_L2, or None for an L1-only cache"""
+    if CACHE_L2 == "sqlite":
+        return SQLiteBackend()
+    if CACHE_L2 == "redis":
+        return RedisBackend()
+    return None
+
+
+class WriteBehind:
+    """Applies L2 writes on a background thread so a slow store never delays a response.
+
+    Writes beyond ``max_pending`` are dropped: the L1 already has the entry,
+    and L2 only loses the chance to share it.
+    """
+
+    def __init__(self, backend: CacheBackend, max_pending: int = CACHE_L2_MAX_PENDING_WRITES):
+        self.backend = backend
+        self.writes = 0
+        self.dropped = 0
+        self.errors = 0
+        self._queue: "queue.Queue[Optional[Tuple[str, bytes, bool, float, float]]]" = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._run, name=f"cache-l2-{backend.name}", daemon=True)
+        self._thread.start()
+
+    def put(self, key: str, payload: bytes, compressed: bool, fresh_until: float, expires_at: float) -> None:
+        try:
+            self._queue.put_nowait((key, payload, compressed, fresh_until, expires_at))
+        except queue.Full:
+            self.dropped += 1
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self.backend.set(*item)
+                self.writes += 1
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Cache {self.backend.name} write failed: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """Block until every queued write has been applied"""
+        self._queue.join()
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=5)
@@ -0,0 +1,112 @@
+"""
+On-disk snapshots of the prompt cache for warm restarts
+A fixed-size index followed by the entry payloads; loading maps the file and copies a payload only when it is asked for
+
+Layout (little-endian):
+    magic, entry count
+    per entry: md5 key (16 bytes), payload offset, payload length, fresh_until, expires_at, compressed flag
+    payloads, back to back
+Times are wall-clock so they survive the restart.
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Container, Dict, Iterable, Optional, Tuple
+
+MAGIC = b"PCSNAP1\n"
+_HEADER = struct.Struct("<8sI")
+_RECORD = struct.Struct("<16sQIddB")
+
+# (payload, compressed, fresh_until, expires_at)
+SnapshotEntry = Tuple[bytes, bool, float, float]
+
+
+def write_snapshot(path: str, entries: Iterable[Tuple[str, SnapshotEntry]]) -> int:
+    """Write ``(key, entry)`` pairs to ``path`` atomically; returns the number written"""
+    now = time.time()
+    live = [(key, entry) for key, entry in entries if entry[3] > now]
+    data_start = _HEADER.size + _RECORD.size * len(live)
+
+    # A private temporary file: workers sharing the path, or an overlapping save, never interleave
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, len(live)))
+            offset = data_start
+            for key, (payload, compressed, fresh_until, expires_at) in live:
+                f.write(_RECORD.pack(bytes.fromhex(key), offset, len(payload), fresh_until, expires_at, compressed))
+                offset += len(payload)
+            for _, (payload, _, _, _) in live:
+                f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        # Readers of the old snapshot keep their mapping of the replaced file
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(live)
+
+
+class SnapshotReader:
+    """Memory-mapped snapshot; only the index is read up front, entries already expired are skipped"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise ValueError(f"{path} is not a cache snapshot")
+        now = time.time()
+        self._index: Dict[str, Tuple[int, int, float, float, bool]] = {}
+        try:
+            magic, count = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError("bad magic")
+            for i in range(count):
+                key, offset, length, fresh_until, expires_at, compressed = _RECORD.unpack_from(
+                    self._map, _HEADER.size + i * _RECORD.size
+                )
+                if offset + length > len(self._map):
+                    raise ValueError("payload past the end of the file")
+                if expires_at > now:
+                    self._index[key.hex()] = (offset, length, fresh_until, expires_at, bool(compressed))
+        except (struct.error, ValueError):  # wrong format or truncated
+            self.close()
+            raise ValueError(f"{path} is not a cache snapshot")
+        self.loaded = len(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def take(self, key: str) -> Optional[SnapshotEntry]:
+        """Copy an entry out of the snapshot and forget it; None if absent or expired since loading"""
+        found = self._index.pop(key, None)
+        if found is None:
+            return None
+        offset, length, fresh_until, expires_at, compressed = found
+        if expires_at <= time.time():
+            return None
+        return bytes(self._map[offset:offset + length]), compressed, fresh_until, expires_at
+
+    def discard(self, key: str) -> None:
+        self._index.pop(key, None)
+
+    def entries(self, exclude: Container[str] = ()) -> Iterable[Tuple[str, SnapshotEntry]]:
+        """Entries not yet taken and not in ``exclude``, for carrying over into the next snapshot.
+
+        Which entries is decided now; their payloads are copied out of the
+        mapping only as the result is iterated, which can be on another thread.
+        """
+        pending = [(key, found) for key, found in self._index.items() if key not in exclude]
+        return ((key, (bytes(self._map[offset:offset + length]), compressed, fresh_until, expires_at))
+                for key, (offset, length, fresh_until, expires_at, compressed) in pending)
+
+    def close(self) -> None:
+        self._index.clear()
+        self._map.close()
+        self._file.close()
@@ -0,0 +1,175 @@
+"""
+Adaptive per-model concurrency limits for Bedrock calls
+AIMD: the limit grows by about one per round of successful calls and halves whenever Bedrock throttles
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+from loguru import logger
+
+from metrics import model_health
+
+LIMITER_INITIAL_LIMIT = int(os.getenv("LIMITER_INITIAL_LIMIT", "20"))
+LIMITER_MIN_LIMIT = int(os.getenv("LIMITER_MIN_LIMIT", "1"))
+LIMITER_MAX_LIMIT = int(os.getenv("LIMITER_MAX_LIMIT", "200"))
+LIMITER_MAX_QUEUE = int(os.getenv("LIMITER_MAX_QUEUE", "100"))
+LIMITER_MAX_WAIT_MS = float(os.getenv("LIMITER_MAX_WAIT_MS", "2000"))
+LIMITER_BACKOFF = 0.5
+# Throttles within one typical call duration count as a single congestion signal;
+# this is the window used before any call latency has been observed
+LIMITER_BACKOFF_COOLDOWN_MS = float(os.getenv("LIMITER_BACKOFF_COOLDOWN_MS", "1000"))
+# Suggested client back-off, in seconds, when a call is rejected or throttled
+RETRY_AFTER_SECONDS = max(1, math.ceil(LIMITER_MAX_WAIT_MS / 1000))
+
+# Outcomes reported back to the limiter when a call finishes
+SUCCESS = "success"
+THROTTLED = "throttled"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class LimitExceeded(Exception):
+    """Raised when a call can't get a concurrency slot within the allowed wait"""
+
+    def __init__(self, model_id: str, retry_after: int = RETRY_AFTER_SECONDS):
+        super().__init__(f"Too many concurrent requests for {model_id}, retry after {retry_after}s")
+        self.model_id = model_id
+        self.retry_after = retry_after
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """True for Bedrock ThrottlingException, including the response-stream variant"""
+    response = getattr(error, "response", None) or {}
+    code = response.get("Error", {}).get("Code", "")
+    return code.lower() in ("throttlingexception", "toomanyrequestsexception")
+
+
+class AdaptiveLimiter:
+    """Learns the sustainable number of in-flight calls for one model id"""
+
+    def __init__(self, model_id: str, initial_limit: int = LIMITER_INITIAL_LIMIT,
+                 min_limit: int = LIMITER_MIN_LIMIT, max_limit: int = LIMITER_MAX_LIMIT,
+                 max_queue: int = LIMITER_MAX_QUEUE, max_wait_ms: float = LIMITER_MAX_WAIT_MS):
+        self.model_id = model_id
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait_ms / 1000
+        self.in_flight = 0
+        self._last_backoff = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.accepted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.throttled = 0
+
+    def _has_slot(self) -> bool:
+        return self.in_flight < max(self.min_limit, int(self.limit))
+
+    def _reject(self) -> LimitExceeded:
+        self.rejected += 1
+        return LimitExceeded(self.model_id, max(1, math.ceil(self.max_wait)))
+
+    def has_room(self) -> bool:
+        """Whether ``acquire`` would take or queue a call rather than turn it away"""
+        return self._has_slot() or len(self._waiters) < self.max_queue
+
+    def check_admission(self) -> None:
+        """Raise LimitExceeded now if ``acquire`` would turn a call away without queueing it"""
+        if not self.has_room():
+            raise self._reject()
+
+    async def acquire(self) -> None:
+        """Take a slot, queueing for at most ``max_wait`` seconds"""
+        if self._has_slot() and not self._waiters:
+            self.in_flight += 1
+            self.accepted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject()
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            self._discard(future)
+            raise self._reject()
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled
+                self.release(CANCELLED)
+            else:
+                self._discard(future)
+            raise
+        self.accepted += 1
+
+    def release(self, outcome: str) -> None:
+        """Return a slot and adjust the limit according to the call's outcome"""
+        self.in_flight -= 1
+        if outcome == THROTTLED:
+            self.throttled += 1
+            now = time.monotonic()
+            latency = model_health[self.model_id].latency_ms
+            cooldown_ms = latency.percentile(50) if latency.samples else LIMITER_BACKOFF_COOLDOWN_MS
+            if (now - self._last_backoff) * 1000 >= cooldown_ms:
+                self._last_backoff = now
+                self.limit = max(float(self.min_limit), self.limit * LIMITER_BACKOFF)
+                logger.warning(f"Bedrock throttled {self.model_id}, concurrency limit now {int(self.limit)}")
+        elif outcome == SUCCESS and self.in_flight + 1 >= self.limit / 2:
+            # Only grow while the limit is actually being used
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+        self._wake()
+
+    def _discard(self, future: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+
+    def _wake(self) -> None:
+        while self._waiters and self._has_slot():
+            future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "accepted": self.accepted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "throttled": self.throttled
+        }
+
+
+class ModelLimiters:
+    """One adaptive limiter per Bedrock model id"""
+
+    def __init__(self):
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+
+    def get(self, model_id: str) -> AdaptiveLimiter:
+        limiter = self._limiters.get(model_id)
+        if limiter is None:
+            limiter = self._limiters[model_id] = AdaptiveLimiter(model_id)
+        return limiter
+
+    def stats(self) -> Dict[str, Any]:
+        return {model_id: limiter.stats() for model_id, limiter in self._limiters.items()}
+
+
+# Global limiters
+model_limiters = ModelLimiters()
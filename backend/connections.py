@@ -0,0 +1,104 @@
+"""
+Connection management for the AWS clients
+Tuned botocore pools, startup warm-up so the first request skips the TLS handshake, and pool usage stats
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Callable, Dict
+
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from loguru import logger
+
+AWS_CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", "3"))
+AWS_TCP_KEEPALIVE = os.getenv("AWS_TCP_KEEPALIVE", "true").lower() == "true"
+BEDROCK_READ_TIMEOUT = float(os.getenv("BEDROCK_READ_TIMEOUT", "120"))
+DYNAMODB_READ_TIMEOUT = float(os.getenv("DYNAMODB_READ_TIMEOUT", "5"))
+DYNAMODB_MAX_POOL_CONNECTIONS = int(os.getenv("DYNAMODB_MAX_POOL_CONNECTIONS", "50"))
+CONNECTION_WARMUP = os.getenv("CONNECTION_WARMUP", "true").lower() == "true"
+CONNECTION_WARM_COUNT = int(os.getenv("CONNECTION_WARM_COUNT", "4"))
+CONNECTION_WARM_TIMEOUT = float(os.getenv("CONNECTION_WARM_TIMEOUT", "10"))
+
+
+def client_config(max_pool_connections: int, read_timeout: float, max_attempts: int = 3) -> Config:
+    """botocore config with an explicit pool size, timeouts and TCP keepalive.
+
+    ``max_attempts`` counts the first call; Bedrock clients pass 1 because
+    retries are done by the resilience layer, which sees every failure.
+    """
+    return Config(
+        max_pool_connections=max_pool_connections,
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=read_timeout,
+        tcp_keepalive=AWS_TCP_KEEPALIVE,
+        retries={"total_max_attempts": max_attempts, "mode": "standard"}
+    )
+
+
+async def warm_connections(name: str, call: Callable[[], Any], count: int = CONNECTION_WARM_COUNT) -> Dict[str, Any]:
+    """Open ``count`` pooled connections by running ``call`` that many times at once.
+
+    An error response from AWS still leaves a warm connection behind, so
+    ClientError counts as success; anything else is logged and startup
+    carries on with a cold pool.
+    """
+    def warm_one() -> None:
+        try:
+            call()
+        except ClientError:
+            pass
+
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(*[loop.run_in_executor(None, warm_one) for _ in range(count)]),
+            CONNECTION_WARM_TIMEOUT
+        )
+    except Exception as e:
+        logger.warning(f"Could not warm {name} connections: {str(e)}")
+        return {"warmed": 0, "ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Warmed {count} {name} connections in {elapsed_ms:.0f}ms")
+    return {"warmed": count, "ms": round(elapsed_ms, 1)}
+
+
+def pool_stats(client: Any) -> Dict[str, Any]:
+    """In-use, idle and opened connections across a botocore client's urllib3 pools.
+
+    This reads private botocore and urllib3 attributes, so if a release
+    changes them the stats are left out rather than failing the caller.
+    """
+    session = getattr(getattr(client, "_endpoint", None), "http_session", None)
+    manager = getattr(session, "_manager", None)
+    max_size = getattr(session, "_max_pool_connections", None)
+    if manager is None or not max_size:
+        return {}
+
+    in_use = idle = opened = requests = 0
+    try:
+        for key in manager.pools.keys():
+            pool = manager.pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            # The pool queue holds idle connections plus None placeholders for unopened slots
+            available = pool.pool.qsize()
+            in_use += max(0, max_size - available)
+            idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+            opened += pool.num_connections
+            requests += pool.num_requests
+    except (AttributeError, TypeError) as e:
+        logger.debug(f"Connection pool stats unavailable: {str(e)}")
+        return {}
+
+    return {
+        "max_pool_connections": max_size,
+        "in_use": in_use,
+        "idle": idle,
+        "opened": opened,
+        "requests": requests,
+        "saturation": round(in_use / max_size, 4)
+    }
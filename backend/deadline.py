@@ -0,0 +1,137 @@
+"""
+Per-request deadlines and cancellation accounting
+A request's time budget travels in a context variable, so every step it awaits can give up once the budget is spent
+"""
+
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+REQUEST_TIMEOUT_MS = int(os.getenv("REQUEST_TIMEOUT_MS", "60000"))
+MAX_REQUEST_TIMEOUT_MS = int(os.getenv("MAX_REQUEST_TIMEOUT_MS", "300000"))
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.25"))
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time; ``stage`` is the step it was in"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Request deadline exceeded during {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """Absolute expiry on the monotonic clock, plus the stage the request has reached"""
+
+    def __init__(self, timeout_ms: int):
+        self.timeout_ms = timeout_ms
+        self.expires_at = time.monotonic() + timeout_ms / 1000
+        self.stage = "start"
+
+    def remaining(self) -> float:
+        """Seconds left, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+
+class CancellationStats:
+    """Work given up on, by the stage it was in when the client left or time ran out"""
+
+    def __init__(self):
+        self.cancelled: Dict[str, int] = {}
+        self.expired: Dict[str, int] = {}
+
+    def record_cancelled(self, stage: str) -> None:
+        self.cancelled[stage] = self.cancelled.get(stage, 0) + 1
+
+    def record_expired(self, stage: str) -> None:
+        self.expired[stage] = self.expired.get(stage, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "default_timeout_ms": REQUEST_TIMEOUT_MS,
+            "cancelled": sum(self.cancelled.values()),
+            "cancelled_by_stage": dict(self.cancelled),
+            "expired": sum(self.expired.values()),
+            "expired_by_stage": dict(self.expired)
+        }
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+def request_deadline(timeout_ms: Optional[int] = None) -> Deadline:
+    """Deadline for a new request; ``timeout_ms`` is the client's budget, capped at MAX_REQUEST_TIMEOUT_MS"""
+    return Deadline(max(1, min(timeout_ms or REQUEST_TIMEOUT_MS, MAX_REQUEST_TIMEOUT_MS)))
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline) -> Iterator[Deadline]:
+    """Make ``deadline`` the current one for the enclosed code and the tasks it starts"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def start_with_deadline(deadline: Optional[Deadline], fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+    """Run ``fn`` on a new task that sees ``deadline`` as the current one; None detaches it from any deadline"""
+    context = copy_context()
+    context.run(_current_deadline.set, deadline)
+
+    async def run() -> Any:
+        return await fn()
+
+    # A task copies the context current when it is created (create_task's context= is 3.11+)
+    return context.run(asyncio.ensure_future, run())
+
+
+def enter_stage(stage: str) -> None:
+    """Note that the current request has reached ``stage``; raises DeadlineExceeded if it is already out of time"""
+    deadline = current_deadline()
+    if deadline is None:
+        return
+    deadline.stage = stage
+    if deadline.expired:
+        cancellation_stats.record_expired(stage)
+        raise DeadlineExceeded(stage)
+
+
+def fits_deadline(seconds: float) -> bool:
+    """True if the current request can still afford to wait ``seconds``"""
+    deadline = current_deadline()
+    return deadline is None or deadline.remaining() > seconds
+
+
+async def within_deadline(stage: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """Await ``fn()`` as ``stage``, cancelling it when the current deadline passes"""
+    enter_stage(stage)
+    deadline = current_deadline()
+    if deadline is None:
+        return await fn()
+    try:
+        return await asyncio.wait_for(fn(), deadline.remaining())
+    except asyncio.TimeoutError:
+        cancellation_stats.record_expired(stage)
+        raise DeadlineExceeded(stage) from None
+
+
+async def wait_for_disconnect(is_disconnected: Callable[[], Awaitable[bool]]) -> None:
+    """Return once ``is_disconnected`` reports the client has gone away"""
+    while not await is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+# Global cancellation accounting
+cancellation_stats = CancellationStats()
@@ -0,0 +1,100 @@
+"""
+Hedged requests for Bedrock calls
+If the primary call is slower than its usual tail latency, a backup call is raced against it
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from loguru import logger
+
+from metrics import model_health
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY_MS = float(os.getenv("HEDGE_DEFAULT_DELAY_MS", "3000"))
+HEDGE_BACKUP_MODEL = os.getenv("HEDGE_BACKUP_MODEL", "")  # alias from MODELS, empty for the same model
+HEDGE_BACKUP_REGION = os.getenv("HEDGE_BACKUP_REGION", "")  # empty for the primary region
+
+
+class HedgePolicy:
+    """Decides when to hedge and races the primary call against the backup"""
+
+    def __init__(self, enabled: bool = HEDGE_ENABLED, percentile: float = HEDGE_PERCENTILE,
+                 min_samples: int = HEDGE_MIN_SAMPLES, default_delay_ms: float = HEDGE_DEFAULT_DELAY_MS):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay_ms = default_delay_ms
+        self.requests = 0
+        self.hedged = 0
+        self.backup_wins = 0
+        self.wasted_spend = 0.0
+
+    def delay_seconds(self, model_id: str) -> float:
+        """How long to wait on the primary before sending the backup"""
+        latency = model_health[model_id].latency_ms
+        if len(latency.samples) < self.min_samples:
+            return self.default_delay_ms / 1000
+        return latency.percentile(self.percentile) / 1000
+
+    async def race(self, primary: Callable[[], Awaitable[Any]], backup: Callable[[], Awaitable[Any]],
+                   delay: float) -> Tuple[Any, bool, bool]:
+        """Run ``primary``, adding ``backup`` once ``delay`` seconds pass without a result.
+
+        Returns ``(result, hedged, backup_won)``.  The losing call is cancelled.
+        A leg that fails does not end the race while the other is still running,
+        and a primary that fails before ``delay`` sends the backup right away.
+        """
+        self.requests += 1
+        primary_task = asyncio.ensure_future(primary())
+        tasks = [primary_task]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done and primary_task.exception() is None:
+                return primary_task.result(), False, False
+
+            self.hedged += 1
+            if done:
+                logger.info(f"Hedging at once after the primary failed: {str(primary_task.exception())}")
+            else:
+                logger.info(f"Hedging after {delay * 1000:.0f}ms without a primary response")
+            backup_task = asyncio.ensure_future(backup())
+            tasks.append(backup_task)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        backup_won = task is backup_task
+                        if backup_won:
+                            self.backup_wins += 1
+                        return task.result(), True, backup_won
+            # Both legs failed; report the primary's error
+            return primary_task.result(), True, False
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def record_waste(self, cost: float) -> None:
+        """Account the spend of a cancelled losing call"""
+        self.wasted_spend += cost
+
+    def stats(self) -> Dict[str, Any]:
+        """Get hedging statistics"""
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.requests, 4) if self.requests else 0.0,
+            "backup_wins": self.backup_wins,
+            "wasted_spend": round(self.wasted_spend, 6)
+        }
+
+
+# Global hedging policy
+hedge_policy = HedgePolicy()
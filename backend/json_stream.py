@@ -0,0 +1,305 @@
+"""
+Incremental extraction of the optimization JSON while the model is still generating
+
+SYSTEM_PROMPT asks for {"reasoning_trace": [...], "optimized_prompt": "..."}.
+OptimizationStreamParser consumes the raw text in whatever pieces the model
+stream delivers and reports each reasoning step as soon as its closing quote
+arrives, followed by optimized_prompt in chunks.  It is deliberately tolerant:
+prose or code fences around the object, raw newlines inside strings, unescaped
+quotes and truncated output all degrade to a best-effort result instead of an
+error, and nothing is ever re-parsed from the start.
+"""
+
+import json
+from typing import Dict, List, Optional, Tuple
+
+REASONING_KEY = "reasoning_trace"
+PROMPT_KEY = "optimized_prompt"
+FALLBACK_REASONING = "Model response was not in expected JSON format"
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_WHITESPACE = " \t\r\n"
+
+# Parser states
+_SEEK = "seek"                  # before the opening brace
+_OBJECT = "object"              # between members of the top-level object
+_KEY = "key"                    # inside a member name
+_COLON = "colon"                # after a member name
+_VALUE = "value"                # before a member value
+_ARRAY = "array"                # inside reasoning_trace
+_STRING = "string"              # inside a reasoning step or optimized_prompt
+_SKIP = "skip"                  # inside a value we don't care about
+_DONE = "done"                  # after the closing brace
+
+
+class _StringDecoder:
+    """Decodes a JSON string body one character at a time, across feeds"""
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.escape: Optional[str] = None  # pending escape sequence, without the backslash
+        self.high_surrogate: Optional[int] = None
+
+    def push(self, char: str) -> bool:
+        """Consume one character; return True if it was an unescaped quote"""
+        if self.escape is not None:
+            self.escape += char
+            if self.escape[0] == 'u':
+                if len(self.escape) == 5:
+                    self._push_codepoint(self.escape[1:])
+                    self.escape = None
+            else:
+                self.parts.append(_ESCAPES.get(self.escape, self.escape))
+                self.escape = None
+            return False
+        if char == '\\':
+            self.escape = ''
+            return False
+        if char == '"':
+            return True
+        self.parts.append(char)
+        return False
+
+    def _push_codepoint(self, digits: str) -> None:
+        try:
+            code = int(digits, 16)
+        except ValueError:
+            self.parts.append('\\u' + digits)
+            return
+        if 0xD800 <= code < 0xDC00:
+            self.high_surrogate = code
+            return
+        if 0xDC00 <= code < 0xE000 and self.high_surrogate is not None:
+            code = 0x10000 + ((self.high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+        self.high_surrogate = None
+        self.parts.append(chr(code))
+
+    def take(self) -> str:
+        """Return and forget the characters decoded since the last take"""
+        text = ''.join(self.parts)
+        self.parts = []
+        return text
+
+
+class OptimizationStreamParser:
+    """Streaming, tolerant parser for the optimization response object.
+
+    ``feed`` returns a list of events ready to be forwarded to the client:
+    ``{"type": "reasoning", "step": n, "content": ...}`` per completed step
+    and ``{"type": "prompt", "content": ...}`` per fed piece of
+    optimized_prompt.  ``close`` returns the final reasoning trace and prompt.
+    """
+
+    def __init__(self):
+        self.state = _SEEK
+        self.key = ""
+        self.reasoning_trace: List[str] = []
+        self.prompt_parts: List[str] = []
+        self._trailing_parts: List[str] = []
+        self._decoder = _StringDecoder()
+        self._string_target: Optional[str] = None  # REASONING_KEY or PROMPT_KEY
+        self._pending_quote: Optional[str] = None  # whitespace seen after a tentative closing quote
+        self._skip_depth = 0
+        self._skip_in_string = False
+        self._skip_escape = False
+        self._skip_return = _OBJECT
+        self._found_member = False
+        self._raw_parts: List[str] = []  # only kept until a known member shows up
+
+    @property
+    def complete(self) -> bool:
+        """True once the top-level object has been closed"""
+        return self.state == _DONE
+
+    @property
+    def trailing(self) -> str:
+        """Whatever the model wrote after the closing brace"""
+        return ''.join(self._trailing_parts)
+
+    @property
+    def optimized_prompt(self) -> str:
+        return ''.join(self.prompt_parts)
+
+    def feed(self, text: str) -> List[Dict]:
+        events: List[Dict] = []
+        if not self._found_member:
+            self._raw_parts.append(text)
+        for char in text:
+            self._step(char, events)
+        if self._found_member:
+            self._raw_parts = []
+        if self.state == _STRING and self._string_target == PROMPT_KEY:
+            self._flush_prompt(events)
+        return events
+
+    def close(self) -> Tuple[List[str], str]:
+        """Finish parsing and return ``(reasoning_trace, optimized_prompt)``.
+
+        A string cut off by the end of the output is kept as far as it got.
+        If no usable member was found at all, the raw text is returned as the
+        prompt with the legacy fallback reasoning message.
+        """
+        if self.state == _STRING:
+            self._close_string([])
+        if not self._found_member:
+            return [FALLBACK_REASONING], ''.join(self._raw_parts)
+        return list(self.reasoning_trace), self.optimized_prompt
+
+    def _step(self, char: str, events: List[Dict]) -> None:
+        state = self.state
+
+        if state == _SEEK:
+            if char == '{':
+                self.state = _OBJECT
+            return
+
+        if state == _DONE:
+            self._trailing_parts.append(char)
+            return
+
+        if state == _OBJECT:
+            if char == '"':
+                self.key = ""
+                self._decoder = _StringDecoder()
+                self.state = _KEY
+            elif char == '}':
+                self.state = _DONE
+            # Commas, whitespace and stray characters between members are ignored
+            return
+
+        if state == _KEY:
+            if self._decoder.push(char):
+                self.key = self._decoder.take()
+                self.state = _COLON
+            return
+
+        if state == _COLON:
+            if char == ':':
+                self.state = _VALUE
+            elif char not in _WHITESPACE:
+                # Missing colon: treat this character as the start of the value
+                self.state = _VALUE
+                self._step(char, events)
+            return
+
+        if state == _VALUE:
+            if char in _WHITESPACE:
+                return
+            if self.key == REASONING_KEY and char == '[':
+                self._found_member = True
+                self.state = _ARRAY
+            elif self.key == PROMPT_KEY and char == '"':
+                self._found_member = True
+                self._open_string(PROMPT_KEY)
+            else:
+                self._start_skip(char, _OBJECT)
+            return
+
+        if state == _ARRAY:
+            if char == '"':
+                self._open_string(REASONING_KEY)
+            elif char == ']':
+                self.state = _OBJECT
+            elif char == '}':
+                # Missing ']': the object is closing around the array
+                self.state = _OBJECT
+                self._step(char, events)
+            elif char not in _WHITESPACE and char != ',':
+                self._start_skip(char, _ARRAY)
+            return
+
+        if state == _STRING:
+            self._step_string(char, events)
+            return
+
+        if state == _SKIP:
+            self._step_skip(char)
+
+    def _open_string(self, target: str) -> None:
+        self._decoder = _StringDecoder()
+        self._string_target = target
+        self._pending_quote = None
+        self.state = _STRING
+
+    def _step_string(self, char: str, events: List[Dict]) -> None:
+        closers = ',}' if self._string_target == PROMPT_KEY else ',]}'
+        if self._pending_quote is not None:
+            # A quote followed by a closer ends the string; anything else means
+            # the model forgot to escape it, so it belongs to the content.
+            if char in _WHITESPACE:
+                self._pending_quote += char
+                return
+            if char in closers:
+                self._close_string(events)
+                self._step(char, events)
+                return
+            self._decoder.parts.append('"' + self._pending_quote)
+            self._pending_quote = None
+        if self._decoder.push(char):
+            self._pending_quote = ""
+
+    def _close_string(self, events: List[Dict]) -> None:
+        self._pending_quote = None
+        if self._string_target == REASONING_KEY:
+            step = self._decoder.take()
+            self.reasoning_trace.append(step)
+            events.append({'type': 'reasoning', 'step': len(self.reasoning_trace), 'content': step})
+            self.state = _ARRAY
+        else:
+            self._flush_prompt(events)
+            self.state = _OBJECT
+        self._string_target = None
+
+    def _flush_prompt(self, events: List[Dict]) -> None:
+        chunk = self._decoder.take()
+        if chunk:
+            self.prompt_parts.append(chunk)
+            events.append({'type': 'prompt', 'content': chunk})
+
+    def _start_skip(self, char: str, return_state: str) -> None:
+        self.state = _SKIP
+        self._skip_return = return_state
+        self._skip_depth = 0
+        self._skip_in_string = False
+        self._skip_escape = False
+        self._step_skip(char)
+
+    def _step_skip(self, char: str) -> None:
+        if self._skip_in_string:
+            if self._skip_escape:
+                self._skip_escape = False
+            elif char == '\\':
+                self._skip_escape = True
+            elif char == '"':
+                self._skip_in_string = False
+                if self._skip_depth == 0:
+                    self.state = self._skip_return
+            return
+        if char == '"':
+            self._skip_in_string = True
+        elif char in '{[':
+            self._skip_depth += 1
+        elif char in '}]':
+            if self._skip_depth == 0:
+                # End of a scalar value: the bracket belongs to the enclosing container
+                self.state = self._skip_return
+                self._step(char, [])
+                return
+            self._skip_depth -= 1
+            if self._skip_depth == 0:
+                self.state = self._skip_return
+        elif char == ',' and self._skip_depth == 0:
+            self.state = self._skip_return
+
+
+def parse_optimization_response(text: str) -> Tuple[List[str], str]:
+    """Parse a complete model response into ``(reasoning_trace, optimized_prompt)``"""
+    try:
+        parsed = json.loads(text)
+        if isinstance(parsed, dict):
+            return parsed.get(REASONING_KEY, []), parsed.get(PROMPT_KEY, "")
+    except json.JSONDecodeError:
+        pass
+    parser = OptimizationStreamParser()
+    parser.feed(text)
+    return parser.close()
@@ -5,19 +5,47 @@ Cost-effective prompt optimization using Amazon Bedrock
 
 import json
 import os
-from typing import Dict, List, Optional, AsyncGenerator
+import time
+from typing import Callable, Dict, List, Optional, AsyncGenerator, Tuple
 from datetime import datetime
 import asyncio
+import random
 
 import boto3
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from loguru import logger
 import httpx
 
-from cache import prompt_cache
+from bedrock_client import BedrockInvoker
+from cache import CACHE_SNAPSHOT_INTERVAL_SECONDS, prompt_cache
+from connections import (
+    CONNECTION_WARMUP, DYNAMODB_MAX_POOL_CONNECTIONS, DYNAMODB_READ_TIMEOUT, client_config, pool_stats,
+    warm_connections
+)
+from concurrency import (
+    CANCELLED, FAILED, RETRY_AFTER_SECONDS, SUCCESS, THROTTLED, LimitExceeded, is_throttling_error, model_limiters
+)
+from deadline import (
+    Deadline, DeadlineExceeded, cancellation_stats, deadline_scope, enter_stage, request_deadline,
+    start_with_deadline, wait_for_disconnect, within_deadline
+)
+from hedging import HEDGE_BACKUP_MODEL, HEDGE_BACKUP_REGION, hedge_policy
+from json_stream import OptimizationStreamParser, parse_optimization_response
+from metrics import (
+    generation_stop_stats, model_health, prompt_caching_stats, stream_draft_ms, stream_total_ms, stream_ttfb_ms
+)
+from model_adapters import ModelAdapter, get_adapter, supports_prompt_cache
+from resilience import (
+    BREAKER_COOLDOWN_SECONDS, CircuitOpenError, is_retryable_error, model_breakers, resilient_call, resilient_stream
+)
+from router import AUTO_MODEL, ModelRouter
+from rule_optimizer import rule_based_optimization, rule_optimizer
+from singleflight import optimization_flights
+from sizing import token_budgets
+from tokens import count_static_tokens, count_tokens, token_accounting
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -36,8 +64,24 @@ app.add_middleware(
 )
 
 # AWS clients
-bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1')
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+bedrock_invoker = BedrockInvoker()
+bedrock_runtime = bedrock_invoker.client
+# Hedged calls can go to another region for independent capacity
+backup_invoker = BedrockInvoker(region_name=HEDGE_BACKUP_REGION) if HEDGE_BACKUP_REGION else bedrock_invoker
+dynamodb = boto3.resource(
+    'dynamodb',
+    region_name='us-east-1',
+    config=client_config(DYNAMODB_MAX_POOL_CONNECTIONS, DYNAMODB_READ_TIMEOUT)
+)
+connection_warmup: Dict[str, Dict] = {}
+# Cache key -> refresh of its stale entry in progress; also keeps the task from being garbage collected
+background_refreshes: Dict[str, asyncio.Task] = {}
+# Connection warm-up started at startup; requests are served while it runs
+warmup_task: Optional[asyncio.Task] = None
+# Periodic cache snapshot, when CACHE_SNAPSHOT_PATH is set
+snapshot_task: Optional[asyncio.Task] = None
+# Its write in progress on a worker thread; the shutdown snapshot waits for it so the newer one lands last
+snapshot_write: Optional[asyncio.Future] = None
 
 # Configuration
 MODELS = {
@@ -46,7 +90,23 @@ MODELS = {
 }
 
 DEFAULT_MODEL = "claude-haiku"
+RULE_BASED_MODEL = "rule-based"
 PROMPT_TABLE_NAME = "prompt-tune-library"
+# Prompt caching bills cache reads at 10% and cache writes at 125% of the input token price
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+PROMPT_CACHE_READ_DISCOUNT = 0.9
+PROMPT_CACHE_WRITE_PREMIUM = 0.25
+# The answer is a top-level JSON object, so a closing brace at the start of a line ends it
+JSON_STOP_SEQUENCES = ["\n}"]
+# Share of calls sent without stop sequences, to keep measuring the commentary they cut off
+STOP_SEQUENCE_CONTROL_RATE = float(os.getenv("STOP_SEQUENCE_CONTROL_RATE", "0.05"))
+PROMPT_ONLY_VARIANT = "prompt-only"
+# Cache "model" under which a prompt-only result's request is kept, keyed by its reasoning id
+REASONING_CONTEXT = "reasoning-context"
+# Rule-based draft sent on /optimize while the model call is in progress
+DRAFT_ENABLED = os.getenv("DRAFT_ENABLED", "true").lower() == "true"
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
 
 # Pydantic models
 class PromptRequest(BaseModel):
@@ -55,6 +115,8 @@ class PromptRequest(BaseModel):
     model: Optional[str] = DEFAULT_MODEL
     max_tokens: Optional[int] = 1000
     temperature: Optional[float] = 0.7
+    include_reasoning: Optional[bool] = True
+    timeout_ms: Optional[int] = None
 
 class PromptResponse(BaseModel):
     optimized_prompt: str
@@ -62,12 +124,18 @@ class PromptResponse(BaseModel):
     model_used: str
     timestamp: datetime
     cost_estimate: float
+    reasoning_id: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    requests: List[PromptRequest]
+    max_concurrency: Optional[int] = None
 
 class SavePromptRequest(BaseModel):
     name: str
     description: str
     optimized_prompt: str
     tags: Optional[List[str]] = []
+    timeout_ms: Optional[int] = None
 
 class PromptLibraryItem(BaseModel):
     id: str
@@ -103,91 +171,252 @@ Format your response as JSON:
     "optimized_prompt": "[your final optimized prompt]"
 }"""
 
-async def call_bedrock_model(model_id: str, prompt: str, max_tokens: int = 1000, temperature: float = 0.7) -> Dict:
-    """Call Bedrock model with streaming support"""
+# Used when the caller doesn't want the reasoning trace; the reasoning can be fetched later
+PROMPT_ONLY_SYSTEM_PROMPT = """You are an expert prompt engineer. Your task is to optimize prompts for maximum effectiveness.
+
+When given a user's description of what they want to achieve, analyze their intent, apply prompt engineering best practices (clarity, specificity, examples, role-playing, step-by-step instructions) and optimize for the use case. Do not explain your reasoning.
+
+Format your response as JSON:
+{
+    "optimized_prompt": "[your final optimized prompt]"
+}"""
+
+# Explains an optimization that was produced without its reasoning trace
+REASONING_SYSTEM_PROMPT = """You are an expert prompt engineer. You optimized a user's prompt; now explain the reasoning behind the optimized prompt step by step.
+
+Format your response as JSON:
+{
+    "reasoning_trace": [
+        "Step 1: Analysis - [your analysis]",
+        "Step 2: Requirements - [key requirements identified]", 
+        "Step 3: Structure - [how you structured the prompt]",
+        "Step 4: Optimization - [specific optimizations made]",
+        "Step 5: Validation - [final checks and improvements]"
+    ]
+}"""
+
+def model_call_error(model_id: str, error: Exception) -> HTTPException:
+    """Map a failed Bedrock call to the HTTP error returned to the client"""
+    if isinstance(error, HTTPException):
+        return error
+    if isinstance(error, LimitExceeded):
+        return HTTPException(status_code=429, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+    if isinstance(error, CircuitOpenError):
+        return HTTPException(status_code=503, detail=str(error),
+                             headers={"Retry-After": str(int(BREAKER_COOLDOWN_SECONDS))})
+    if is_throttling_error(error):
+        return HTTPException(status_code=429, detail=f"Model call throttled: {str(error)}",
+                             headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    if is_retryable_error(error):
+        return HTTPException(status_code=503, detail=f"Model unavailable: {str(error)}")
+    return HTTPException(status_code=500, detail=f"Model call failed: {str(error)}")
+
+def fallback_allowed(error: Exception) -> bool:
+    """Whether a failed model call is answered with the rule-based fallback.
+
+    Only while the model is unavailable (transient failures that outlasted
+    the retries, or an open breaker); configuration errors such as a bad
+    model id or missing permissions surface as 500s, and backpressure as 429s.
+    """
+    if isinstance(error, HTTPException):
+        return error.status_code == 503
+    return isinstance(error, CircuitOpenError) or (is_retryable_error(error) and not is_throttling_error(error))
+
+def flight_error(request: PromptRequest, error: BaseException) -> BaseException:
+    """What the followers of a failed leader are given.
+
+    Errors become the same HTTP errors the leader's client sees; running out
+    of the leader's own time or being cancelled hands the flight over instead.
+    """
+    if isinstance(error, DeadlineExceeded):
+        return asyncio.CancelledError()
+    if isinstance(error, Exception):
+        return model_call_error(request.model, error)
+    return error
+
+def record_prompt_caching(model_id: str, usage: Dict[str, int], latency_ms: float) -> None:
+    """Account cache reads and writes of a call whose system prompt was marked cacheable"""
+    read_tokens = usage.get("cache_read_tokens", 0)
+    write_tokens = usage.get("cache_write_tokens", 0)
+    saved = (estimate_cost(model_id, read_tokens, 0) * PROMPT_CACHE_READ_DISCOUNT
+             - estimate_cost(model_id, write_tokens, 0) * PROMPT_CACHE_WRITE_PREMIUM)
+    prompt_caching_stats.record(usage, latency_ms, saved)
+
+async def invoke_bedrock_once(model_id: str, body: Dict, input_tokens: int, adapter: ModelAdapter, cacheable: bool,
+                              invoker: Optional[BedrockInvoker] = None) -> Dict:
+    """One Bedrock call under the model's concurrency limit; raises the underlying error.
+
+    ``input_tokens`` is the local count of the prompt; latency samples are keyed by it because routing
+    predicts from the same count.
+    """
+    limiter = model_limiters.get(model_id)
+    await limiter.acquire()
+    
+    started = time.perf_counter()
+    outcome = CANCELLED
     try:
-        if model_id.startswith("amazon.nova"):
-            # Nova models use the new format
-            body = {
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [{"text": prompt}]
-                    }
-                ],
-                "inferenceConfig": {
-                    "maxTokens": max_tokens,
-                    "temperature": temperature
-                }
-            }
-        elif model_id.startswith("anthropic.claude"):
-            # Claude models
-            body = {
-                "messages": [
-                    {
-                        "role": "user", 
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-                "anthropic_version": "bedrock-2023-05-31"
-            }
-        elif model_id.startswith("meta.llama"):
-            # Llama models
-            body = {
-                "prompt": prompt,
-                "max_gen_len": max_tokens,
-                "temperature": temperature
-            }
-        elif model_id.startswith("amazon.titan"):
-            # Titan models
-            body = {
-                "inputText": prompt,
-                "textGenerationConfig": {
-                    "maxTokenCount": max_tokens,
-                    "temperature": temperature,
-                    "topP": 0.9
-                }
-            }
-        elif model_id.startswith("cohere.command"):
-            # Cohere models
-            body = {
-                "prompt": prompt,
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-                "p": 0.9
-            }
-        else:
-            raise ValueError(f"Unsupported model: {model_id}")
+        response_body = await (invoker or bedrock_invoker).invoke_model(model_id, body)
+        latency_ms = (time.perf_counter() - started) * 1000
+        usage = adapter.extract_usage(response_body)
+        model_health[model_id].record_success(latency_ms, input_tokens)
+        if cacheable:
+            record_prompt_caching(model_id, usage, latency_ms)
+        outcome = SUCCESS
+        return response_body
+    except Exception as e:
+        outcome = THROTTLED if is_throttling_error(e) else FAILED
+        model_health[model_id].record_error()
+        raise
+    finally:
+        limiter.release(outcome)
 
-        response = bedrock_runtime.invoke_model(
-            modelId=model_id,
-            body=json.dumps(body),
-            contentType="application/json"
-        )
+async def call_bedrock_model(model_id: str, prompt: str, max_tokens: int = 1000, temperature: float = 0.7,
+                             invoker: Optional[BedrockInvoker] = None, system: Optional[str] = None,
+                             stop_sequences: Optional[List[str]] = None) -> Dict:
+    """Call Bedrock model and wait for the complete response, retrying transient failures.
+
+    ``system`` is sent as a separate system block, marked for prompt caching
+    on models that support it.  A matched stop sequence is put back at the
+    end of the text and reported as ``stop_sequence``.
+    """
+    try:
+        adapter = get_adapter(model_id)
+        cacheable = bool(system) and PROMPT_CACHE_ENABLED and supports_prompt_cache(model_id)
+        body = adapter.build_body(prompt, max_tokens, temperature, system, cacheable, stop_sequences)
+        input_tokens = count_static_tokens(system or "") + count_tokens(prompt)
         
-        response_body = json.loads(response['body'].read())
+        response_body = await resilient_call(
+            model_id, lambda: invoke_bedrock_once(model_id, body, input_tokens, adapter, cacheable, invoker)
+        )
         
-        # Extract text based on model type
-        if model_id.startswith("amazon.nova"):
-            text = response_body['output']['message']['content'][0]['text']
-        elif model_id.startswith("anthropic.claude"):
-            text = response_body['content'][0]['text']
-        elif model_id.startswith("meta.llama"):
-            text = response_body['generation']
-        elif model_id.startswith("amazon.titan"):
-            text = response_body['results'][0]['outputText']
-        elif model_id.startswith("cohere.command"):
-            text = response_body['generations'][0]['text']
-        else:
-            text = str(response_body)
-            
-        return {"text": text, "usage": response_body.get("usage", {})}
+        stop_sequence = adapter.matched_stop_sequence(response_body, stop_sequences) if stop_sequences else None
+        return {
+            "text": adapter.parse_response(response_body) + (stop_sequence or ""),
+            "usage": adapter.extract_usage(response_body),
+            "truncated": adapter.truncated(response_body),
+            "stop_sequence": stop_sequence
+        }
         
     except Exception as e:
         logger.error(f"Error calling Bedrock model {model_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Model call failed: {str(e)}")
+        raise model_call_error(model_id, e)
+
+async def stream_bedrock_once(model_id: str, body: Dict, input_tokens: int, adapter: ModelAdapter, cacheable: bool,
+                              invoker: Optional[BedrockInvoker] = None, stop_sequences: Optional[List[str]] = None,
+                              done: Optional[Callable[[], bool]] = None) -> AsyncGenerator[Dict, None]:
+    """One streaming Bedrock call under the model's concurrency limit"""
+    limiter = model_limiters.get(model_id)
+    await limiter.acquire()
+    
+    started = time.perf_counter()
+    outcome = CANCELLED
+    try:
+        usage = {}
+        stream = (invoker or bedrock_invoker).invoke_model_stream(model_id, body)
+        try:
+            async for chunk in stream:
+                text = adapter.decode_stream_chunk(chunk)
+                if text:
+                    yield {"text": text}
+                    if done is not None and done():
+                        # The caller has all it needs; stop paying for whatever the model writes next
+                        yield {"stopped_early": True}
+                        break
+                chunk_usage = adapter.stream_usage(chunk)
+                if chunk_usage:
+                    usage = chunk_usage
+                    yield {"usage": usage}
+                if adapter.stream_truncated(chunk):
+                    yield {"truncated": True}
+                stop_sequence = adapter.stream_matched_stop_sequence(chunk, stop_sequences) if stop_sequences else None
+                if stop_sequence:
+                    yield {"text": stop_sequence, "stop_sequence": stop_sequence}
+        finally:
+            await stream.aclose()
+        latency_ms = (time.perf_counter() - started) * 1000
+        model_health[model_id].record_success(latency_ms, input_tokens)
+        if cacheable and usage:
+            record_prompt_caching(model_id, usage, latency_ms)
+        outcome = SUCCESS
+    except Exception as e:
+        outcome = THROTTLED if is_throttling_error(e) else FAILED
+        model_health[model_id].record_error()
+        raise
+    finally:
+        limiter.release(outcome)
+
+async def stream_bedrock_model(model_id: str, prompt: str, max_tokens: int = 1000, temperature: float = 0.7,
+                               invoker: Optional[BedrockInvoker] = None, system: Optional[str] = None,
+                               stop_sequences: Optional[List[str]] = None,
+                               done: Optional[Callable[[], bool]] = None) -> AsyncGenerator[Dict, None]:
+    """Stream a Bedrock model response as text deltas.
+
+    Yields ``{"text": ...}`` for every non-empty content delta and, when the
+    final chunk carries Bedrock invocation metrics, one ``{"usage": ...}`` item.
+    ``{"truncated": True}`` is yielded if generation ran out of ``max_tokens``.
+    A matched stop sequence comes back as a text item that also carries
+    ``stop_sequence``.  If ``done`` returns True after a text item, the
+    stream is abandoned and ``{"stopped_early": True}`` is yielded instead
+    of the rest.
+    Transient failures are retried as long as nothing has been yielded yet.
+    Raises LimitExceeded if the model's concurrency limit has no room and
+    CircuitOpenError if its circuit breaker is open.
+    """
+    adapter = get_adapter(model_id)
+    cacheable = bool(system) and PROMPT_CACHE_ENABLED and supports_prompt_cache(model_id)
+    body = adapter.build_body(prompt, max_tokens, temperature, system, cacheable, stop_sequences)
+    input_tokens = count_static_tokens(system or "") + count_tokens(prompt)
+    
+    async for item in resilient_stream(
+        model_id,
+        lambda: stream_bedrock_once(model_id, body, input_tokens, adapter, cacheable, invoker, stop_sequences, done)
+    ):
+        yield item
+
+async def call_bedrock_model_hedged(model_id: str, backup_model_id: str, prompt: str, max_tokens: int = 1000,
+                                    temperature: float = 0.7, system: Optional[str] = None,
+                                    stop_sequences: Optional[List[str]] = None) -> Tuple[Dict, bool]:
+    """Call the primary model, racing a backup call if it is slower than usual.
+
+    Both legs use the response stream so the loser can actually be aborted
+    rather than left running on a worker thread.  Returns ``(result, backup_won)``.
+    """
+    progress = {"primary": [], "backup": []}
+    
+    async def leg(name: str, leg_model_id: str, invoker: BedrockInvoker) -> Dict:
+        usage = {}
+        truncated = False
+        stop_sequence = None
+        async for item in stream_bedrock_model(leg_model_id, prompt, max_tokens, temperature, invoker, system,
+                                               stop_sequences):
+            if "text" in item:
+                progress[name].append(item["text"])
+                stop_sequence = item.get("stop_sequence") or stop_sequence
+            elif "usage" in item:
+                usage = item["usage"]
+            elif "truncated" in item:
+                truncated = True
+        return {"text": "".join(progress[name]), "usage": usage, "truncated": truncated,
+                "stop_sequence": stop_sequence}
+    
+    try:
+        result, hedged, backup_won = await hedge_policy.race(
+            lambda: leg("primary", model_id, bedrock_invoker),
+            lambda: leg("backup", backup_model_id, backup_invoker),
+            hedge_policy.delay_seconds(model_id)
+        )
+    except Exception as e:
+        logger.error(f"Error calling Bedrock model {model_id} (hedged): {str(e)}")
+        raise model_call_error(model_id, e)
+    
+    if hedged:
+        # The cancelled leg was billed for its prompt and whatever it generated
+        loser, loser_model_id = ("primary", model_id) if backup_won else ("backup", backup_model_id)
+        input_tokens = count_static_tokens(system or "") + count_tokens(prompt)
+        output_tokens = count_tokens("".join(progress[loser]))
+        hedge_policy.record_waste(estimate_cost(loser_model_id, input_tokens, output_tokens))
+    
+    return result, backup_won
 
 def estimate_cost(model_id: str, input_tokens: int, output_tokens: int) -> float:
     """Estimate cost based on model and token usage"""
@@ -195,6 +424,7 @@ def estimate_cost(model_id: str, input_tokens: int, output_tokens: int) -> float
     costs = {
         "amazon.nova-lite-v1:0": (0.00006, 0.00024),  # Very cheap
         "anthropic.claude-3-haiku-20240307-v1:0": (0.00025, 0.00125),
+        "anthropic.claude-3-sonnet-20240229-v1:0": (0.003, 0.015),
         "anthropic.claude-3-5-sonnet-20240620-v1:0": (0.003, 0.015),
         "meta.llama3-8b-instruct-v1:0": (0.0003, 0.0006),
         "amazon.titan-text-express-v1": (0.0002, 0.0006),
@@ -205,65 +435,395 @@ def estimate_cost(model_id: str, input_tokens: int, output_tokens: int) -> float
     total_cost = (input_tokens / 1000 * input_cost) + (output_tokens / 1000 * output_cost)
     return round(total_cost, 6)
 
-async def stream_prompt_optimization(request: PromptRequest) -> AsyncGenerator[str, None]:
-    """Stream the prompt optimization process"""
-    try:
-        model_id = MODELS.get(request.model, MODELS[DEFAULT_MODEL])
-        
-        # Create the full prompt for the model
-        full_prompt = f"{SYSTEM_PROMPT}\n\nUser Request: {request.description}"
-        if request.context:
-            full_prompt += f"\nContext: {request.context}"
-        
-        # Yield initial status
-        yield f"data: {json.dumps({'type': 'status', 'message': 'Starting optimization...'})}\n\n"
-        
-        # Call the model
-        yield f"data: {json.dumps({'type': 'status', 'message': f'Calling {request.model} model...'})}\n\n"
-        
-        result = await call_bedrock_model(
-            model_id, 
-            full_prompt, 
-            request.max_tokens, 
-            request.temperature
-        )
-        
-        # Parse the JSON response
+def usage_cost(model_id: str, usage: Dict[str, int]) -> float:
+    """Cost of a call from its token usage, with cache reads and writes at their own rates"""
+    billed_input = (usage.get("input_tokens", 0)
+                    + usage.get("cache_read_tokens", 0) * (1 - PROMPT_CACHE_READ_DISCOUNT)
+                    + usage.get("cache_write_tokens", 0) * (1 + PROMPT_CACHE_WRITE_PREMIUM))
+    return estimate_cost(model_id, round(billed_input), usage.get("output_tokens", 0))
+
+model_router = ModelRouter(MODELS, estimate_cost)
+
+def resolve_model(request: PromptRequest, input_tokens: int) -> Tuple[str, str]:
+    """Resolve the requested model alias to ``(alias, model_id)``, routing "auto" requests"""
+    alias = request.model
+    if alias == AUTO_MODEL:
+        alias = model_router.choose(input_tokens, request.max_tokens)
+    return alias, MODELS.get(alias, MODELS[DEFAULT_MODEL])
+
+def build_user_prompt(request: PromptRequest) -> str:
+    """Create the per-request user message; SYSTEM_PROMPT is sent as a separate system block"""
+    user_prompt = f"User Request: {request.description}"
+    if request.context:
+        user_prompt += f"\nContext: {request.context}"
+    return user_prompt
+
+def system_prompt_for(request: PromptRequest) -> str:
+    return SYSTEM_PROMPT if request.include_reasoning else PROMPT_ONLY_SYSTEM_PROMPT
+
+def prompt_tokens(request: PromptRequest) -> int:
+    """Local token count of the system and user prompt; the static system prompt is counted once"""
+    return count_static_tokens(system_prompt_for(request)) + count_tokens(build_user_prompt(request))
+
+def cache_model_key(request: PromptRequest) -> str:
+    """Model part of the cache key; prompt-only results are cached apart from full ones"""
+    return request.model if request.include_reasoning else f"{request.model}:{PROMPT_ONLY_VARIANT}"
+
+def optimization_key(request: PromptRequest) -> str:
+    """Cache and coalescing key for a request; also the reasoning id of a prompt-only result"""
+    return prompt_cache.key(request.description, request.context or "", cache_model_key(request))
+
+async def cached_optimization(request: PromptRequest) -> Optional[Dict]:
+    """Cached result for a request; a full result also answers a prompt-only request.
+
+    A stale result is returned as is and refreshed in the background.
+    """
+    async def lookup() -> Tuple[Optional[Dict], bool]:
+        description, context = request.description, request.context or ""
+        result, stale = await prompt_cache.lookup(description, context, cache_model_key(request), allow_stale=True)
+        if result is None and not request.include_reasoning:
+            result, stale = await prompt_cache.lookup(description, context, request.model, allow_stale=True)
+        return result, stale
+    
+    # A shared L2 store may be slow; the lookup is bounded by the request's deadline
+    result, stale = await within_deadline("cache", lookup)
+    if stale:
+        refresh_in_background(request)
+    return result
+
+def refresh_in_background(request: PromptRequest) -> None:
+    """Recompute a stale cached result, once per key however many requests are served it meanwhile"""
+    key = optimization_key(request)
+    if key in background_refreshes or optimization_flights.in_flight(key):
+        return
+    
+    async def refresh() -> None:
         try:
-            parsed_result = json.loads(result["text"])
-            reasoning_trace = parsed_result.get("reasoning_trace", [])
-            optimized_prompt = parsed_result.get("optimized_prompt", "")
-        except json.JSONDecodeError:
-            # Fallback if model doesn't return proper JSON
-            reasoning_trace = ["Model response was not in expected JSON format"]
-            optimized_prompt = result["text"]
+            result = await optimization_flights.do(key, lambda: run_optimization(request))
+            # A rule-based fallback isn't cached, so the stale entry stays until the next try
+            prompt_cache.record_refresh(result["model_used"] != RULE_BASED_MODEL)
+        except Exception as e:
+            prompt_cache.record_refresh(False)
+            logger.warning(f"Background refresh failed for key: {key[:8]}...: {str(e)}")
+    
+    # Not bound by the deadline of the request that found the entry stale
+    background_refreshes[key] = start_with_deadline(None, refresh)
+    background_refreshes[key].add_done_callback(lambda _: background_refreshes.pop(key, None))
+
+def format_sse(event: Dict) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+def cache_optimization(request: PromptRequest, reasoning_trace: List[str], optimized_prompt: str, cost: float,
+                       model_used: Optional[str] = None, model_id: Optional[str] = None) -> Dict:
+    """Build the response payload for a finished optimization and cache it"""
+    result = {
+        "optimized_prompt": optimized_prompt,
+        "reasoning_trace": reasoning_trace,
+        "model_used": model_used or request.model,
+        "timestamp": datetime.now().isoformat(),
+        "cost_estimate": cost
+    }
+    if not request.include_reasoning:
+        result["reasoning_id"] = optimization_key(request)
+        # Kept in the prompt cache, so the id works on any worker sharing its L2 store and after a restart
+        prompt_cache.set(result["reasoning_id"], "", REASONING_CONTEXT, {
+            "request": request.model_dump(),
+            "result": result,
+            "model_id": model_id or MODELS.get(request.model, MODELS[DEFAULT_MODEL])
+        })
+    prompt_cache.set(request.description, request.context or "", cache_model_key(request), result)
+    return result
+
+def fallback_optimization(request: PromptRequest, reason: str) -> Dict:
+    """Rule-based result used while the model can't be called; never cached"""
+    logger.warning(f"Serving rule-based fallback: {reason}")
+    model_breakers.fallbacks_served += 1
+    optimized = rule_based_optimization(request.description, request.context or "")
+    return {
+        **optimized,
+        "model_used": RULE_BASED_MODEL,
+        "timestamp": datetime.now().isoformat(),
+        "cost_estimate": 0.0
+    }
+
+def sizing_domain(request: PromptRequest) -> str:
+    """Output-length history key: the prompt's domain, split by whether reasoning is generated"""
+    domain = rule_optimizer.classify_domain(request.description)
+    return domain if request.include_reasoning else f"{domain}/{PROMPT_ONLY_VARIANT}"
+
+def draft_event(request: PromptRequest) -> Dict:
+    """Rule-based optimization sent ahead of the model's answer; the final ``result`` event supersedes it"""
+    started = time.perf_counter()
+    draft = rule_based_optimization(request.description, request.context or "")
+    draft_ms = (time.perf_counter() - started) * 1000
+    stream_draft_ms.add(draft_ms)
+    return {'type': 'draft', **draft, 'model_used': RULE_BASED_MODEL, 'ms': round(draft_ms, 3)}
+
+def stop_sequences_for_call() -> Tuple[Optional[List[str]], bool]:
+    """Stop sequences for the next call and whether it is a control call that runs without them"""
+    if random.random() < STOP_SEQUENCE_CONTROL_RATE:
+        return None, True
+    return JSON_STOP_SEQUENCES, False
+
+def record_generation_stop(trailing: str, control: bool, stop_sequence: Optional[str],
+                           stopped_early: bool = False) -> float:
+    """Account how a call ended; returns the output tokens it is estimated to have saved"""
+    if stop_sequence or stopped_early:
+        return generation_stop_stats.record_stopped(bool(stop_sequence))
+    if control:
+        generation_stop_stats.record_control(count_tokens(trailing))
+    return 0.0
+
+async def call_optimization_model(request: PromptRequest, model_id: str, max_tokens: int,
+                                  stop_sequences: Optional[List[str]] = None) -> Tuple[Dict, bool]:
+    """One complete model call for ``request``, hedged if enabled; returns ``(result, backup_won)``"""
+    if hedge_policy.enabled:
+        return await call_bedrock_model_hedged(
+            model_id, MODELS.get(HEDGE_BACKUP_MODEL, model_id), build_user_prompt(request), max_tokens,
+            request.temperature, system=system_prompt_for(request), stop_sequences=stop_sequences
+        )
+    result = await call_bedrock_model(model_id, build_user_prompt(request), max_tokens, request.temperature,
+                                      system=system_prompt_for(request), stop_sequences=stop_sequences)
+    return result, False
+
+async def run_optimization(request: PromptRequest) -> Dict:
+    """Optimize a prompt with a single (non-streaming) model call"""
+    input_tokens = prompt_tokens(request)
+    model_used, model_id = resolve_model(request, input_tokens)
+    
+    if model_breakers.get(model_id).is_open():
+        return fallback_optimization(request, f"circuit breaker open for {model_used}")
+    
+    # request.max_tokens is the ceiling; the call asks for what this kind of prompt usually needs
+    domain = sizing_domain(request)
+    max_tokens = token_budgets.budget(model_id, domain, input_tokens, request.max_tokens)
+    stop_sequences, control = stop_sequences_for_call()
+    cost = 0.0
+    try:
+        while True:
+            result, backup_won = await call_optimization_model(request, model_id, max_tokens, stop_sequences)
+            usage = token_accounting.resolve(result["usage"], input_tokens, result["text"])
+            cost += usage_cost(MODELS.get(HEDGE_BACKUP_MODEL, model_id) if backup_won else model_id, usage)
+            if not result["truncated"] or max_tokens >= request.max_tokens:
+                break
+            token_budgets.record_truncation(model_id, domain, max_tokens, usage["output_tokens"])
+            max_tokens = token_budgets.next_budget(max_tokens, request.max_tokens)
+    except HTTPException as e:
+        if not fallback_allowed(e):
+            raise
+        return fallback_optimization(request, e.detail)
+    
+    if backup_won:
+        model_id = MODELS.get(HEDGE_BACKUP_MODEL, model_id)
+        model_used = HEDGE_BACKUP_MODEL or model_used
+    elif not result["truncated"]:
+        token_budgets.record(model_id, domain, input_tokens, usage["output_tokens"])
+    
+    trailing = ""
+    if control:
+        parser = OptimizationStreamParser()
+        parser.feed(result["text"])
+        trailing = parser.trailing
+    saved = record_generation_stop(trailing, control, result["stop_sequence"])
+    if saved:
+        logger.info(f"Stop sequence saved about {saved:.0f} output tokens")
+    
+    reasoning_trace, optimized_prompt = parse_optimization_response(result["text"])
+    return cache_optimization(request, reasoning_trace, optimized_prompt, round(cost, 6), model_used, model_id)
+
+def replay_events(result: Dict) -> List[Dict]:
+    """SSE events for a result that was not streamed from the model (cache hit or coalesced)"""
+    events = [
+        {'type': 'reasoning', 'step': i + 1, 'content': step}
+        for i, step in enumerate(result["reasoning_trace"])
+    ]
+    events.append({'type': 'prompt', 'content': result["optimized_prompt"]})
+    events.append({'type': 'result', **result})
+    return events
+
+async def stream_model_optimization(request: PromptRequest, flight_key: str) -> AsyncGenerator[Dict, None]:
+    """Stream one model call as SSE events, then finish the coalescing flight for ``flight_key``"""
+    try:
+        enter_stage("model")
+        input_tokens = prompt_tokens(request)
+        model_used, model_id = resolve_model(request, input_tokens)
         
-        # Stream reasoning trace
-        for i, step in enumerate(reasoning_trace):
-            yield f"data: {json.dumps({'type': 'reasoning', 'step': i+1, 'content': step})}\n\n"
-            await asyncio.sleep(0.1)  # Small delay for streaming effect
+        fallback_reason = None
+        if model_breakers.get(model_id).is_open():
+            fallback_reason = f"circuit breaker open for {model_used}"
+        else:
+            yield {'type': 'status', 'message': f'Calling {model_used} model...'}
+            
+            domain = sizing_domain(request)
+            max_tokens = token_budgets.budget(model_id, domain, input_tokens, request.max_tokens)
+            stop_sequences, control = stop_sequences_for_call()
+            cost = 0.0
+            started = time.perf_counter()
+            ttfb_ms = None
+            while True:
+                chunks = []
+                usage = {}
+                truncated = False
+                stop_sequence = None
+                stopped_early = False
+                parser = OptimizationStreamParser()
+                try:
+                    async for item in stream_bedrock_model(
+                        model_id, build_user_prompt(request), max_tokens, request.temperature,
+                        system=system_prompt_for(request), stop_sequences=stop_sequences,
+                        done=None if control else lambda: parser.complete
+                    ):
+                        if "usage" in item:
+                            usage = item["usage"]
+                            continue
+                        if "truncated" in item:
+                            truncated = True
+                            continue
+                        if "stopped_early" in item:
+                            stopped_early = True
+                            continue
+                        stop_sequence = item.get("stop_sequence") or stop_sequence
+                        if ttfb_ms is None:
+                            ttfb_ms = (time.perf_counter() - started) * 1000
+                            stream_ttfb_ms.add(ttfb_ms)
+                        chunks.append(item["text"])
+                        # Reasoning steps and prompt chunks go out while the model is still generating
+                        for event in parser.feed(item["text"]):
+                            yield event
+                except Exception as e:
+                    # Once output has reached the client the error is reported as is
+                    if chunks or not fallback_allowed(e):
+                        raise
+                    fallback_reason = str(e)
+                    break
+                
+                text = "".join(chunks)
+                usage = token_accounting.resolve(usage, input_tokens, text)
+                cost += usage_cost(model_id, usage)
+                if not truncated or max_tokens >= request.max_tokens:
+                    break
+                # The predicted budget was too tight; the client discards what it has and gets a full answer
+                token_budgets.record_truncation(model_id, domain, max_tokens, usage["output_tokens"])
+                max_tokens = token_budgets.next_budget(max_tokens, request.max_tokens)
+                yield {'type': 'restart', 'message': f'Output hit the token budget, retrying with {max_tokens}'}
         
-        # Calculate cost estimate
-        input_tokens = len(full_prompt.split()) * 1.3  # Rough estimate
-        output_tokens = len(result["text"].split()) * 1.3
-        cost = estimate_cost(model_id, int(input_tokens), int(output_tokens))
+        if fallback_reason is not None:
+            result = fallback_optimization(request, fallback_reason)
+            optimization_flights.resolve(flight_key, result)
+        else:
+            total_ms = (time.perf_counter() - started) * 1000
+            stream_total_ms.add(total_ms)
+            if not truncated:
+                token_budgets.record(model_id, domain, input_tokens, usage["output_tokens"])
+            saved_output_tokens = record_generation_stop(parser.trailing, control, stop_sequence, stopped_early)
+            reasoning_trace, optimized_prompt = parser.close()
+            
+            result = cache_optimization(request, reasoning_trace, optimized_prompt, round(cost, 6), model_used,
+                                        model_id)
+            optimization_flights.resolve(flight_key, result)
+    except BaseException as e:
+        optimization_flights.reject(flight_key, flight_error(request, e))
+        raise
+    
+    if fallback_reason is not None:
+        for event in replay_events(result):
+            yield event
+        return
+    
+    yield {
+        "type": "result",
+        **result,
+        "ttfb_ms": round(ttfb_ms, 1) if ttfb_ms is not None else None,
+        "total_ms": round(total_ms, 1),
+        "saved_output_tokens": round(saved_output_tokens)
+    }
+
+async def stream_prompt_optimization(request: PromptRequest,
+                                     cached_result: Optional[Dict]) -> AsyncGenerator[str, None]:
+    """Stream the prompt optimization process; ``cached_result`` is the cache lookup made before streaming"""
+    try:
+        yield format_sse({'type': 'status', 'message': 'Starting optimization...'})
         
-        # Final result
-        final_result = {
-            "type": "result",
-            "optimized_prompt": optimized_prompt,
-            "reasoning_trace": reasoning_trace,
-            "model_used": request.model,
-            "timestamp": datetime.now().isoformat(),
-            "cost_estimate": cost
-        }
+        if cached_result:
+            for event in replay_events(cached_result):
+                yield format_sse(event)
+        else:
+            if DRAFT_ENABLED:
+                yield format_sse(draft_event(request))
+            flight_key = optimization_key(request)
+            flight, leader = optimization_flights.join(flight_key)
+            if leader:
+                async for event in stream_model_optimization(request, flight_key):
+                    yield format_sse(event)
+            else:
+                yield format_sse({'type': 'status', 'message': 'Joining an identical optimization in progress...'})
+                enter_stage("model")
+                result = await optimization_flights.wait(flight_key, flight, lambda: run_optimization(request))
+                for event in replay_events(result):
+                    yield format_sse(event)
         
-        yield f"data: {json.dumps(final_result)}\n\n"
-        yield f"data: {json.dumps({'type': 'complete'})}\n\n"
+        yield format_sse({'type': 'complete'})
         
     except Exception as e:
         logger.error(f"Error in stream_prompt_optimization: {str(e)}")
-        yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+        yield format_sse({'type': 'error', 'message': str(e)})
+
+async def warm_aws_connections():
+    """Open pooled connections before the first request needs them, including the hedging backup's"""
+    targets = {
+        "bedrock": lambda: bedrock_runtime.list_async_invokes(maxResults=1),
+        "dynamodb": lambda: dynamodb.meta.client.describe_table(TableName=PROMPT_TABLE_NAME)
+    }
+    if backup_invoker is not bedrock_invoker:
+        targets["bedrock_backup"] = lambda: backup_invoker.client.list_async_invokes(maxResults=1)
+    results = await asyncio.gather(*(warm_connections(name, call) for name, call in targets.items()))
+    connection_warmup.update(zip(targets, results))
+
+@app.on_event("startup")
+async def start_connection_warmup():
+    """Warm connections in the background so startup never waits out CONNECTION_WARM_TIMEOUT"""
+    global warmup_task
+    if CONNECTION_WARMUP:
+        warmup_task = asyncio.create_task(warm_aws_connections())
+
+async def snapshot_periodically():
+    global snapshot_write
+    while True:
+        await asyncio.sleep(CACHE_SNAPSHOT_INTERVAL_SECONDS)
+        # Chosen on the loop so the cache is not mutated mid-copy; payloads are copied and written off it
+        entries = prompt_cache.snapshot_entries()
+        snapshot_write = asyncio.ensure_future(asyncio.to_thread(prompt_cache.save_snapshot, entries))
+        # Shielded: cancelling this task at shutdown must not lose track of a write still running
+        await asyncio.shield(snapshot_write)
+
+@app.on_event("startup")
+async def restore_prompt_cache():
+    """Map the last snapshot so a restart starts warm, and keep snapshotting while up"""
+    global snapshot_task
+    if not prompt_cache.snapshot_path:
+        return
+    await asyncio.to_thread(prompt_cache.load_snapshot)
+    if CACHE_SNAPSHOT_INTERVAL_SECONDS > 0:
+        snapshot_task = asyncio.create_task(snapshot_periodically())
+
+@app.on_event("shutdown")
+async def shutdown_bedrock_invoker():
+    if warmup_task is not None:
+        warmup_task.cancel()
+    bedrock_invoker.shutdown()
+    if backup_invoker is not bedrock_invoker:
+        backup_invoker.shutdown()
+
+@app.on_event("shutdown")
+async def close_prompt_cache():
+    if snapshot_task is not None:
+        snapshot_task.cancel()
+    if snapshot_write is not None:
+        await snapshot_write
+    # Written before close, which releases the mapped snapshot still holding unread entries
+    prompt_cache.save_snapshot()
+    # Pending L2 writes are flushed so other workers can still use them
+    prompt_cache.close()
 
 # API Routes
 @app.get("/")
@@ -286,7 +846,8 @@ async def health_check():
         "status": "healthy", 
         "timestamp": datetime.now().isoformat(),
         "models_available": len(MODELS),
-        "database_connected": True  # Could add actual DB health check
+        "database_connected": True,  # Could add actual DB health check
+        "bedrock": bedrock_invoker.stats()
     }
 
 @app.get("/models")
@@ -294,6 +855,7 @@ async def get_available_models():
     return {
         "models": list(MODELS.keys()), 
         "default": DEFAULT_MODEL,
+        "routing": {"model": AUTO_MODEL, "latency_slo_ms": model_router.slo_ms},
         "model_details": {
             model: {
                 "id": model_id,
@@ -303,11 +865,78 @@ async def get_available_models():
         }
     }
 
+async def guard_stream(http_request: Request, events: AsyncGenerator[str, None],
+                       deadline: Deadline) -> AsyncGenerator[str, None]:
+    """Relay ``events`` until they end, the client disconnects or ``deadline`` passes.
+
+    Each event is produced on a task that runs under ``deadline`` and is
+    cancelled the moment the client goes away or time runs out, which
+    aborts the Bedrock stream underneath instead of finishing it for nobody.
+    """
+    disconnected = asyncio.ensure_future(wait_for_disconnect(http_request.is_disconnected))
+    step = None
+    try:
+        while True:
+            step = start_with_deadline(deadline, events.__anext__)
+            done, _ = await asyncio.wait({step, disconnected}, timeout=deadline.remaining(),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if step in done:
+                try:
+                    event = step.result()
+                except StopAsyncIteration:
+                    return
+                yield event
+                continue
+            
+            step.cancel()
+            await asyncio.wait({step})
+            if disconnected in done:
+                logger.info(f"Client disconnected during {deadline.stage}, cancelled the optimization")
+                cancellation_stats.record_cancelled(deadline.stage)
+                return
+            cancellation_stats.record_expired(deadline.stage)
+            yield format_sse({'type': 'error', 'message': str(DeadlineExceeded(deadline.stage))})
+            return
+    except asyncio.CancelledError:
+        # The server noticed the disconnect first and cancelled the response
+        cancellation_stats.record_cancelled(deadline.stage)
+        raise
+    finally:
+        disconnected.cancel()
+        if step is not None:
+            step.cancel()
+
+def check_admission(request: PromptRequest) -> None:
+    """Raise 429 if the request's model has no room for another call, before a response is committed to.
+
+    A request that will join an identical one in flight needs no slot;
+    an "auto" request is admitted while any model has room.
+    """
+    if optimization_flights.in_flight(optimization_key(request)):
+        return
+    aliases = list(MODELS) if request.model == AUTO_MODEL else [request.model]
+    for alias in aliases:
+        try:
+            model_limiters.get(MODELS.get(alias, MODELS[DEFAULT_MODEL])).check_admission()
+            return
+        except LimitExceeded as e:
+            rejected = e
+    raise model_call_error(request.model, rejected)
+
 @app.post("/optimize")
-async def optimize_prompt_stream(request: PromptRequest):
+async def optimize_prompt_stream(request: PromptRequest, http_request: Request):
     """Stream prompt optimization with real-time reasoning"""
+    deadline = request_deadline(request.timeout_ms)
+    # Cache hits are always served; only model calls are refused under load, with a plain 429
+    with deadline_scope(deadline):
+        try:
+            cached_result = await cached_optimization(request)
+        except DeadlineExceeded as e:
+            raise HTTPException(status_code=504, detail=str(e))
+    if not cached_result:
+        check_admission(request)
     return StreamingResponse(
-        stream_prompt_optimization(request),
+        guard_stream(http_request, stream_prompt_optimization(request, cached_result), deadline),
         media_type="text/plain",
         headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
     )
@@ -315,51 +944,137 @@ async def optimize_prompt_stream(request: PromptRequest):
 @app.post("/optimize-sync")
 async def optimize_prompt_sync(request: PromptRequest) -> PromptResponse:
     """Synchronous prompt optimization with caching"""
+    with deadline_scope(request_deadline(request.timeout_ms)):
+        try:
+            # Check cache first
+            cached_result = await cached_optimization(request)
+            if cached_result:
+                logger.info("Returning cached result")
+                return PromptResponse(**cached_result)
+            
+            # Identical requests already in flight share one model call
+            flight_key = optimization_key(request)
+            result = await within_deadline(
+                "model", lambda: optimization_flights.do(flight_key, lambda: run_optimization(request))
+            )
+        except DeadlineExceeded as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        except (LimitExceeded, CircuitOpenError) as e:
+            raise model_call_error(request.model, e)
     
-    # Check cache first
-    cached_result = prompt_cache.get(request.description, request.context or "", request.model)
-    if cached_result:
-        logger.info("Returning cached result")
-        return PromptResponse(**cached_result)
+    return PromptResponse(**result)
+
+async def generate_reasoning(reasoning_id: str, context: Dict) -> Dict:
+    """Generate the reasoning trace a prompt-only result was produced without, and cache the full result"""
+    request, result, model_id = PromptRequest(**context["request"]), context["result"], context["model_id"]
+    prompt = f"{build_user_prompt(request)}\nOptimized Prompt: {result['optimized_prompt']}"
+    try:
+        response = await call_bedrock_model(model_id, prompt, request.max_tokens, request.temperature,
+                                            system=REASONING_SYSTEM_PROMPT, stop_sequences=JSON_STOP_SEQUENCES)
+    except HTTPException as e:
+        if not fallback_allowed(e):
+            raise
+        fallback = rule_based_optimization(request.description, request.context or "")
+        return {"reasoning_id": reasoning_id, "reasoning_trace": fallback["reasoning_trace"], "cost_estimate": 0.0}
     
-    model_id = MODELS.get(request.model, MODELS[DEFAULT_MODEL])
+    input_tokens = count_static_tokens(REASONING_SYSTEM_PROMPT) + count_tokens(prompt)
+    usage = token_accounting.resolve(response["usage"], input_tokens, response["text"])
+    reasoning_trace, _ = parse_optimization_response(response["text"])
+    cost = round(usage_cost(model_id, usage), 6)
     
-    full_prompt = f"{SYSTEM_PROMPT}\n\nUser Request: {request.description}"
-    if request.context:
-        full_prompt += f"\nContext: {request.context}"
+    # Full requests for the same prompt can now be answered from the cache
+    full_result = {
+        **{key: value for key, value in result.items() if key != "reasoning_id"},
+        "reasoning_trace": reasoning_trace,
+        "cost_estimate": round(result["cost_estimate"] + cost, 6)
+    }
+    prompt_cache.set(request.description, request.context or "", request.model, full_result)
+    return {"reasoning_id": reasoning_id, "reasoning_trace": reasoning_trace, "cost_estimate": cost}
+
+@app.get("/optimize/reasoning/{reasoning_id}")
+async def get_optimization_reasoning(reasoning_id: str):
+    """Reasoning trace for a result optimized with ``include_reasoning`` off, generated on first request"""
+    # Stale entries still count: the id is as good as the prompt-only result it came with
+    context, _ = await prompt_cache.lookup(reasoning_id, "", REASONING_CONTEXT, allow_stale=True)
+    # A near-duplicate match belongs to some other id
+    if context is None or optimization_key(PromptRequest(**context["request"])) != reasoning_id:
+        raise HTTPException(status_code=404, detail="Unknown or expired reasoning id")
     
-    result = await call_bedrock_model(model_id, full_prompt, request.max_tokens, request.temperature)
+    request = context["request"]
+    cached_result = await prompt_cache.get_async(request["description"], request["context"] or "", request["model"])
+    if cached_result and cached_result["reasoning_trace"]:
+        return {"reasoning_id": reasoning_id, "reasoning_trace": cached_result["reasoning_trace"], "cost_estimate": 0.0}
     
-    try:
-        parsed_result = json.loads(result["text"])
-        reasoning_trace = parsed_result.get("reasoning_trace", [])
-        optimized_prompt = parsed_result.get("optimized_prompt", "")
-    except json.JSONDecodeError:
-        reasoning_trace = ["Model response was not in expected JSON format"]
-        optimized_prompt = result["text"]
+    return await optimization_flights.do(f"reasoning:{reasoning_id}",
+                                         lambda: generate_reasoning(reasoning_id, context))
+
+async def stream_batch_optimization(items: List[PromptRequest], max_concurrency: int) -> AsyncGenerator[str, None]:
+    """Yield one NDJSON line per item as results finish; cache hits don't wait for a model slot.
+
+    Each item runs under its own ``timeout_ms`` deadline, counted from the
+    start of the batch, so time spent queued for a slot is part of it.
+    """
+    def line(index: int, payload: Dict) -> str:
+        return json.dumps({"index": index, **payload}) + "\n"
     
-    input_tokens = len(full_prompt.split()) * 1.3
-    output_tokens = len(result["text"].split()) * 1.3
-    cost = estimate_cost(model_id, int(input_tokens), int(output_tokens))
+    # Items with the same cache key share one optimization
+    indexes: Dict[str, List[int]] = {}
+    requests_by_key: Dict[str, PromptRequest] = {}
+    for index, item in enumerate(items):
+        key = optimization_key(item)
+        indexes.setdefault(key, []).append(index)
+        requests_by_key.setdefault(key, item)
     
-    response_data = {
-        "optimized_prompt": optimized_prompt,
-        "reasoning_trace": reasoning_trace,
-        "model_used": request.model,
-        "timestamp": datetime.now(),
-        "cost_estimate": cost
-    }
+    semaphore = asyncio.Semaphore(max_concurrency)
     
-    # Cache the result
-    prompt_cache.set(request.description, request.context or "", request.model, {
-        "optimized_prompt": optimized_prompt,
-        "reasoning_trace": reasoning_trace,
-        "model_used": request.model,
-        "timestamp": datetime.now().isoformat(),
-        "cost_estimate": cost
-    })
+    async def optimize(key: str, item: PromptRequest) -> Dict:
+        cached_result = await cached_optimization(item)
+        if cached_result:
+            return {"status": "ok", "cached": True, "result": cached_result}
+        async with semaphore:
+            result = await within_deadline(
+                "model", lambda: optimization_flights.do(key, lambda: run_optimization(item))
+            )
+        return {"status": "ok", "cached": False, "result": result}
+    
+    async def settle(key: str) -> Tuple[str, Dict]:
+        item = requests_by_key[key]
+        try:
+            with deadline_scope(request_deadline(item.timeout_ms)):
+                return key, await optimize(key, item)
+        except DeadlineExceeded as e:
+            return key, {"status": "error", "status_code": 504, "error": str(e)}
+        except Exception as e:
+            error = model_call_error(item.model, e)
+            if error.status_code >= 500:
+                logger.error(f"Batch item failed: {str(e)}")
+            return key, {"status": "error", "status_code": error.status_code, "error": error.detail}
+    
+    tasks = [asyncio.ensure_future(settle(key)) for key in indexes]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            key, payload = await next_done
+            for index in indexes[key]:
+                yield line(index, payload)
+    finally:
+        # The client went away; stop the calls it will never read
+        for task in tasks:
+            task.cancel()
+
+@app.post("/optimize-batch")
+async def optimize_prompt_batch(request: BatchRequest):
+    """Optimize many prompts in one request, streaming NDJSON results in completion order"""
+    if not request.requests:
+        raise HTTPException(status_code=400, detail="Batch contains no requests")
+    if len(request.requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds the maximum of {BATCH_MAX_ITEMS} requests")
     
-    return PromptResponse(**response_data)
+    max_concurrency = max(1, min(request.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    return StreamingResponse(
+        stream_batch_optimization(request.requests, max_concurrency),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache"}
+    )
 
 # Prompt Library endpoints (DynamoDB integration)
 @app.post("/library/save")
@@ -378,9 +1093,12 @@ async def save_prompt(request: SavePromptRequest):
             "usage_count": 0
         }
         
-        table.put_item(Item=item)
+        with deadline_scope(request_deadline(request.timeout_ms)):
+            await within_deadline("persistence", lambda: asyncio.to_thread(table.put_item, Item=item))
         return {"message": "Prompt saved successfully", "id": item["id"]}
         
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         logger.error(f"Error saving prompt: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to save prompt: {str(e)}")
@@ -445,6 +1163,43 @@ async def get_prompt(prompt_id: str) -> PromptLibraryItem:
         logger.error(f"Error getting prompt {prompt_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get prompt: {str(e)}")
 
+@app.get("/metrics")
+async def get_metrics():
+    """Get backend performance metrics"""
+    return {
+        "bedrock": bedrock_invoker.stats(),
+        "coalescing": optimization_flights.stats(),
+        "hedging": hedge_policy.stats(),
+        "limiters": model_limiters.stats(),
+        "resilience": model_breakers.stats(),
+        "prompt_caching": prompt_caching_stats.summary(),
+        "tokens": token_accounting.stats(),
+        "sizing": token_budgets.stats(),
+        "generation_stops": generation_stop_stats.summary(),
+        "deadlines": cancellation_stats.stats(),
+        "connections": {
+            "bedrock": pool_stats(bedrock_invoker.client),
+            "bedrock_backup": pool_stats(backup_invoker.client) if backup_invoker is not bedrock_invoker else None,
+            "dynamodb": pool_stats(dynamodb.meta.client),
+            "warmup": connection_warmup
+        },
+        "models": {model_id: health.summary() for model_id, health in model_health.items()},
+        "stream": {
+            "ttfb_ms": stream_ttfb_ms.summary(),
+            "total_ms": stream_total_ms.summary(),
+            "draft_ms": stream_draft_ms.summary()
+        }
+    }
+
+@app.get("/routing/decisions")
+async def get_routing_decisions(limit: int = 50):
+    """Get the most recent routing decisions for "auto" requests"""
+    return {
+        "latency_slo_ms": model_router.slo_ms,
+        "max_error_rate": model_router.max_error_rate,
+        "decisions": model_router.recent_decisions(limit)
+    }
+
 @app.get("/cache/stats")
 async def get_cache_stats():
     """Get cache statistics"""
@@ -453,7 +1208,7 @@ async def get_cache_stats():
 @app.post("/cache/clear")
 async def clear_cache():
     """Clear the cache"""
-    prompt_cache.clear()
+    await prompt_cache.clear_async()
     return {"message": "Cache cleared successfully"}
 
 @app.delete("/library/{prompt_id}")
@@ -0,0 +1,189 @@
+"""
+Lightweight in-process metrics for the Prompt Tune backend
+"""
+
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Sequence, Tuple
+
+
+def linear_tail_prediction(samples: Sequence[Tuple[float, float]], x: float, percentile: float) -> float:
+    """Estimate of y at ``x`` that covers the ``percentile`` tail, from ``(x, y)`` samples.
+
+    Fits y = a + b * x by least squares (b kept non-negative) and adds the
+    residual at ``percentile``, so the estimate is a bound rather than a mean.
+    """
+    n = len(samples)
+    mean_x = sum(sx for sx, _ in samples) / n
+    mean_y = sum(sy for _, sy in samples) / n
+    var_x = sum((sx - mean_x) ** 2 for sx, _ in samples)
+    slope = 0.0
+    if var_x > 0:
+        slope = max(0.0, sum((sx - mean_x) * (sy - mean_y) for sx, sy in samples) / var_x)
+    intercept = mean_y - slope * mean_x
+
+    residuals = sorted(sy - (intercept + slope * sx) for sx, sy in samples)
+    tail = residuals[min(n - 1, int(n * percentile / 100))]
+    return intercept + slope * x + max(0.0, tail)
+
+
+class RollingStats:
+    """Keeps the most recent ``window`` samples and summarizes them on demand"""
+
+    def __init__(self, window: int = 1000):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+
+    def mean(self) -> float:
+        return sum(self.samples) / len(self.samples) if self.samples else 0.0
+
+    def percentile(self, p: float) -> float:
+        """Nearest-rank percentile of the current window, ``p`` in 0-100"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": round(self.mean(), 2),
+            "p50": round(self.percentile(50), 2),
+            "p95": round(self.percentile(95), 2),
+            "p99": round(self.percentile(99), 2)
+        }
+
+
+class ModelHealth:
+    """Rolling latency and error samples for one Bedrock model id"""
+
+    def __init__(self, window: int = 200):
+        self.latency_ms = RollingStats(window)
+        self.sized_latency: Deque[Tuple[int, float]] = deque(maxlen=window)  # (input tokens, latency ms)
+        self.outcomes: Deque[bool] = deque(maxlen=window)  # True for an error
+        self.requests = 0
+        self.errors = 0
+
+    def record_success(self, latency_ms: float, input_tokens: int = 0) -> None:
+        self.latency_ms.add(latency_ms)
+        self.sized_latency.append((input_tokens, latency_ms))
+        self.outcomes.append(False)
+        self.requests += 1
+
+    def record_error(self) -> None:
+        self.outcomes.append(True)
+        self.requests += 1
+        self.errors += 1
+
+    def error_rate(self) -> float:
+        """Share of errors among the recent calls"""
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate(), 4),
+            "latency_ms": self.latency_ms.summary()
+        }
+
+
+class PromptCachingStats:
+    """Cache read/write tokens and savings for calls that mark the system prompt cacheable"""
+
+    def __init__(self):
+        self.calls = 0
+        self.cache_hits = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.uncached_input_tokens = 0
+        self.cost_saved = 0.0
+        self.hit_latency_ms = RollingStats()
+        self.miss_latency_ms = RollingStats()
+
+    def record(self, usage: Dict[str, int], latency_ms: float, cost_saved: float) -> None:
+        read = usage.get("cache_read_tokens", 0)
+        self.calls += 1
+        self.cache_read_tokens += read
+        self.cache_write_tokens += usage.get("cache_write_tokens", 0)
+        self.uncached_input_tokens += usage.get("input_tokens", 0)
+        self.cost_saved += cost_saved
+        if read:
+            self.cache_hits += 1
+            self.hit_latency_ms.add(latency_ms)
+        else:
+            self.miss_latency_ms.add(latency_ms)
+
+    def summary(self) -> Dict[str, Any]:
+        input_tokens = self.cache_read_tokens + self.cache_write_tokens + self.uncached_input_tokens
+        latency_saved = 0.0
+        if self.hit_latency_ms.samples and self.miss_latency_ms.samples:
+            latency_saved = self.miss_latency_ms.percentile(50) - self.hit_latency_ms.percentile(50)
+        return {
+            "calls": self.calls,
+            "hit_rate": round(self.cache_hits / self.calls, 4) if self.calls else 0.0,
+            "cache_read_tokens": self.cache_read_tokens,
+            "cache_write_tokens": self.cache_write_tokens,
+            "uncached_input_tokens": self.uncached_input_tokens,
+            "cached_input_share": round(self.cache_read_tokens / input_tokens, 4) if input_tokens else 0.0,
+            "cost_saved": round(self.cost_saved, 6),
+            "p50_latency_saved_ms": round(latency_saved, 2),
+            "hit_latency_ms": self.hit_latency_ms.summary(),
+            "miss_latency_ms": self.miss_latency_ms.summary()
+        }
+
+
+class GenerationStopStats:
+    """Output tokens saved by ending generation once the JSON answer is complete.
+
+    Control calls run without stop sequences or early termination; the
+    commentary they write after the JSON object is what every stopped
+    call is credited with saving.
+    """
+
+    def __init__(self):
+        self.trailing_tokens = RollingStats()
+        self.stop_sequence_hits = 0
+        self.early_terminations = 0
+        self.saved_output_tokens = 0.0
+
+    def record_control(self, trailing_tokens: int) -> None:
+        self.trailing_tokens.add(trailing_tokens)
+
+    def record_stopped(self, stop_sequence: bool) -> float:
+        """Account a call cut short by a stop sequence or client-side; returns its estimated saving"""
+        if stop_sequence:
+            self.stop_sequence_hits += 1
+        else:
+            self.early_terminations += 1
+        saved = self.trailing_tokens.mean()
+        self.saved_output_tokens += saved
+        return saved
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "stop_sequence_hits": self.stop_sequence_hits,
+            "early_terminations": self.early_terminations,
+            "control_calls": self.trailing_tokens.count,
+            "trailing_tokens": self.trailing_tokens.summary(),
+            "saved_output_tokens": round(self.saved_output_tokens)
+        }
+
+
+# Per model id call health, fed by every Bedrock call
+model_health: Dict[str, ModelHealth] = defaultdict(ModelHealth)
+
+# Savings from prompt caching of the system prompt
+prompt_caching_stats = PromptCachingStats()
+
+# Output cut after the JSON answer
+generation_stop_stats = GenerationStopStats()
+
+# Streaming latency, in milliseconds
+stream_ttfb_ms = RollingStats()
+stream_total_ms = RollingStats()
+stream_draft_ms = RollingStats()
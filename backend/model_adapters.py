@@ -0,0 +1,322 @@
+"""
+Request and response formats for the Bedrock model families
+Each adapter owns one family's body building, response parsing, stream decoding and usage extraction
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+# Model families that accept a prompt-cache checkpoint after the system block on Bedrock
+PROMPT_CACHE_MODEL_PREFIXES = (
+    "anthropic.claude-3-5-haiku",
+    "anthropic.claude-3-7-sonnet",
+    "anthropic.claude-sonnet-4",
+    "anthropic.claude-opus-4",
+    "amazon.nova",
+)
+
+
+class ModelAdapter:
+    """Base adapter; subclasses describe one model family's native API"""
+
+    family = "generic"
+
+    def build_body(self, prompt: str, max_tokens: int, temperature: float, system: Optional[str] = None,
+                   cache_system: bool = False, stop_sequences: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Request body for ``prompt``.
+
+        ``system`` holds the static instructions; families with a system
+        field send it separately, and ``cache_system`` marks it as a
+        prompt-cache prefix.  Other families prepend it to the prompt.
+        ``stop_sequences`` end generation early on families that accept them.
+        """
+        raise NotImplementedError
+
+    def parse_response(self, body: Dict[str, Any]) -> str:
+        """Extract the generated text from a complete response body"""
+        raise NotImplementedError
+
+    def decode_stream_chunk(self, chunk: Dict[str, Any]) -> str:
+        """Extract the text delta from one response-stream chunk"""
+        raise NotImplementedError
+
+    def extract_usage(self, body: Dict[str, Any]) -> Dict[str, int]:
+        """Token usage from a complete response body as ``input_tokens``/``output_tokens``"""
+        return {}
+
+    def truncated(self, body: Dict[str, Any]) -> bool:
+        """Whether generation stopped because it ran out of ``max_tokens``"""
+        return False
+
+    def stream_truncated(self, chunk: Dict[str, Any]) -> bool:
+        """Whether a response-stream chunk reports running out of ``max_tokens``"""
+        return False
+
+    def matched_stop_sequence(self, body: Dict[str, Any], stop_sequences: List[str]) -> Optional[str]:
+        """The stop sequence that ended generation; providers leave it out of the text"""
+        return None
+
+    def stream_matched_stop_sequence(self, chunk: Dict[str, Any], stop_sequences: List[str]) -> Optional[str]:
+        """The stop sequence a response-stream chunk reports as having ended generation"""
+        return None
+
+    def stream_usage(self, chunk: Dict[str, Any]) -> Dict[str, int]:
+        """Token usage carried by a response-stream chunk, if any"""
+        # Bedrock attaches the same invocation metrics to the last chunk of every family
+        metrics = chunk.get("amazon-bedrock-invocationMetrics")
+        if not metrics:
+            return {}
+        usage = {
+            "input_tokens": metrics.get("inputTokenCount", 0),
+            "output_tokens": metrics.get("outputTokenCount", 0)
+        }
+        if "cacheReadInputTokenCount" in metrics or "cacheWriteInputTokenCount" in metrics:
+            usage["cache_read_tokens"] = metrics.get("cacheReadInputTokenCount", 0)
+            usage["cache_write_tokens"] = metrics.get("cacheWriteInputTokenCount", 0)
+        return usage
+
+
+def _with_system(prompt: str, system: Optional[str]) -> str:
+    """Inline the system text for families without a system field"""
+    return f"{system}\n\n{prompt}" if system else prompt
+
+
+class NovaAdapter(ModelAdapter):
+    family = "nova"
+
+    def build_body(self, prompt: str, max_tokens: int, temperature: float, system: Optional[str] = None,
+                   cache_system: bool = False, stop_sequences: Optional[List[str]] = None) -> Dict[str, Any]:
+        body = {
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [{"text": prompt}]
+                }
+            ],
+            "inferenceConfig": {
+                "maxTokens": max_tokens,
+                "temperature": temperature
+            }
+        }
+        if system:
+            body["system"] = [{"text": system}]
+            if cache_system:
+                body["system"].append({"cachePoint": {"type": "default"}})
+        if stop_sequences:
+            body["inferenceConfig"]["stopSequences"] = stop_sequences
+        return body
+
+    def parse_response(self, body: Dict[str, Any]) -> str:
+        return body['output']['message']['content'][0]['text']
+
+    def decode_stream_chunk(self, chunk: Dict[str, Any]) -> str:
+        return chunk.get("contentBlockDelta", {}).get("delta", {}).get("text", "")
+
+    def truncated(self, body: Dict[str, Any]) -> bool:
+        return body.get("stopReason") == "max_tokens"
+
+    def stream_truncated(self, chunk: Dict[str, Any]) -> bool:
+        return chunk.get("messageStop", {}).get("stopReason") == "max_tokens"
+
+    # Nova doesn't say which sequence matched, so with several the first is assumed
+    def matched_stop_sequence(self, body: Dict[str, Any], stop_sequences: List[str]) -> Optional[str]:
+        return stop_sequences[0] if stop_sequences and body.get("stopReason") == "stop_sequence" else None
+
+    def stream_matched_stop_sequence(self, chunk: Dict[str, Any], stop_sequences: List[str]) -> Optional[str]:
+        stop_reason = chunk.get("messageStop", {}).get("stopReason")
+        return stop_sequences[0] if stop_sequences and stop_reason == "stop_sequence" else None
+
+    def extract_usage(self, body: Dict[str, Any]) -> Dict[str, int]:
+        usage = body.get("usage", {})
+        return {
+            "input_tokens": usage.get("inputTokens", 0),
+            "output_tokens": usage.get("outputTokens", 0),
+            "cache_read_tokens": usage.get("cacheReadInputTokenCount", 0),
+            "cache_write_tokens": usage.get("cacheWriteInputTokenCount", 0)
+        } if usage else {}
+
+
+class ClaudeAdapter(ModelAdapter):
+    family = "claude"
+
+    def build_body(self, prompt: str, max_tokens: int, temperature: float, system: Optional[str] = None,
+                   cache_system: bool = False, stop_sequences: Optional[List[str]] = None) -> Dict[str, Any]:
+        body = {
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "anthropic_version": "bedrock-2023-05-31"
+        }
+        if system:
+            block = {"type": "text", "text": system}
+            if cache_system:
+                block["cache_control"] = {"type": "ephemeral"}
+            body["system"] = [block]
+        if stop_sequences:
+            body["stop_sequences"] = stop_sequences
+        return body
+
+    def parse_response(self, body: Dict[str, Any]) -> str:
+        return body['content'][0]['text']
+
+    def decode_stream_chunk(self, chunk: Dict[str, Any]) -> str:
+        if chunk.get("type") == "content_block_delta":
+            return chunk["delta"].get("text", "")
+        return ""
+
+    def truncated(self, body: Dict[str, Any]) -> bool:
+        return body.get("stop_reason") == "max_tokens"
+
+    def stream_truncated(self, chunk: Dict[str, Any]) -> bool:
+        return chunk.get("type") == "message_delta" and chunk.get("delta", {}).get("stop_reason") == "max_tokens"
+
+    def matched_stop_sequence(self, body: Dict[str, Any], stop_sequences: List[str]) -> Optional[str]:
+        return body.get("stop_sequence") if body.get("stop_reason") == "stop_sequence" else None
+
+    def stream_matched_stop_sequence(self, chunk: Dict[str, Any], stop_sequences: List[str]) -> Optional[str]:
+        if chunk.get("type") != "message_delta" or chunk.get("delta", {}).get("stop_reason") != "stop_sequence":
+            return None
+        return chunk["delta"].get("stop_sequence")
+
+    def extract_usage(self, body: Dict[str, Any]) -> Dict[str, int]:
+        usage = body.get("usage", {})
+        return {
+            "input_tokens": usage.get("input_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0),
+            "cache_read_tokens": usage.get("cache_read_input_tokens", 0),
+            "cache_write_tokens": usage.get("cache_creation_input_tokens", 0)
+        } if usage else {}
+
+
+class LlamaAdapter(ModelAdapter):
+    family = "llama"
+
+    def build_body(self, prompt: str, max_tokens: int, temperature: float, system: Optional[str] = None,
+                   cache_system: bool = False, stop_sequences: Optional[List[str]] = None) -> Dict[str, Any]:
+        # Llama on Bedrock has no stop sequence parameter
+        return {
+            "prompt": _with_system(prompt, system),
+            "max_gen_len": max_tokens,
+            "temperature": temperature
+        }
+
+    def parse_response(self, body: Dict[str, Any]) -> str:
+        return body['generation']
+
+    def decode_stream_chunk(self, chunk: Dict[str, Any]) -> str:
+        return chunk.get("generation", "")
+
+    def truncated(self, body: Dict[str, Any]) -> bool:
+        return body.get("stop_reason") == "length"
+
+    def stream_truncated(self, chunk: Dict[str, Any]) -> bool:
+        return chunk.get("stop_reason") == "length"
+
+    def extract_usage(self, body: Dict[str, Any]) -> Dict[str, int]:
+        if "prompt_token_count" not in body:
+            return {}
+        return {
+            "input_tokens": body.get("prompt_token_count", 0),
+            "output_tokens": body.get("generation_token_count", 0)
+        }
+
+
+class TitanAdapter(ModelAdapter):
+    family = "titan"
+
+    def build_body(self, prompt: str, max_tokens: int, temperature: float, system: Optional[str] = None,
+                   cache_system: bool = False, stop_sequences: Optional[List[str]] = None) -> Dict[str, Any]:
+        # Titan only accepts a fixed set of stop sequences, so arbitrary ones are not sent
+        return {
+            "inputText": _with_system(prompt, system),
+            "textGenerationConfig": {
+                "maxTokenCount": max_tokens,
+                "temperature": temperature,
+                "topP": 0.9
+            }
+        }
+
+    def parse_response(self, body: Dict[str, Any]) -> str:
+        return body['results'][0]['outputText']
+
+    def decode_stream_chunk(self, chunk: Dict[str, Any]) -> str:
+        return chunk.get("outputText", "")
+
+    def truncated(self, body: Dict[str, Any]) -> bool:
+        return any(r.get("completionReason") == "LENGTH" for r in body.get("results", []))
+
+    def stream_truncated(self, chunk: Dict[str, Any]) -> bool:
+        return chunk.get("completionReason") == "LENGTH"
+
+    def extract_usage(self, body: Dict[str, Any]) -> Dict[str, int]:
+        if "inputTextTokenCount" not in body:
+            return {}
+        return {
+            "input_tokens": body.get("inputTextTokenCount", 0),
+            "output_tokens": sum(r.get("tokenCount", 0) for r in body.get("results", []))
+        }
+
+
+class CohereAdapter(ModelAdapter):
+    family = "cohere"
+
+    def build_body(self, prompt: str, max_tokens: int, temperature: float, system: Optional[str] = None,
+                   cache_system: bool = False, stop_sequences: Optional[List[str]] = None) -> Dict[str, Any]:
+        # Cohere reports a stop sequence match as an ordinary COMPLETE, so a matched sequence could
+        # neither be put back nor credited; generation ends on its own or client-side instead
+        return {
+            "prompt": _with_system(prompt, system),
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "p": 0.9
+        }
+
+    def parse_response(self, body: Dict[str, Any]) -> str:
+        return body['generations'][0]['text']
+
+    def decode_stream_chunk(self, chunk: Dict[str, Any]) -> str:
+        if "generations" in chunk:
+            return chunk["generations"][0].get("text", "")
+        return chunk.get("text", "")
+
+    def truncated(self, body: Dict[str, Any]) -> bool:
+        return any(g.get("finish_reason") == "MAX_TOKENS" for g in body.get("generations", []))
+
+    def stream_truncated(self, chunk: Dict[str, Any]) -> bool:
+        return chunk.get("finish_reason") == "MAX_TOKENS"
+
+
+# Model id prefix -> adapter, checked in order
+_ADAPTERS: List[Tuple[str, ModelAdapter]] = [
+    ("amazon.nova", NovaAdapter()),
+    ("anthropic.claude", ClaudeAdapter()),
+    ("meta.llama", LlamaAdapter()),
+    ("amazon.titan", TitanAdapter()),
+    ("cohere.command", CohereAdapter()),
+]
+
+
+def register_adapter(prefix: str, adapter: ModelAdapter) -> None:
+    """Register an adapter for model ids starting with ``prefix``"""
+    _ADAPTERS.insert(0, (prefix, adapter))
+    get_adapter.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def supports_prompt_cache(model_id: str) -> bool:
+    """Whether Bedrock accepts a prompt-cache checkpoint for this model id"""
+    return model_id.startswith(PROMPT_CACHE_MODEL_PREFIXES)
+
+
+@lru_cache(maxsize=None)
+def get_adapter(model_id: str) -> ModelAdapter:
+    """Resolve the adapter for a model id; resolved once per id and cached"""
+    for prefix, adapter in _ADAPTERS:
+        if model_id.startswith(prefix):
+            return adapter
+    raise ValueError(f"Unsupported model: {model_id}")
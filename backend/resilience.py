@@ -0,0 +1,207 @@
+"""
+Retries and circuit breaking for Bedrock calls
+Retryable failures are retried with decorrelated jitter; a per-model breaker stops calling a model that keeps failing
+"""
+
+import asyncio
+import os
+import random
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, Iterator
+
+from botocore.exceptions import ConnectionClosedError, ConnectionError, ReadTimeoutError
+from loguru import logger
+
+from concurrency import is_throttling_error
+from deadline import fits_deadline
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_MS = float(os.getenv("RETRY_BASE_DELAY_MS", "100"))
+RETRY_MAX_DELAY_MS = float(os.getenv("RETRY_MAX_DELAY_MS", "2000"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "30"))
+
+RETRYABLE_ERROR_CODES = {
+    "throttlingexception",
+    "serviceunavailableexception",
+    "internalserverexception",
+    "modeltimeoutexception",
+    "modelnotreadyexception",
+    "modelstreamerrorexception",
+}
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """True for transient Bedrock and network failures worth another attempt"""
+    if isinstance(error, (ConnectionError, ConnectionClosedError, ReadTimeoutError)):
+        return True
+    response = getattr(error, "response", None) or {}
+    return response.get("Error", {}).get("Code", "").lower() in RETRYABLE_ERROR_CODES
+
+
+def backoff_delays(attempts: int = RETRY_MAX_ATTEMPTS, base_ms: float = RETRY_BASE_DELAY_MS,
+                   cap_ms: float = RETRY_MAX_DELAY_MS) -> Iterator[float]:
+    """Sleep times in seconds between attempts, using decorrelated jitter"""
+    delay = base_ms
+    for _ in range(attempts - 1):
+        delay = min(cap_ms, random.uniform(base_ms, delay * 3))
+        yield delay / 1000
+
+
+async def sleep_before_retry(model_id: str, attempt: int, delay: float, error: Exception) -> None:
+    logger.warning(f"Retrying {model_id} in {delay * 1000:.0f}ms after attempt {attempt} failed: {str(error)}")
+    await asyncio.sleep(delay)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit breaker is open"""
+
+    def __init__(self, model_id: str):
+        super().__init__(f"Circuit breaker open for {model_id}")
+        self.model_id = model_id
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open trial after a cooldown"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, model_id: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 cooldown_seconds: float = BREAKER_COOLDOWN_SECONDS):
+        self.model_id = model_id
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self.short_circuited = 0
+        self._trial_in_flight = False
+
+    def is_open(self) -> bool:
+        """True while calls should be skipped; does not consume the half-open trial"""
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at < self.cooldown_seconds
+        return self.state == self.HALF_OPEN and self._trial_in_flight
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now; after the cooldown, lets a single trial through"""
+        if self.state == self.OPEN and not self.is_open():
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                self.short_circuited += 1
+                return False
+            self._trial_in_flight = True
+            return True
+        if self.state == self.OPEN:
+            self.short_circuited += 1
+            return False
+        return True
+
+    def record_success(self) -> None:
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit breaker closed for {self.model_id}")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"Circuit breaker opened for {self.model_id} "
+                               f"after {self.consecutive_failures} consecutive failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release_trial(self) -> None:
+        """Give back a half-open trial that ended without an outcome (e.g. cancelled)"""
+        self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "short_circuited": self.short_circuited
+        }
+
+
+class ModelBreakers:
+    """One circuit breaker per Bedrock model id"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self.fallbacks_served = 0
+
+    def get(self, model_id: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model_id)
+        if breaker is None:
+            breaker = self._breakers[model_id] = CircuitBreaker(model_id)
+        return breaker
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breakers": {model_id: breaker.stats() for model_id, breaker in self._breakers.items()},
+            "fallbacks_served": self.fallbacks_served
+        }
+
+
+# Global breakers
+model_breakers = ModelBreakers()
+
+
+async def resilient_stream(model_id: str, attempt: Callable[[], AsyncIterator[Any]]) -> AsyncGenerator[Any, None]:
+    """Yield the items of ``attempt()`` under the model's circuit breaker, retrying transient failures.
+
+    A failed attempt is started over only while it has yielded nothing and
+    the backoff still fits the request's deadline.  Raises CircuitOpenError
+    without calling ``attempt`` while the breaker is open.
+    """
+    breaker = model_breakers.get(model_id)
+    if not breaker.allow():
+        raise CircuitOpenError(model_id)
+
+    try:
+        delays = backoff_delays()
+        attempt_number = 1
+        while True:
+            yielded = False
+            try:
+                async for item in attempt():
+                    yielded = True
+                    yield item
+                break
+            except Exception as e:
+                delay = next(delays, None) if not yielded and is_retryable_error(e) else None
+                if delay is None or not fits_deadline(delay):
+                    raise
+                await sleep_before_retry(model_id, attempt_number, delay, e)
+                attempt_number += 1
+        breaker.record_success()
+    except Exception as e:
+        # Throttling is the limiter's signal; the breaker only counts the model being unavailable
+        if is_retryable_error(e) and not is_throttling_error(e):
+            breaker.record_failure()
+        else:
+            breaker.release_trial()
+        raise
+    except BaseException:
+        breaker.release_trial()
+        raise
+
+
+async def resilient_call(model_id: str, attempt: Callable[[], Awaitable[Any]]) -> Any:
+    """``resilient_stream`` for a call with a single result"""
+    async def once() -> AsyncGenerator[Any, None]:
+        yield await attempt()
+
+    # Drained rather than returned from, so the breaker sees the call finish
+    results = [result async for result in resilient_stream(model_id, once)]
+    return results[0]
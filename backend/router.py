@@ -0,0 +1,96 @@
+"""
+Latency- and cost-aware model routing for requests with model "auto"
+Picks the cheapest model predicted to meet the latency SLO, based on live call health
+Models whose circuit breaker is open or whose concurrency limit has no room are passed over while others can serve
+"""
+
+import os
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from loguru import logger
+
+from concurrency import ModelLimiters, model_limiters
+from metrics import ModelHealth, linear_tail_prediction, model_health
+from resilience import ModelBreakers, model_breakers
+
+AUTO_MODEL = "auto"
+ROUTING_LATENCY_SLO_MS = float(os.getenv("ROUTING_LATENCY_SLO_MS", "8000"))
+ROUTING_MAX_ERROR_RATE = float(os.getenv("ROUTING_MAX_ERROR_RATE", "0.2"))
+ROUTING_MIN_SAMPLES = int(os.getenv("ROUTING_MIN_SAMPLES", "5"))
+ROUTING_EXPECTED_OUTPUT_TOKENS = int(os.getenv("ROUTING_EXPECTED_OUTPUT_TOKENS", "600"))
+ROUTING_TAIL_PERCENTILE = 90
+
+
+def _predict_latency_ms(health: ModelHealth, input_tokens: int) -> float:
+    """Tail latency for a prompt of ``input_tokens``.
+
+    Latency is fitted against input tokens over the recent calls, so long
+    prompts are penalized on models where latency grows with prompt size.
+    """
+    return max(0.0, linear_tail_prediction(list(health.sized_latency), input_tokens, ROUTING_TAIL_PERCENTILE))
+
+
+class ModelRouter:
+    """Routes to the cheapest healthy model expected to meet the latency SLO"""
+
+    def __init__(self, models: Dict[str, str], cost_fn: Callable[[str, int, int], float],
+                 slo_ms: float = ROUTING_LATENCY_SLO_MS, max_error_rate: float = ROUTING_MAX_ERROR_RATE,
+                 min_samples: int = ROUTING_MIN_SAMPLES, history: int = 200,
+                 breakers: ModelBreakers = model_breakers, limiters: ModelLimiters = model_limiters):
+        self.models = models
+        self.cost_fn = cost_fn
+        self.slo_ms = slo_ms
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.breakers = breakers
+        self.limiters = limiters
+        self.decisions: Deque[Dict[str, Any]] = deque(maxlen=history)
+
+    def _candidate(self, alias: str, input_tokens: int, output_tokens: int) -> Dict[str, Any]:
+        model_id = self.models[alias]
+        health = model_health[model_id]
+        known = len(health.sized_latency) >= self.min_samples
+        # Models without enough history are assumed to just meet the SLO so they get sampled
+        predicted = _predict_latency_ms(health, input_tokens) if known else self.slo_ms
+        error_rate = health.error_rate()
+        return {
+            "model": alias,
+            "predicted_latency_ms": round(predicted, 1),
+            "error_rate": round(error_rate, 4),
+            "estimated_cost": self.cost_fn(model_id, input_tokens, output_tokens),
+            "samples": len(health.sized_latency),
+            "healthy": error_rate <= self.max_error_rate,
+            # A call to it now would be short-circuited or turned away
+            "available": not self.breakers.get(model_id).is_open() and self.limiters.get(model_id).has_room(),
+            "meets_slo": predicted <= self.slo_ms
+        }
+
+    def choose(self, input_tokens: int, max_tokens: Optional[int] = None) -> str:
+        """Pick a model alias for a prompt of ``input_tokens`` and record the decision"""
+        output_tokens = min(max_tokens or ROUTING_EXPECTED_OUTPUT_TOKENS, ROUTING_EXPECTED_OUTPUT_TOKENS)
+        candidates = [self._candidate(alias, input_tokens, output_tokens) for alias in self.models]
+
+        available = [c for c in candidates if c["available"]] or candidates
+        healthy = [c for c in available if c["healthy"]] or available
+        within_slo = [c for c in healthy if c["meets_slo"]]
+        if within_slo:
+            chosen = min(within_slo, key=lambda c: (c["estimated_cost"], c["predicted_latency_ms"]))
+            reason = "cheapest model within latency SLO"
+        else:
+            chosen = min(healthy, key=lambda c: (c["predicted_latency_ms"], c["estimated_cost"]))
+            reason = "no model within latency SLO, fastest predicted"
+
+        self.decisions.append({
+            "timestamp": datetime.now().isoformat(),
+            "chosen": chosen["model"],
+            "reason": reason,
+            "input_tokens": input_tokens,
+            "candidates": candidates
+        })
+        logger.info(f"Routed {input_tokens}-token prompt to {chosen['model']}: {reason}")
+        return chosen["model"]
+
+    def recent_decisions(self, limit: int = 50) -> List[Dict[str, Any]]:
+        return list(self.decisions)[-limit:][::-1]
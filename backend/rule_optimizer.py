@@ -0,0 +1,102 @@
+"""
+Rule-based prompt optimizer: the domain classifier and enhancement rules of the enhanced Lambda
+Produces a usable optimized prompt in microseconds when the model can't be called
+"""
+
+from typing import Dict, List, Tuple
+
+class AdvancedPromptOptimizer:
+    def __init__(self):
+        self.optimization_patterns = self._load_optimization_patterns()
+        self.domain_classifiers = self._load_domain_classifiers()
+    
+    def _load_optimization_patterns(self) -> Dict:
+        """Load proven optimization patterns for different prompt types"""
+        return {
+            'role_assignment': {
+                'business': 'Act as a senior business strategist with 15+ years of experience in [INDUSTRY]',
+                'technical': 'Act as a senior software engineer specializing in [TECHNOLOGY]',
+                'creative': 'Act as a professional creative director with expertise in [DOMAIN]',
+                'analytical': 'Act as a senior data scientist with expertise in [FIELD]'
+            },
+            'structure_templates': {
+                'analysis': '1) Current situation analysis, 2) Key findings, 3) Recommendations, 4) Implementation steps',
+                'creation': '1) Requirements gathering, 2) Concept development, 3) Detailed execution, 4) Quality review',
+                'problem_solving': '1) Problem definition, 2) Root cause analysis, 3) Solution options, 4) Implementation plan'
+            },
+            'output_formats': {
+                'executive_summary': 'Format as executive summary with: Executive Overview, Key Findings, Recommendations, Next Steps',
+                'technical_spec': 'Format as technical specification with: Requirements, Architecture, Implementation, Testing',
+                'creative_brief': 'Format as creative brief with: Objective, Target Audience, Key Messages, Deliverables'
+            }
+        }
+    
+    def _load_domain_classifiers(self) -> Dict:
+        """Load domain classification patterns"""
+        return {
+            'business': ['strategy', 'marketing', 'sales', 'finance', 'management'],
+            'technical': ['code', 'programming', 'software', 'development', 'engineering'],
+            'creative': ['design', 'content', 'writing', 'creative', 'brand'],
+            'analytical': ['data', 'analysis', 'research', 'statistics', 'insights']
+        }
+    
+    def classify_domain(self, prompt: str) -> str:
+        """Classify the prompt domain for targeted optimization"""
+        prompt_lower = prompt.lower()
+        domain_scores = {}
+        
+        for domain, keywords in self.domain_classifiers.items():
+            score = sum(1 for keyword in keywords if keyword in prompt_lower)
+            domain_scores[domain] = score
+        
+        return max(domain_scores, key=domain_scores.get) if max(domain_scores.values()) > 0 else 'general'
+    
+    def enhance(self, original_prompt: str, domain: str) -> Tuple[str, List[str]]:
+        """Generate enhanced prompt and the list of improvements applied"""
+        enhanced = original_prompt
+        improvements = []
+        
+        # Add role assignment if missing
+        if not any(phrase in enhanced.lower() for phrase in ['act as', 'you are', 'role of']):
+            role_template = self.optimization_patterns['role_assignment'].get(domain, 
+                self.optimization_patterns['role_assignment']['business'])
+            enhanced = f"{role_template}. {enhanced}"
+            improvements.append("Added expert role context")
+        
+        # Add structure if missing
+        if not any(char in enhanced for char in ['1)', '2)', '•', '-', ':']):
+            structure = self.optimization_patterns['structure_templates'].get(domain,
+                self.optimization_patterns['structure_templates']['analysis'])
+            enhanced += f"\n\nStructure your response with: {structure}"
+            improvements.append("Added response structure")
+        
+        # Add output format if missing
+        if 'format' not in enhanced.lower():
+            format_spec = self.optimization_patterns['output_formats'].get(f"{domain}_spec",
+                self.optimization_patterns['output_formats']['executive_summary'])
+            enhanced += f"\n\n{format_spec}"
+            improvements.append("Added output format specification")
+        
+        # Add specificity enhancements
+        if len(original_prompt.split()) < 10:
+            enhanced += "\n\nProvide specific, detailed, and actionable information with concrete examples."
+            improvements.append("Enhanced specificity and detail requirements")
+        
+        # Add quality assurance
+        enhanced += "\n\nEnsure your response is professional, well-organized, and directly addresses all requirements."
+        improvements.append("Added quality assurance guidelines")
+        
+        return enhanced, improvements
+
+
+rule_optimizer = AdvancedPromptOptimizer()
+
+
+def rule_based_optimization(description: str, context: str = "") -> Dict:
+    """Optimize a request without a model call, in the shape of the model's JSON answer"""
+    original_prompt = f"{description}\n\n{context}" if context else description
+    domain = rule_optimizer.classify_domain(original_prompt)
+    optimized_prompt, improvements = rule_optimizer.enhance(original_prompt, domain)
+    reasoning_trace = [f"Step 1: Analysis - Classified as a {domain} prompt (rule-based optimizer)"]
+    reasoning_trace += [f"Step {i + 2}: {improvement}" for i, improvement in enumerate(improvements)]
+    return {"reasoning_trace": reasoning_trace, "optimized_prompt": optimized_prompt}
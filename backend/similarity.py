@@ -0,0 +1,120 @@
+"""
+Near-duplicate lookup for cached optimizations
+MinHash signatures over character shingles, bucketed with LSH so a lookup compares only a few candidates
+"""
+
+import hashlib
+import os
+import random
+import re
+import unicodedata
+from typing import Dict, List, Optional, Set, Tuple
+
+CACHE_SIMILARITY_ENABLED = os.getenv("CACHE_SIMILARITY_ENABLED", "false").lower() == "true"
+CACHE_SIMILARITY_THRESHOLD = float(os.getenv("CACHE_SIMILARITY_THRESHOLD", "0.9"))
+
+SIGNATURE_SIZE = 64
+LSH_BANDS = 16  # 4 rows per band: pairs from about 0.5 Jaccard upward share a bucket
+SHINGLE_SIZE = 4
+
+_WHITESPACE = re.compile(r"\s+")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_EDGE_PUNCTUATION = ".,;:!?…\"'`()[]{}"
+_MERSENNE_PRIME = (1 << 61) - 1
+# Fixed seed: signatures must agree between processes and restarts
+_rng = random.Random(20240101)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(_MERSENNE_PRIME)) for _ in range(SIGNATURE_SIZE)]
+
+
+def canonicalize(text: str) -> str:
+    """Form of a prompt that ignores case, runs of whitespace and punctuation at either end"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _WHITESPACE.sub(" ", text).strip().strip(_EDGE_PUNCTUATION + " ")
+
+
+def _shingle_hashes(text: str) -> Set[int]:
+    text = _WHITESPACE.sub(" ", _PUNCTUATION.sub("", canonicalize(text))).strip()
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+    return {int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles}
+
+
+def signature(text: str) -> Tuple[int, ...]:
+    """MinHash signature; the share of equal positions estimates the Jaccard similarity of two texts"""
+    hashes = _shingle_hashes(text)
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def _bands(sig: Tuple[int, ...]) -> List[int]:
+    rows = SIGNATURE_SIZE // LSH_BANDS
+    return [hash(sig[i:i + rows]) for i in range(0, SIGNATURE_SIZE, rows)]
+
+
+def estimated_similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    return sum(x == y for x, y in zip(a, b)) / SIGNATURE_SIZE
+
+
+class NearDuplicateIndex:
+    """LSH index of cache keys by prompt text, partitioned by ``scope`` (the model)"""
+
+    def __init__(self, threshold: float = CACHE_SIMILARITY_THRESHOLD):
+        self.threshold = threshold
+        self._signatures: Dict[str, Tuple[str, Tuple[int, ...]]] = {}
+        self._buckets: Dict[Tuple[str, int, int], Set[str]] = {}
+        self.near_hits = 0
+        self.near_misses = 0
+        self._similarity_total = 0.0
+
+    def add(self, key: str, scope: str, text: str) -> None:
+        self.remove(key)
+        sig = signature(text)
+        self._signatures[key] = (scope, sig)
+        for band, value in enumerate(_bands(sig)):
+            self._buckets.setdefault((scope, band, value), set()).add(key)
+
+    def remove(self, key: str) -> None:
+        indexed = self._signatures.pop(key, None)
+        if indexed is None:
+            return
+        scope, sig = indexed
+        for band, value in enumerate(_bands(sig)):
+            bucket = self._buckets.get((scope, band, value))
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[(scope, band, value)]
+
+    def query(self, scope: str, text: str) -> Optional[Tuple[str, float]]:
+        """Most similar indexed key at or above the threshold, with its estimated similarity"""
+        sig = signature(text)
+        candidates: Set[str] = set()
+        for band, value in enumerate(_bands(sig)):
+            candidates |= self._buckets.get((scope, band, value), set())
+
+        best = None
+        for key in candidates:
+            similarity = estimated_similarity(sig, self._signatures[key][1])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+    def record(self, similarity: Optional[float]) -> None:
+        """Account a lookup that served a near duplicate (``similarity``) or found none (None)"""
+        if similarity is None:
+            self.near_misses += 1
+        else:
+            self.near_hits += 1
+            self._similarity_total += similarity
+
+    def clear(self) -> None:
+        self._signatures.clear()
+        self._buckets.clear()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": True,
+            "threshold": self.threshold,
+            "indexed": len(self._signatures),
+            "near_hits": self.near_hits,
+            "near_misses": self.near_misses,
+            "mean_similarity": round(self._similarity_total / self.near_hits, 4) if self.near_hits else None
+        }
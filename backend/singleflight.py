@@ -0,0 +1,87 @@
+"""
+Single-flight coalescing of identical in-flight requests
+The first caller for a key does the work; concurrent callers with the same key await its result
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from loguru import logger
+
+
+class SingleFlight:
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def join(self, key: str) -> Tuple[asyncio.Future, bool]:
+        """Join the flight for ``key``; returns ``(future, is_leader)``.
+
+        The leader must finish the flight with ``resolve`` or ``reject``.
+        """
+        future = self._flights.get(key)
+        if future is not None:
+            self.followers += 1
+            logger.info(f"Coalesced request for key: {key[:8]}...")
+            return future, False
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark failures as retrieved so a flight nobody joined doesn't log a warning
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._flights[key] = future
+        self.leaders += 1
+        return future, True
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    def resolve(self, key: str, result: Any) -> None:
+        future = self._flights.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def reject(self, key: str, error: BaseException) -> None:
+        future = self._flights.pop(key, None)
+        if future is None or future.done():
+            return
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            # The leader went away; followers start a new flight instead of failing
+            future.cancel()
+        else:
+            future.set_exception(error)
+
+    async def wait(self, key: str, future: asyncio.Future, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await a flight as a follower, taking over if the leader was cancelled"""
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+        return await self.do(key, fn)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run ``fn`` once per key no matter how many callers are waiting on it"""
+        future, leader = self.join(key)
+        if not leader:
+            return await self.wait(key, future, fn)
+
+        try:
+            result = await fn()
+        except BaseException as e:
+            self.reject(key, e)
+            raise
+        self.resolve(key, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Get coalescing statistics"""
+        return {
+            "in_flight": len(self._flights),
+            "upstream_calls": self.leaders,
+            "calls_saved": self.followers
+        }
+
+
+# Global coalescing group for optimization requests
+optimization_flights = SingleFlight()
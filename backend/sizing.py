@@ -0,0 +1,93 @@
+"""
+Predictive max_tokens sizing
+Learns output length per (model, domain) from finished calls and asks for a tight but safe budget
+"""
+
+import math
+import os
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+from loguru import logger
+
+from metrics import linear_tail_prediction
+
+SIZING_ENABLED = os.getenv("SIZING_ENABLED", "true").lower() == "true"
+SIZING_MIN_SAMPLES = int(os.getenv("SIZING_MIN_SAMPLES", "20"))
+SIZING_PERCENTILE = float(os.getenv("SIZING_PERCENTILE", "99"))
+SIZING_HEADROOM = float(os.getenv("SIZING_HEADROOM", "1.2"))
+SIZING_MIN_TOKENS = int(os.getenv("SIZING_MIN_TOKENS", "256"))
+SIZING_RETRY_MULTIPLIER = 2
+
+
+class TokenBudgetPredictor:
+    """Per (model id, domain) history of (local input count, output tokens) from calls that finished on their own"""
+
+    def __init__(self, enabled: bool = SIZING_ENABLED, min_samples: int = SIZING_MIN_SAMPLES,
+                 percentile: float = SIZING_PERCENTILE, headroom: float = SIZING_HEADROOM,
+                 min_tokens: int = SIZING_MIN_TOKENS, window: int = 500):
+        self.enabled = enabled
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_tokens = min_tokens
+        self.window = window
+        self._samples: Dict[Tuple[str, str], Deque[Tuple[int, int]]] = {}
+        self.sized = 0
+        self.tokens_not_reserved = 0
+        self.truncations = 0
+        self.retry_tokens = 0
+
+    def budget(self, model_id: str, domain: str, input_tokens: int, ceiling: int) -> int:
+        """``max_tokens`` to request, never above the caller's ``ceiling``"""
+        samples = self._samples.get((model_id, domain))
+        if not self.enabled or samples is None or len(samples) < self.min_samples:
+            return ceiling
+        predicted = linear_tail_prediction(samples, input_tokens, self.percentile) * self.headroom
+        budget = min(ceiling, max(self.min_tokens, math.ceil(predicted)))
+        self.sized += 1
+        self.tokens_not_reserved += ceiling - budget
+        return budget
+
+    def next_budget(self, budget: int, ceiling: int) -> int:
+        """Larger budget for a retry after ``budget`` was exhausted"""
+        return min(ceiling, budget * SIZING_RETRY_MULTIPLIER)
+
+    def record(self, model_id: str, domain: str, input_tokens: int, output_tokens: int) -> None:
+        """Add a call that stopped on its own; truncated outputs would understate the length.
+
+        ``input_tokens`` must be the same local count ``budget`` is given, or
+        the fit is skewed by the gap between local and provider counts.
+        """
+        key = (model_id, domain)
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append((input_tokens, output_tokens))
+
+    def record_truncation(self, model_id: str, domain: str, budget: int, output_tokens: int) -> None:
+        """Account a call that ran out of budget and had to be repeated"""
+        self.truncations += 1
+        self.retry_tokens += output_tokens
+        logger.info(f"{model_id} output for a {domain} prompt hit its {budget}-token budget, retrying")
+
+    def stats(self) -> Dict[str, Any]:
+        predictions = {}
+        for (model_id, domain), samples in self._samples.items():
+            predictions[f"{model_id}/{domain}"] = {
+                "samples": len(samples),
+                "mean_output_tokens": round(sum(y for _, y in samples) / len(samples))
+            }
+        return {
+            "enabled": self.enabled,
+            "sized_requests": self.sized,
+            "tokens_not_reserved": self.tokens_not_reserved,
+            "truncations": self.truncations,
+            "truncation_rate": round(self.truncations / self.sized, 4) if self.sized else 0.0,
+            "retry_output_tokens": self.retry_tokens,
+            "models": predictions
+        }
+
+
+# Global max_tokens predictor
+token_budgets = TokenBudgetPredictor()
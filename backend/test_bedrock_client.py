@@ -0,0 +1,23 @@
+"""
+Tests for the async Bedrock invocation layer
+"""
+
+import asyncio
+
+from bedrock_client import BedrockInvoker
+from benchmark import FakeBedrockClient
+
+
+def test_invoker_built_outside_a_loop_bounds_calls_on_every_loop():
+    # Built like the module-level invoker in main.py, before any event loop runs
+    invoker = BedrockInvoker(client=FakeBedrockClient(latency=0.02), max_concurrency=1)
+    body = {"messages": [{"role": "user", "content": "hi"}]}
+
+    async def burst():
+        # More callers than slots, so some wait on the semaphore
+        return await asyncio.gather(*(invoker.invoke_model("m", body) for _ in range(3)))
+
+    for _ in range(2):
+        responses = asyncio.run(burst())
+        assert [response["content"][0]["text"] for response in responses] == [FakeBedrockClient().text] * 3
+    assert invoker.completed == 6 and invoker.in_flight == 0 and invoker.waiting == 0
@@ -0,0 +1,56 @@
+"""
+Tests for the bulk optimization CLI against a local Bedrock stub
+"""
+
+import asyncio
+import json
+
+from bedrock_client import BedrockInvoker
+from bulk_optimize import run_bulk
+from testing import StubBedrock
+
+
+def write_input(path, descriptions):
+    with open(path, "w") as f:
+        for i, description in enumerate(descriptions):
+            f.write(json.dumps({"id": f"item-{i}", "description": description}) + "\n")
+
+
+def run(tmp_path, stub, concurrency=4):
+    invoker = BedrockInvoker(client=stub, max_concurrency=16)
+    try:
+        return asyncio.run(run_bulk(
+            str(tmp_path / "in.jsonl"), str(tmp_path / "out.jsonl"), str(tmp_path / "out.checkpoint"),
+            concurrency=concurrency, invoker=invoker
+        ))
+    finally:
+        invoker.shutdown()
+
+
+def test_results_are_written_with_bounded_concurrency(tmp_path):
+    write_input(tmp_path / "in.jsonl", [f"prompt {i}" for i in range(20)])
+    stub = StubBedrock(latency=0.01)
+
+    assert run(tmp_path, stub, concurrency=4) == {"skipped": 0, "succeeded": 20, "failed": 0}
+    assert stub.peak <= 4
+
+    results = [json.loads(line) for line in open(tmp_path / "out.jsonl")]
+    assert sorted(r["id"] for r in results) == sorted(f"item-{i}" for i in range(20))
+    assert all(r["optimized_prompt"] == "ok" for r in results)
+    assert len(open(tmp_path / "out.checkpoint").read().split()) == 20
+
+
+def test_resume_skips_completed_items_and_retries_failures(tmp_path):
+    write_input(tmp_path / "in.jsonl", ["prompt 0", "bad prompt", "prompt 2"])
+    (tmp_path / "out.checkpoint").write_text("item-0\n")
+    stub = StubBedrock(latency=0.01)
+
+    assert run(tmp_path, stub) == {"skipped": 1, "succeeded": 1, "failed": 1}
+    assert not any("prompt 0" in prompt for prompt in stub.prompts)
+
+    write_input(tmp_path / "in.jsonl", ["prompt 0", "fixed prompt", "prompt 2"])
+    stub = StubBedrock(latency=0.01)
+
+    assert run(tmp_path, stub) == {"skipped": 2, "succeeded": 1, "failed": 0}
+    assert len(stub.prompts) == 1 and "fixed prompt" in stub.prompts[0]
+    assert [json.loads(line)["id"] for line in open(tmp_path / "out.jsonl")] == ["item-2", "item-1"]
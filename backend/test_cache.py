@@ -0,0 +1,185 @@
+"""
+Tests for the bounded prompt cache
+"""
+
+import asyncio
+import os
+import time
+
+import main
+from cache import ENTRY_OVERHEAD_BYTES, PromptCache
+from testing import result
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    cache = PromptCache(max_entries=2)
+    cache.set("a", "", "m", result("a"))
+    cache.set("b", "", "m", result("b"))
+    assert cache.get("a", "", "m") == result("a")
+
+    cache.set("c", "", "m", result("c"))
+
+    assert cache.get("b", "", "m") is None
+    assert cache.get("a", "", "m") == result("a")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_budget_is_enforced_and_large_results_compressed():
+    large = result("Be specific and concise. " * 200)
+    cache = PromptCache(max_bytes=3 * ENTRY_OVERHEAD_BYTES + 600, compress_min_bytes=1024)
+    for name in ["a", "b", "c", "d"]:
+        cache.set(name, "", "m", large)
+
+    stats = cache.stats()
+    assert stats["bytes"] <= cache.max_bytes
+    assert stats["total_entries"] == stats["compressed_entries"] < 4
+    assert cache.get("d", "", "m") == large
+
+    cache.set("huge", "", "m", result(os.urandom(5000).hex()))
+    assert cache.get("huge", "", "m") is None
+    assert cache.stats()["total_entries"] == stats["total_entries"]
+
+
+def test_expired_entries_are_reaped_a_batch_at_a_time():
+    cache = PromptCache(ttl_minutes=0, reap_batch=16, stale_minutes=0)
+    for i in range(40):
+        cache.set(str(i), "", "m", result(str(i)))
+
+    # Each set reaps up to 16 of the entries that expired before it
+    assert len(cache.cache) < 40
+    assert cache.get("39", "", "m") is None
+
+    stats = cache.stats()
+    assert stats["expired_entries"] + stats["total_entries"] == 40
+    while cache.cache:
+        cache.stats()
+    assert cache.stats()["expired_entries"] == 40
+
+
+def test_stale_entries_are_served_only_when_allowed():
+    cache = PromptCache(ttl_minutes=0, stale_minutes=1)
+    cache.set("a", "", "m", result("a"))
+
+    assert cache.get("a", "", "m") is None
+    assert asyncio.run(cache.lookup("a", "", "m", allow_stale=True)) == (result("a"), True)
+
+    cache.record_refresh(succeeded=True)
+    stats = cache.stats()
+    assert stats["stale_hits"] == 1 and stats["refreshes"] == 1 and stats["total_entries"] == 1
+
+
+def test_snapshot_restores_entries_lazily_with_their_ttls(tmp_path):
+    path = str(tmp_path / "cache.snapshot")
+    large = result("Be specific and concise. " * 200)
+    before = PromptCache(ttl_minutes=1, snapshot_path=path)
+    before.set("a", "", "m", large)
+    before.set("b", "", "m", result("b"))
+    before.set("gone", "", "m", result("gone"))
+    before.cache[before.key("gone", "", "m")].expires_at = 0
+    assert before.save_snapshot() == 2
+    before.close()
+
+    after = PromptCache(ttl_minutes=30, snapshot_path=path)
+    assert after.load_snapshot() == 2
+    assert not after.cache
+    assert after.get("a", "", "m") == large
+    assert after.get("gone", "", "m") is None
+    remaining = after.cache[after.key("a", "", "m")].fresh_until - time.monotonic()
+    assert 55 < remaining <= 60
+
+    # The entry never looked up is carried into the next snapshot
+    assert {key for key, _ in after.snapshot_entries()} == {after.key("a", "", "m"), after.key("b", "", "m")}
+    tiers = after.stats()["tiers"]["snapshot"]
+    assert tiers["loaded"] == 2 and tiers["hits"] == 1 and tiers["pending"] == 1
+    after.close()
+
+
+def test_truncated_snapshot_is_not_loaded(tmp_path):
+    path = str(tmp_path / "cache.snapshot")
+    before = PromptCache(snapshot_path=path)
+    for name in "abc":
+        before.set(name, "", "m", result(name))
+    before.save_snapshot()
+    before.close()
+    with open(path, "rb") as f:
+        saved = f.read()
+
+    # Cut inside the index, then inside the payloads
+    for length in (20, len(saved) - 5):
+        with open(path, "wb") as f:
+            f.write(saved[:length])
+        after = PromptCache(snapshot_path=path)
+        assert after.load_snapshot() == 0
+        assert after.stats()["tiers"]["snapshot"]["errors"] == 1
+        assert after.get("a", "", "m") is None
+        after.close()
+
+
+class CountingMap:
+    """Wraps a snapshot mapping, counting the payloads copied out of it"""
+
+    def __init__(self, mapped):
+        self.mapped = mapped
+        self.copies = 0
+
+    def __getitem__(self, index):
+        self.copies += 1
+        return self.mapped[index]
+
+    def close(self):
+        self.mapped.close()
+
+
+def test_snapshot_payloads_are_copied_only_when_written(tmp_path):
+    path = str(tmp_path / "cache.snapshot")
+    before = PromptCache(snapshot_path=path)
+    for name in "abc":
+        before.set(name, "", "m", result(name))
+    before.save_snapshot()
+    before.close()
+
+    after = PromptCache(snapshot_path=path)
+    after.load_snapshot()
+    mapped = after._snapshot._map = CountingMap(after._snapshot._map)
+    after.get("a", "", "m")
+    mapped.copies = 0
+
+    # Chosen on the event loop without touching the payloads, which the writer thread copies
+    entries = after.snapshot_entries()
+    assert mapped.copies == 0
+    assert after.save_snapshot(entries) == 3
+    assert mapped.copies == 2
+    after.close()
+
+
+class SlowSnapshotCache(PromptCache):
+    """Records when each snapshot write starts and finishes"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.writes = []
+
+    def save_snapshot(self, entries=None) -> int:
+        started = time.monotonic()
+        time.sleep(0.1)
+        self.writes.append((started, time.monotonic()))
+        return 0
+
+
+def test_shutdown_snapshot_waits_for_a_periodic_one_in_progress(monkeypatch, tmp_path):
+    cache = SlowSnapshotCache(snapshot_path=str(tmp_path / "cache.snapshot"))
+    monkeypatch.setattr(main, "prompt_cache", cache)
+    monkeypatch.setattr(main, "CACHE_SNAPSHOT_INTERVAL_SECONDS", 0)
+    monkeypatch.setattr(main, "snapshot_write", None)
+
+    async def run():
+        monkeypatch.setattr(main, "snapshot_task", asyncio.ensure_future(main.snapshot_periodically()))
+        while main.snapshot_write is None:
+            await asyncio.sleep(0.01)
+        await main.close_prompt_cache()
+
+    asyncio.run(run())
+
+    # The shutdown snapshot starts only once the periodic one has been written, so it lands last
+    periodic, final = cache.writes
+    assert final[0] >= periodic[1]
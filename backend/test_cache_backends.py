@@ -0,0 +1,124 @@
+"""
+Tests for the shared L2 cache stores
+"""
+
+import asyncio
+import fnmatch
+import sqlite3
+import time
+
+from cache import PromptCache
+from cache_backends import RedisBackend, SQLiteBackend, pack
+from testing import result
+
+
+class LocalRedis:
+    """In-process stand-in for the parts of redis-py the backend uses"""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        value, expires_at = self.values.get(key, (None, 0))
+        return value if time.time() < expires_at else None
+
+    def set(self, key, value, px):
+        self.values[key] = (value, time.time() + px / 1000)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+    def scan_iter(self, match):
+        return [key for key in self.values if fnmatch.fnmatch(key, match)]
+
+
+def test_workers_share_results_through_sqlite(tmp_path):
+    path = str(tmp_path / "l2.sqlite3")
+    worker_a = PromptCache(l2=SQLiteBackend(path))
+    worker_b = PromptCache(l2=SQLiteBackend(path))
+    large = result("Be specific. " * 200)
+
+    worker_a.set("write an email", "", "m", large)
+    worker_a._l2_writer.flush()
+
+    assert asyncio.run(worker_b.get_async("write an email", "", "m")) == large
+    assert worker_b.get("write an email", "", "m") == large
+    tiers = worker_b.stats()["tiers"]
+    assert tiers["l1"] == {"hits": 1, "misses": 1}
+    assert tiers["l2"]["hits"] == 1 and tiers["l2"]["backend"] == "sqlite"
+
+    assert worker_b.get("something else", "", "m") is None
+    assert worker_b.stats()["tiers"]["l2"]["misses"] == 1
+    worker_a.close()
+    worker_b.close()
+
+
+def test_sqlite_table_from_before_soft_ttls_is_migrated(tmp_path):
+    path = str(tmp_path / "l2.sqlite3")
+    expires_at = time.time() + 60
+    old = sqlite3.connect(path)
+    old.execute("CREATE TABLE prompt_cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)")
+    old.execute("INSERT INTO prompt_cache VALUES (?, ?, ?)", ("old", pack(b"{}", False), expires_at))
+    old.commit()
+    old.close()
+
+    store = SQLiteBackend(path)
+
+    assert store.get("old") == (b"{}", False, expires_at, expires_at)
+    store.set("new", b"{}", True, expires_at - 30, expires_at)
+    assert store.get("new") == (b"{}", True, expires_at - 30, expires_at)
+    # Opening an already migrated store leaves it as is
+    SQLiteBackend(path).close()
+    assert store.get("old") is not None
+    store.close()
+
+
+def test_redis_entries_keep_their_expiry_and_clear_removes_them():
+    client = LocalRedis()
+    writer = PromptCache(ttl_minutes=1, l2=RedisBackend(client=client))
+    writer.set("write an email", "", "m", result("ok"))
+    writer._l2_writer.flush()
+
+    reader = PromptCache(ttl_minutes=30, l2=RedisBackend(client=client))
+    assert reader.get("write an email", "", "m") == result("ok")
+    remaining = next(iter(reader.cache.values())).fresh_until - time.monotonic()
+    assert 55 < remaining <= 60
+
+    writer.clear()
+    assert client.values == {}
+    assert writer.stats()["tiers"]["l2"]["writes"] == 1
+    writer.close()
+    reader.close()
+
+
+class SlowRedis(LocalRedis):
+    def scan_iter(self, match):
+        time.sleep(0.2)
+        return super().scan_iter(match)
+
+
+def test_clearing_from_the_event_loop_leaves_it_free_while_l2_clears():
+    client = SlowRedis()
+    cache = PromptCache(l2=RedisBackend(client=client))
+    cache.set("write an email", "", "m", result("ok"))
+
+    async def clear_while_ticking():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        await cache.clear_async()
+        ticker.cancel()
+        return ticks
+
+    assert asyncio.run(clear_while_ticking()) > 5
+    # The pending write was flushed before the clear, so nothing is left behind
+    assert not cache.cache and client.values == {}
+    assert cache.get("write an email", "", "m") is None
+    cache.close()
@@ -0,0 +1,142 @@
+"""
+Tests for the adaptive per-model concurrency limiter
+"""
+
+import asyncio
+import itertools
+
+import pytest
+from botocore.exceptions import ClientError
+
+from concurrency import FAILED, SUCCESS, THROTTLED, AdaptiveLimiter, LimitExceeded, is_throttling_error
+
+_ids = itertools.count()
+
+
+def limiter(**kwargs) -> AdaptiveLimiter:
+    # A model id without latency history, so throttles back off at most once per LIMITER_BACKOFF_COOLDOWN_MS
+    return AdaptiveLimiter(f"test-limiter-{next(_ids)}", **kwargs)
+
+
+def client_error(code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, "InvokeModel")
+
+
+def hold(lim: AdaptiveLimiter, calls: int) -> None:
+    async def run():
+        for _ in range(calls):
+            await lim.acquire()
+
+    asyncio.run(run())
+
+
+def test_limit_grows_additively_while_in_use():
+    lim = limiter(initial_limit=4, max_limit=100)
+    hold(lim, 4)
+
+    # A steady four calls in flight, each replaced as it finishes
+    for _ in range(4):
+        lim.release(SUCCESS)
+        hold(lim, 1)
+
+    # About one more slot per round of successful calls
+    assert 4.9 < lim.limit < 5.0
+    assert lim.in_flight == 4
+
+
+def test_idle_limit_does_not_grow():
+    lim = limiter(initial_limit=10)
+    hold(lim, 1)
+
+    lim.release(SUCCESS)
+
+    assert lim.limit == 10
+
+
+def test_throttle_halves_the_limit_once_per_cooldown():
+    lim = limiter(initial_limit=16)
+    hold(lim, 3)
+
+    lim.release(THROTTLED)
+    lim.release(THROTTLED)
+    assert lim.limit == 8
+
+    lim._last_backoff = 0.0
+    lim.release(THROTTLED)
+    assert lim.limit == 4
+    assert lim.stats()["throttled"] == 3
+
+
+def test_limit_stays_within_floor_and_ceiling():
+    low = limiter(initial_limit=2, min_limit=2)
+    hold(low, 2)
+    for _ in range(2):
+        low._last_backoff = 0.0
+        low.release(THROTTLED)
+    assert low.limit == 2
+
+    high = limiter(initial_limit=3, max_limit=3)
+    hold(high, 3)
+    for _ in range(3):
+        high.release(SUCCESS)
+    assert high.limit == 3
+
+
+def test_failures_leave_the_limit_alone():
+    lim = limiter(initial_limit=4)
+    hold(lim, 4)
+
+    lim.release(FAILED)
+
+    assert lim.limit == 4 and lim.in_flight == 3
+
+
+def test_queued_call_gives_up_after_the_max_wait():
+    lim = limiter(initial_limit=1, max_wait_ms=20)
+
+    async def run():
+        await lim.acquire()
+        started = asyncio.get_running_loop().time()
+        with pytest.raises(LimitExceeded) as raised:
+            await lim.acquire()
+        return asyncio.get_running_loop().time() - started, raised.value
+
+    waited, error = asyncio.run(run())
+
+    assert waited >= 0.02
+    assert error.model_id == lim.model_id and error.retry_after == 1
+    assert lim.stats()["queue_depth"] == 0 and lim.stats()["rejected"] == 1
+
+
+def test_released_slot_goes_to_the_next_waiter():
+    lim = limiter(initial_limit=1, max_wait_ms=1000)
+
+    async def run():
+        await lim.acquire()
+        waiter = asyncio.ensure_future(lim.acquire())
+        await asyncio.sleep(0)
+        lim.release(SUCCESS)
+        await waiter
+
+    asyncio.run(run())
+
+    assert lim.in_flight == 1 and lim.stats()["queued"] == 1
+
+
+def test_full_queue_is_rejected_at_once():
+    lim = limiter(initial_limit=1, max_queue=0)
+    hold(lim, 1)
+
+    with pytest.raises(LimitExceeded):
+        lim.check_admission()
+    with pytest.raises(LimitExceeded):
+        hold(lim, 1)
+    assert lim.stats()["rejected"] == 2
+
+
+def test_throttling_errors_are_recognized():
+    assert is_throttling_error(client_error("ThrottlingException"))
+    assert is_throttling_error(client_error("throttlingException"))
+    assert is_throttling_error(client_error("TooManyRequestsException"))
+    assert not is_throttling_error(client_error("ValidationException"))
+    assert not is_throttling_error(RuntimeError("boom"))
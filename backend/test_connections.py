@@ -0,0 +1,74 @@
+"""
+Tests for AWS client configuration, connection warm-up and pool stats
+"""
+
+import asyncio
+import threading
+import types
+
+import boto3
+from botocore.exceptions import ClientError
+
+import connections
+from connections import client_config, pool_stats, warm_connections
+
+ENDPOINT = "https://bedrock-runtime.us-east-1.amazonaws.com"
+
+
+def bedrock_client(max_pool_connections: int):
+    return boto3.client("bedrock-runtime", region_name="us-east-1", aws_access_key_id="test",
+                        aws_secret_access_key="test", config=client_config(max_pool_connections, 5))
+
+
+def test_client_config_sets_pool_timeouts_keepalive_and_attempts():
+    config = client_config(7, 30, max_attempts=1)
+
+    assert config.max_pool_connections == 7
+    assert config.read_timeout == 30 and config.connect_timeout == connections.AWS_CONNECT_TIMEOUT
+    assert config.tcp_keepalive == connections.AWS_TCP_KEEPALIVE
+    assert config.retries == {"total_max_attempts": 1, "mode": "standard"}
+
+
+def test_warm_up_makes_the_calls_at_once_and_counts_aws_errors_as_warm():
+    calls = []
+    lock = threading.Lock()
+
+    def rejected():
+        with lock:
+            calls.append(threading.get_ident())
+        raise ClientError({"Error": {"Code": "AccessDeniedException", "Message": "no"}}, "ListAsyncInvokes")
+
+    warmed = asyncio.run(warm_connections("bedrock", rejected, count=3))
+
+    assert warmed["warmed"] == 3 and len(calls) == 3
+
+
+def test_warm_up_failure_leaves_startup_to_carry_on():
+    def unreachable():
+        raise OSError("no route to host")
+
+    assert asyncio.run(warm_connections("bedrock", unreachable, count=2))["warmed"] == 0
+
+
+def test_pool_stats_count_connections_in_use_and_idle():
+    client = bedrock_client(7)
+    assert pool_stats(client) == {"max_pool_connections": 7, "in_use": 0, "idle": 0, "opened": 0,
+                                  "requests": 0, "saturation": 0.0}
+
+    # A connection checked out of the pool, as during a call; nothing is sent
+    pool = client._endpoint.http_session._manager.connection_from_url(ENDPOINT)
+    connection = pool._get_conn()
+    stats = pool_stats(client)
+    assert stats["in_use"] == 1 and stats["opened"] == 1 and stats["saturation"] == round(1 / 7, 4)
+
+    pool._put_conn(connection)
+    stats = pool_stats(client)
+    assert stats["in_use"] == 0 and stats["idle"] == 1
+
+
+def test_pool_stats_are_left_out_when_the_internals_are_not_there():
+    assert pool_stats(object()) == {}
+
+    # As if a urllib3 release renamed the pool container
+    session = types.SimpleNamespace(_manager=object(), _max_pool_connections=10)
+    assert pool_stats(types.SimpleNamespace(_endpoint=types.SimpleNamespace(http_session=session))) == {}
@@ -0,0 +1,57 @@
+"""
+Tests for per-request deadlines
+"""
+
+import asyncio
+
+import pytest
+
+from deadline import (
+    CancellationStats, DeadlineExceeded, current_deadline, deadline_scope, enter_stage, fits_deadline,
+    request_deadline, start_with_deadline, within_deadline
+)
+import deadline as deadline_module
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(deadline_module, "cancellation_stats", CancellationStats())
+
+
+def test_work_past_the_deadline_is_cancelled_and_counted():
+    finished = []
+
+    async def slow():
+        await asyncio.sleep(1)
+        finished.append(True)
+
+    async def run():
+        with deadline_scope(request_deadline(50)):
+            assert fits_deadline(0.01) and not fits_deadline(1)
+            await within_deadline("model", slow)
+
+    with pytest.raises(DeadlineExceeded, match="during model"):
+        asyncio.run(run())
+    assert not finished
+    assert deadline_module.cancellation_stats.stats()["expired_by_stage"] == {"model": 1}
+
+
+def test_expired_deadline_stops_the_next_stage():
+    async def run():
+        with deadline_scope(request_deadline(1)):
+            await asyncio.sleep(0.01)
+            enter_stage("cache")
+
+    with pytest.raises(DeadlineExceeded, match="during cache"):
+        asyncio.run(run())
+    assert current_deadline() is None
+
+
+def test_tasks_started_with_a_deadline_see_it():
+    deadline = request_deadline(1000)
+
+    async def run():
+        return await start_with_deadline(deadline, lambda: asyncio.sleep(0, current_deadline()))
+
+    assert asyncio.run(run()) is deadline
+    assert request_deadline(10 ** 9).timeout_ms == deadline_module.MAX_REQUEST_TIMEOUT_MS
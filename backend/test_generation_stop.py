@@ -0,0 +1,158 @@
+"""
+Tests for ending generation once the JSON answer is complete
+"""
+
+import asyncio
+import io
+import json
+import time
+
+import httpx
+import pytest
+
+import main
+from benchmark import FakeBedrockClient
+from metrics import GenerationStopStats
+from model_adapters import get_adapter
+
+ANSWER = '{\n  "reasoning_trace": ["Step 1: ok"],\n  "optimized_prompt": "ok"\n}'
+COMMENTARY = "\nI hope these changes help you get sharper answers from the model you are using."
+
+
+class StopAwareBedrock(FakeBedrockClient):
+    """Claude-format stand-in that honors stop sequences like Bedrock: the match is left out of the text"""
+
+    def __init__(self, text: str):
+        super().__init__(latency=0)
+        self.text = text
+        self.bodies = []
+        self.streamed = 0
+
+    def _generate(self, body):
+        for sequence in body.get("stop_sequences", []):
+            at = self.text.find(sequence)
+            if at >= 0:
+                return self.text[:at], "stop_sequence", sequence
+        return self.text, "end_turn", None
+
+    def invoke_model(self, modelId, body, contentType="application/json"):
+        self.bodies.append(json.loads(body))
+        text, stop_reason, stop_sequence = self._generate(self.bodies[-1])
+        payload = {"content": [{"text": text}], "stop_reason": stop_reason, "stop_sequence": stop_sequence,
+                   "usage": {"input_tokens": 300, "output_tokens": 40}}
+        return {"body": io.BytesIO(json.dumps(payload).encode())}
+
+    def invoke_model_with_response_stream(self, modelId, body, contentType="application/json"):
+        self.bodies.append(json.loads(body))
+        return {"body": self._events(*self._generate(self.bodies[-1]))}
+
+    def _events(self, text, stop_reason, stop_sequence):
+        for i in range(0, len(text), 8):
+            # Paced like a model, so abandoning the stream leaves the rest ungenerated
+            time.sleep(0.005)
+            self.streamed += 1
+            event = {"type": "content_block_delta", "delta": {"type": "text_delta", "text": text[i:i + 8]}}
+            yield {"chunk": {"bytes": json.dumps(event).encode()}}
+        end = {"type": "message_delta", "delta": {"stop_reason": stop_reason, "stop_sequence": stop_sequence}}
+        yield {"chunk": {"bytes": json.dumps(end).encode()}}
+        metrics = {"inputTokenCount": 300, "outputTokenCount": self.streamed}
+        yield {"chunk": {"bytes": json.dumps({"type": "message_stop",
+                                              "amazon-bedrock-invocationMetrics": metrics}).encode()}}
+
+
+@pytest.fixture
+def stops(monkeypatch):
+    """Fresh stop accounting, no control calls and no hedging; returns the stats"""
+    main.prompt_cache.clear()
+    stats = GenerationStopStats()
+    monkeypatch.setattr(main, "generation_stop_stats", stats)
+    monkeypatch.setattr(main, "STOP_SEQUENCE_CONTROL_RATE", 0.0)
+    monkeypatch.setattr(main.hedge_policy, "enabled", False)
+    yield stats
+    main.prompt_cache.clear()
+
+
+def use_model(monkeypatch, text: str) -> StopAwareBedrock:
+    stub = StopAwareBedrock(text)
+    monkeypatch.setattr(main.bedrock_invoker, "client", stub)
+    return stub
+
+
+def post(path: str, description: str) -> httpx.Response:
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            return await client.post(path, json={"description": description})
+
+    return asyncio.run(send())
+
+
+def test_stop_sequences_are_sent_only_to_families_that_report_them():
+    bodies = {
+        family: get_adapter(model_id).build_body("p", 100, 0.5, stop_sequences=main.JSON_STOP_SEQUENCES)
+        for family, model_id in [("claude", "anthropic.claude-3-haiku-20240307-v1:0"),
+                                 ("nova", "amazon.nova-lite-v1:0"),
+                                 ("llama", "meta.llama3-8b-instruct-v1:0"),
+                                 ("titan", "amazon.titan-text-express-v1"),
+                                 ("cohere", "cohere.command-text-v14")]
+    }
+
+    assert bodies["claude"]["stop_sequences"] == ["\n}"]
+    assert bodies["nova"]["inferenceConfig"]["stopSequences"] == ["\n}"]
+    for family in ("llama", "titan", "cohere"):
+        assert "stop" not in json.dumps(bodies[family]), family
+
+
+def test_matched_stop_sequence_is_put_back_and_credited(monkeypatch, stops):
+    stub = use_model(monkeypatch, ANSWER + COMMENTARY)
+
+    response = post("/optimize-sync", "stop at the closing brace")
+
+    assert response.status_code == 200 and response.json()["optimized_prompt"] == "ok"
+    assert stub.bodies[0]["stop_sequences"] == ["\n}"]
+    assert stops.stop_sequence_hits == 1 and stops.early_terminations == 0
+
+
+def test_streamed_stop_sequence_is_put_back(monkeypatch, stops):
+    use_model(monkeypatch, ANSWER + COMMENTARY)
+
+    async def collect():
+        return [item async for item in main.stream_bedrock_model(main.MODELS[main.DEFAULT_MODEL], "p",
+                                                                 stop_sequences=["\n}"])]
+
+    items = asyncio.run(collect())
+
+    text = "".join(item["text"] for item in items if "text" in item)
+    assert text == ANSWER
+    assert {"text": "\n}", "stop_sequence": "\n}"} in items
+
+
+def test_stream_is_abandoned_once_the_answer_is_complete(monkeypatch, stops):
+    # Closed on the same line, so the stop sequence never matches and only early termination can stop it
+    answer = ANSWER.replace("\n}", "}")
+    stub = use_model(monkeypatch, answer + COMMENTARY * 5)
+
+    response = post("/optimize", "stop reading after the answer")
+
+    events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert [event for event in events if event["type"] == "result"][0]["optimized_prompt"] == "ok"
+    assert stops.early_terminations == 1 and stops.stop_sequence_hits == 0
+    assert stub.streamed < len(answer + COMMENTARY * 5) / 8
+
+
+def test_control_calls_run_without_stop_sequences_and_measure_the_commentary(monkeypatch, stops):
+    stub = use_model(monkeypatch, ANSWER + COMMENTARY)
+    monkeypatch.setattr(main, "STOP_SEQUENCE_CONTROL_RATE", 1.0)
+
+    assert post("/optimize-sync", "a control call").status_code == 200
+
+    assert "stop_sequences" not in stub.bodies[0]
+    assert stops.summary()["control_calls"] == 1
+    trailing = stops.trailing_tokens.mean()
+    assert trailing > 0
+
+    monkeypatch.setattr(main, "STOP_SEQUENCE_CONTROL_RATE", 0.0)
+    assert post("/optimize-sync", "a stopped call").status_code == 200
+
+    # A stopped call is credited with what the control calls wrote after the answer
+    assert stops.stop_sequence_hits == 1
+    assert stops.saved_output_tokens == pytest.approx(trailing)
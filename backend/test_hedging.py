@@ -0,0 +1,82 @@
+"""
+Tests for hedged Bedrock calls
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from hedging import HedgePolicy
+from metrics import model_health
+
+
+def leg(result, delay, started=None, log=None, name=None):
+    async def run():
+        if started is not None:
+            started[name] = time.perf_counter()
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            if log is not None:
+                log.append(f"{name} cancelled")
+            raise
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return run
+
+
+def test_delay_uses_the_default_until_there_is_enough_history():
+    policy = HedgePolicy(enabled=True, percentile=90, min_samples=10, default_delay_ms=500)
+    assert policy.delay_seconds("test-hedge-model") == 0.5
+
+    for latency in range(1, 11):
+        model_health["test-hedge-model"].record_success(latency * 100)
+    assert policy.delay_seconds("test-hedge-model") == 0.9
+
+
+def test_fast_primary_never_sends_the_backup():
+    policy = HedgePolicy(enabled=True)
+    started = {}
+
+    result = asyncio.run(policy.race(leg("primary", 0.01, started, name="primary"),
+                                     leg("backup", 0, started, name="backup"), 0.2))
+
+    assert result == ("primary", False, False)
+    assert "backup" not in started
+    assert policy.stats()["hedged"] == 0
+
+
+def test_backup_fires_after_the_delay_and_the_loser_is_cancelled():
+    policy = HedgePolicy(enabled=True)
+    started, log = {}, []
+
+    async def run():
+        begin = time.perf_counter()
+        result = await policy.race(leg("primary", 1, started, log, "primary"),
+                                   leg("backup", 0.01, started, log, "backup"), 0.05)
+        await asyncio.sleep(0)
+        return begin, result
+
+    begin, result = asyncio.run(run())
+
+    assert result == ("backup", True, True)
+    assert started["backup"] - begin >= 0.05
+    assert log == ["primary cancelled"]
+    assert policy.stats()["backup_wins"] == 1
+
+
+def test_primary_failure_before_the_delay_still_hedges():
+    policy = HedgePolicy(enabled=True)
+
+    result = asyncio.run(policy.race(leg(RuntimeError("primary down"), 0), leg("backup", 0.01), 0.05))
+
+    assert result == ("backup", True, True)
+
+
+def test_error_is_raised_when_both_legs_fail():
+    policy = HedgePolicy(enabled=True)
+
+    with pytest.raises(RuntimeError, match="primary down"):
+        asyncio.run(policy.race(leg(RuntimeError("primary down"), 0.1), leg(RuntimeError("backup down"), 0), 0.01))
@@ -0,0 +1,56 @@
+"""
+Tests for the incremental optimization JSON parser
+"""
+
+import json
+
+from json_stream import FALLBACK_REASONING, OptimizationStreamParser, parse_optimization_response
+
+RESPONSE = json.dumps({
+    "reasoning_trace": ["Step 1: Analysis - \"quoted\" é", "Step 2: Requirements\nsecond line"],
+    "notes": {"skip": ["]", "}"]},
+    "optimized_prompt": "You are an \"expert\".\nDo it \\ now. \U0001F600"
+}, indent=4)
+
+
+def feed_in_pieces(text, size):
+    parser = OptimizationStreamParser()
+    events = []
+    for i in range(0, len(text), size):
+        events += parser.feed(text[i:i + size])
+    return parser, events
+
+
+def test_every_split_matches_json_loads():
+    expected = json.loads(RESPONSE)
+    for size in range(1, 12):
+        parser, events = feed_in_pieces(RESPONSE, size)
+        assert parser.close() == (expected["reasoning_trace"], expected["optimized_prompt"])
+        assert [e["content"] for e in events if e["type"] == "reasoning"] == expected["reasoning_trace"]
+        assert "".join(e["content"] for e in events if e["type"] == "prompt") == expected["optimized_prompt"]
+        assert parser.complete
+
+
+def test_reasoning_step_is_emitted_on_its_closing_quote():
+    parser = OptimizationStreamParser()
+    assert parser.feed('{"reasoning_trace": ["Step 1: a') == []
+    assert parser.feed('"') == []  # could still be an unescaped quote
+    assert parser.feed(', "Step 2') == [{"type": "reasoning", "step": 1, "content": "Step 1: a"}]
+
+
+def test_tolerates_fences_unescaped_quotes_and_commentary():
+    text = ('Sure!\n```json\n{"reasoning_trace": ["Step 1: say "hi" now"],\n'
+            '"optimized_prompt": "Line one\nLine two"}\n```\nLet me know!')
+    parser, _ = feed_in_pieces(text, 3)
+    assert parser.close() == (['Step 1: say "hi" now'], "Line one\nLine two")
+    assert parser.trailing.startswith("\n```")
+
+
+def test_truncated_output_keeps_partial_result():
+    parser, _ = feed_in_pieces('{"reasoning_trace": ["Step 1: a"], "optimized_prompt": "Act as', 5)
+    assert parser.close() == (["Step 1: a"], "Act as")
+    assert not parser.complete
+
+
+def test_non_json_falls_back_to_raw_text():
+    assert parse_optimization_response("Just a plain prompt") == ([FALLBACK_REASONING], "Just a plain prompt")
@@ -0,0 +1,134 @@
+"""
+Tests for the per-family Bedrock request and response formats
+"""
+
+import pytest
+
+import model_adapters
+from model_adapters import (
+    ClaudeAdapter, CohereAdapter, LlamaAdapter, ModelAdapter, NovaAdapter, TitanAdapter, get_adapter,
+    register_adapter
+)
+
+CLAUDE = "anthropic.claude-3-haiku-20240307-v1:0"
+NOVA = "amazon.nova-lite-v1:0"
+LLAMA = "meta.llama3-8b-instruct-v1:0"
+TITAN = "amazon.titan-text-express-v1"
+COHERE = "cohere.command-text-v14"
+
+
+def test_model_ids_resolve_to_their_family():
+    for model_id, adapter in [(CLAUDE, ClaudeAdapter), (NOVA, NovaAdapter), (LLAMA, LlamaAdapter),
+                              (TITAN, TitanAdapter), (COHERE, CohereAdapter)]:
+        assert isinstance(get_adapter(model_id), adapter), model_id
+    with pytest.raises(ValueError, match="Unsupported model"):
+        get_adapter("ai21.j2-ultra-v1")
+
+
+def test_registered_adapter_takes_precedence(monkeypatch):
+    class Custom(ClaudeAdapter):
+        family = "custom"
+
+    monkeypatch.setattr(model_adapters, "_ADAPTERS", list(model_adapters._ADAPTERS))
+    assert get_adapter("anthropic.claude-custom").family == "claude"
+    register_adapter("anthropic.claude-custom", Custom())
+    assert get_adapter("anthropic.claude-custom").family == "custom"
+    get_adapter.cache_clear()
+
+
+def test_claude_body_response_stream_and_usage():
+    adapter = ClaudeAdapter()
+    body = adapter.build_body("p", 100, 0.5, system="s")
+    assert body["messages"] == [{"role": "user", "content": "p"}]
+    assert body["max_tokens"] == 100 and body["temperature"] == 0.5
+    assert body["system"] == [{"type": "text", "text": "s"}]
+    assert "system" not in adapter.build_body("p", 100, 0.5)
+
+    response = {"content": [{"text": "out"}], "stop_reason": "max_tokens",
+                "usage": {"input_tokens": 10, "output_tokens": 5}}
+    assert adapter.parse_response(response) == "out"
+    assert adapter.truncated(response) and not adapter.truncated({"stop_reason": "end_turn"})
+    assert adapter.extract_usage(response) == {"input_tokens": 10, "output_tokens": 5,
+                                               "cache_read_tokens": 0, "cache_write_tokens": 0}
+    assert adapter.extract_usage({}) == {}
+
+    assert adapter.decode_stream_chunk({"type": "content_block_delta", "delta": {"text": "d"}}) == "d"
+    assert adapter.decode_stream_chunk({"type": "message_start"}) == ""
+    assert adapter.stream_truncated({"type": "message_delta", "delta": {"stop_reason": "max_tokens"}})
+
+
+def test_nova_body_response_stream_and_usage():
+    adapter = NovaAdapter()
+    body = adapter.build_body("p", 100, 0.5, system="s")
+    assert body["messages"] == [{"role": "user", "content": [{"text": "p"}]}]
+    assert body["inferenceConfig"] == {"maxTokens": 100, "temperature": 0.5}
+    assert body["system"] == [{"text": "s"}]
+
+    response = {"output": {"message": {"content": [{"text": "out"}]}}, "stopReason": "max_tokens",
+                "usage": {"inputTokens": 10, "outputTokens": 5}}
+    assert adapter.parse_response(response) == "out"
+    assert adapter.truncated(response) and not adapter.truncated({"stopReason": "end_turn"})
+    assert adapter.extract_usage(response)["input_tokens"] == 10
+    assert adapter.extract_usage(response)["output_tokens"] == 5
+
+    assert adapter.decode_stream_chunk({"contentBlockDelta": {"delta": {"text": "d"}}}) == "d"
+    assert adapter.decode_stream_chunk({"messageStart": {}}) == ""
+    assert adapter.stream_truncated({"messageStop": {"stopReason": "max_tokens"}})
+
+
+def test_llama_body_response_stream_and_usage():
+    adapter = LlamaAdapter()
+    assert adapter.build_body("p", 100, 0.5, system="s") == {"prompt": "s\n\np", "max_gen_len": 100,
+                                                             "temperature": 0.5}
+
+    response = {"generation": "out", "stop_reason": "length", "prompt_token_count": 10,
+                "generation_token_count": 5}
+    assert adapter.parse_response(response) == "out"
+    assert adapter.truncated(response) and not adapter.truncated({"stop_reason": "stop"})
+    assert adapter.extract_usage(response) == {"input_tokens": 10, "output_tokens": 5}
+    assert adapter.extract_usage({"generation": "out"}) == {}
+
+    assert adapter.decode_stream_chunk({"generation": "d"}) == "d"
+    assert adapter.stream_truncated({"generation": "", "stop_reason": "length"})
+
+
+def test_titan_body_response_stream_and_usage():
+    adapter = TitanAdapter()
+    body = adapter.build_body("p", 100, 0.5, system="s")
+    assert body["inputText"] == "s\n\np"
+    assert body["textGenerationConfig"]["maxTokenCount"] == 100
+
+    response = {"inputTextTokenCount": 10,
+                "results": [{"outputText": "out", "tokenCount": 5, "completionReason": "LENGTH"}]}
+    assert adapter.parse_response(response) == "out"
+    assert adapter.truncated(response)
+    assert not adapter.truncated({"results": [{"completionReason": "FINISH"}]})
+    assert adapter.extract_usage(response) == {"input_tokens": 10, "output_tokens": 5}
+
+    assert adapter.decode_stream_chunk({"outputText": "d"}) == "d"
+    assert adapter.stream_truncated({"completionReason": "LENGTH"})
+
+
+def test_cohere_body_response_stream_and_usage():
+    adapter = CohereAdapter()
+    body = adapter.build_body("p", 100, 0.5, system="s")
+    assert body["prompt"] == "s\n\np" and body["max_tokens"] == 100
+
+    response = {"generations": [{"text": "out", "finish_reason": "MAX_TOKENS"}]}
+    assert adapter.parse_response(response) == "out"
+    assert adapter.truncated(response)
+    assert not adapter.truncated({"generations": [{"finish_reason": "COMPLETE"}]})
+    # Cohere reports no token counts in the body
+    assert adapter.extract_usage(response) == {}
+
+    assert adapter.decode_stream_chunk({"generations": [{"text": "d"}]}) == "d"
+    assert adapter.decode_stream_chunk({"text": "d"}) == "d"
+    assert adapter.stream_truncated({"finish_reason": "MAX_TOKENS"})
+
+
+def test_stream_usage_comes_from_bedrock_invocation_metrics():
+    adapter = ModelAdapter()
+    assert adapter.stream_usage({"type": "content_block_delta"}) == {}
+    metrics = {"inputTokenCount": 10, "outputTokenCount": 5}
+    assert adapter.stream_usage({"amazon-bedrock-invocationMetrics": metrics}) == {"input_tokens": 10,
+                                                                                  "output_tokens": 5}
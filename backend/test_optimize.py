@@ -0,0 +1,216 @@
+"""
+Tests for the optimization endpoints against stubbed model calls
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+from botocore.exceptions import ClientError
+
+import main
+import resilience
+from benchmark import FakeBedrockClient
+from cache import PromptCache
+from cache_backends import SQLiteBackend
+from concurrency import AdaptiveLimiter, LimitExceeded
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    main.prompt_cache.clear()
+    yield
+    main.prompt_cache.clear()
+
+
+@pytest.fixture
+def failing_model(monkeypatch):
+    """Make every Bedrock call fail with the given error code, retried without waiting"""
+    breakers = resilience.ModelBreakers()
+    monkeypatch.setattr(resilience, "model_breakers", breakers)
+    monkeypatch.setattr(main, "model_breakers", breakers)
+
+    async def no_sleep(model_id, attempt, delay, error):
+        pass
+
+    monkeypatch.setattr(resilience, "sleep_before_retry", no_sleep)
+
+    def fail_with(code):
+        class FailingClient:
+            def invoke_model(self, **kwargs):
+                raise ClientError({"Error": {"Code": code, "Message": code}}, "InvokeModel")
+
+            invoke_model_with_response_stream = invoke_model
+
+        monkeypatch.setattr(main.bedrock_invoker, "client", FailingClient())
+
+    return fail_with
+
+
+async def send(*calls):
+    """Make ``(method, path, body)`` calls concurrently"""
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        return await asyncio.gather(*(client.request(method, path, json=body) for method, path, body in calls))
+
+
+def sse_events(response) -> list:
+    return [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+
+
+def test_follower_of_a_rejected_streaming_leader_gets_an_http_error(monkeypatch):
+    async def rejected_stream(model_id, *args, **kwargs):
+        await asyncio.sleep(0.2)
+        raise LimitExceeded(model_id, retry_after=7)
+        yield
+
+    monkeypatch.setattr(main, "stream_bedrock_model", rejected_stream)
+    body = {"description": "follower of a rejected leader"}
+
+    key = main.optimization_key(main.PromptRequest(**body))
+
+    async def follow_the_leader():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            leader = asyncio.ensure_future(client.post("/optimize", json=body))
+            # A fixed stagger can be outrun by a collector pause before the leader has joined
+            while not main.optimization_flights.in_flight(key):
+                await asyncio.sleep(0.005)
+            follower = await client.post("/optimize-sync", json=body)
+            return await leader, follower
+
+    leader, follower = asyncio.run(follow_the_leader())
+
+    assert '"type": "error"' in leader.text
+    assert follower.status_code == 429
+    assert follower.headers["Retry-After"] == "7"
+
+
+def test_stream_is_refused_with_429_before_it_starts_when_the_model_has_no_room(monkeypatch):
+    model_id = main.MODELS[main.DEFAULT_MODEL]
+    full = AdaptiveLimiter(model_id, initial_limit=1, min_limit=1, max_queue=0)
+    full.in_flight = 1
+    monkeypatch.setitem(main.model_limiters._limiters, model_id, full)
+
+    response, = asyncio.run(send(("POST", "/optimize", {"description": "no room for this one"})))
+
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert full.stats()["rejected"] == 1
+
+
+def test_unavailable_model_is_answered_with_the_rule_based_fallback(failing_model):
+    failing_model("ServiceUnavailableException")
+
+    response, = asyncio.run(send(("POST", "/optimize-sync", {"description": "model is down"})))
+
+    assert response.status_code == 200
+    assert response.json()["model_used"] == main.RULE_BASED_MODEL
+
+
+def test_misconfigured_model_is_an_error_not_a_fallback(failing_model):
+    failing_model("AccessDeniedException")
+
+    sync, stream = asyncio.run(send(("POST", "/optimize-sync", {"description": "no permission"}),
+                                    ("POST", "/optimize", {"description": "no permission either"})))
+
+    assert sync.status_code == 500
+    assert "AccessDeniedException" in sync.json()["detail"]
+    assert '"type": "error"' in stream.text and '"type": "result"' not in stream.text
+
+
+def test_reasoning_id_works_on_another_worker_sharing_the_l2_store(monkeypatch, tmp_path):
+    path = str(tmp_path / "l2.db")
+    worker_a, worker_b = PromptCache(l2=SQLiteBackend(path)), PromptCache(l2=SQLiteBackend(path))
+    monkeypatch.setattr(main.bedrock_invoker, "client", FakeBedrockClient(latency=0))
+    monkeypatch.setattr(main.hedge_policy, "enabled", False)
+    body = {"description": "reason about this later", "include_reasoning": False}
+
+    monkeypatch.setattr(main, "prompt_cache", worker_a)
+    optimized, = asyncio.run(send(("POST", "/optimize-sync", body)))
+    reasoning_id = optimized.json()["reasoning_id"]
+    worker_a._l2_writer.flush()
+
+    monkeypatch.setattr(main, "prompt_cache", worker_b)
+    reasoning, unknown = asyncio.run(send(("GET", f"/optimize/reasoning/{reasoning_id}", None),
+                                          ("GET", "/optimize/reasoning/0123456789abcdef", None)))
+
+    assert reasoning.status_code == 200
+    assert reasoning.json()["reasoning_trace"] == ["Step 1: ok"]
+    assert unknown.status_code == 404
+    # The full result is cached for later full requests
+    assert worker_b.get(body["description"], "", main.DEFAULT_MODEL)["reasoning_trace"] == ["Step 1: ok"]
+    worker_a.close()
+    worker_b.close()
+
+
+def test_draft_is_streamed_before_the_model_result_only_on_a_miss(monkeypatch):
+    monkeypatch.setattr(main.bedrock_invoker, "client", FakeBedrockClient(latency=0))
+    monkeypatch.setattr(main.hedge_policy, "enabled", False)
+    body = {"description": "draft this while the model thinks"}
+
+    miss, = asyncio.run(send(("POST", "/optimize", body)))
+    hit, = asyncio.run(send(("POST", "/optimize", body)))
+
+    types = [event["type"] for event in sse_events(miss)]
+    assert "draft" in types and types.index("draft") < types.index("result")
+    draft = next(event for event in sse_events(miss) if event["type"] == "draft")
+    assert draft["model_used"] == main.RULE_BASED_MODEL and draft["optimized_prompt"]
+    assert "draft" not in [event["type"] for event in sse_events(hit)]
+
+    monkeypatch.setattr(main, "DRAFT_ENABLED", False)
+    undrafted, = asyncio.run(send(("POST", "/optimize", {"description": "no draft for this one"})))
+    types = [event["type"] for event in sse_events(undrafted)]
+    assert "draft" not in types and "result" in types
+
+
+class CountingBedrock(FakeBedrockClient):
+    """Answers with ``prompt`` as the optimized prompt, counting the calls made"""
+
+    def __init__(self, prompt: str, latency: float = 0):
+        super().__init__(latency=latency)
+        self.calls = 0
+        self.answer(prompt)
+
+    def answer(self, prompt: str) -> None:
+        self.text = json.dumps({"reasoning_trace": ["Step 1: ok"], "optimized_prompt": prompt})
+
+    def invoke_model(self, modelId, body, contentType="application/json"):
+        self.calls += 1
+        return super().invoke_model(modelId, body, contentType)
+
+
+def test_stale_result_is_served_at_once_while_one_refresh_replaces_it(monkeypatch):
+    cache = PromptCache(stale_minutes=1)
+    monkeypatch.setattr(main, "prompt_cache", cache)
+    stub = CountingBedrock("old")
+    monkeypatch.setattr(main.bedrock_invoker, "client", stub)
+    monkeypatch.setattr(main.hedge_policy, "enabled", False)
+    body = {"description": "serve me stale, then refresh"}
+
+    first, = asyncio.run(send(("POST", "/optimize-sync", body)))
+    assert first.json()["optimized_prompt"] == "old"
+    for entry in cache.cache.values():
+        entry.fresh_until = time.monotonic() - 1
+    stub.calls = 0
+    stub.answer("new")
+    stub.latency = 0.3
+
+    async def within_the_soft_window():
+        started = time.monotonic()
+        responses = await send(*[("POST", "/optimize-sync", body)] * 5)
+        elapsed = time.monotonic() - started
+        await asyncio.gather(*main.background_refreshes.values())
+        return responses, elapsed
+
+    responses, elapsed = asyncio.run(within_the_soft_window())
+
+    # Every request got the stale result without waiting on the model
+    assert [response.json()["optimized_prompt"] for response in responses] == ["old"] * 5
+    assert elapsed < stub.latency
+    assert stub.calls == 1 and not main.background_refreshes
+    stats = cache.stats()
+    assert stats["stale_hits"] == 5 and stats["refreshes"] == 1 and stats["refresh_failures"] == 0
+
+    again, = asyncio.run(send(("POST", "/optimize-sync", body)))
+    assert again.json()["optimized_prompt"] == "new" and stub.calls == 1
@@ -0,0 +1,69 @@
+"""
+Tests for the NDJSON batch endpoint against a local Bedrock stub
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import main
+from testing import StubBedrock
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    main.prompt_cache.clear()
+    stub = StubBedrock()
+    monkeypatch.setattr(main.bedrock_invoker, "client", stub)
+    monkeypatch.setattr(main.hedge_policy, "enabled", False)
+    yield stub
+    main.prompt_cache.clear()
+
+
+def run_batch(requests, max_concurrency=None):
+    async def post():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            response = await client.post("/optimize-batch", json={"requests": requests,
+                                                                   "max_concurrency": max_concurrency})
+            return [json.loads(line) for line in response.text.splitlines()]
+
+    return asyncio.run(post())
+
+
+def test_every_item_gets_one_line_and_cache_hits_come_first(stub):
+    main.prompt_cache.set("batch cached", "", main.DEFAULT_MODEL, {
+        "optimized_prompt": "cached", "reasoning_trace": [], "model_used": main.DEFAULT_MODEL,
+        "timestamp": "2024-01-01T00:00:00", "cost_estimate": 0.0
+    })
+
+    lines = run_batch([{"description": f"batch item {i}"} for i in range(3)]
+                      + [{"description": "batch cached"}, {"description": "batch item 0"}])
+
+    assert sorted(line["index"] for line in lines) == [0, 1, 2, 3, 4]
+    assert lines[0]["index"] == 3 and lines[0]["cached"] is True
+    # Duplicates share one model call and get the same result
+    assert len(stub.prompts) == 3
+    by_index = {line["index"]: line for line in lines}
+    assert by_index[0]["result"] == by_index[4]["result"]
+
+
+def test_model_calls_stay_within_the_concurrency_bound(stub):
+    lines = run_batch([{"description": f"bounded item {i}"} for i in range(12)], max_concurrency=3)
+
+    assert all(line["status"] == "ok" for line in lines)
+    assert len(stub.prompts) == 12 and stub.peak <= 3
+
+
+def test_failures_and_timeouts_are_reported_per_item(stub):
+    lines = run_batch([
+        {"description": "fine item"},
+        {"description": "bad item"},
+        {"description": "slow item", "timeout_ms": 100}
+    ])
+
+    by_index = {line["index"]: line for line in lines}
+    assert by_index[0]["status"] == "ok"
+    assert by_index[1]["status"] == "error" and by_index[1]["status_code"] == 500
+    assert by_index[2]["status"] == "error" and by_index[2]["status_code"] == 504
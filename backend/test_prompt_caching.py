@@ -0,0 +1,112 @@
+"""
+Tests for prompt caching of the static system prompt
+"""
+
+import asyncio
+import io
+import json
+
+import pytest
+
+import main
+from metrics import PromptCachingStats
+from model_adapters import ClaudeAdapter, ModelAdapter, NovaAdapter, supports_prompt_cache
+
+NOVA = "amazon.nova-lite-v1:0"
+
+
+@pytest.fixture
+def caching_stats(monkeypatch):
+    stats = PromptCachingStats()
+    monkeypatch.setattr(main, "prompt_caching_stats", stats)
+    return stats
+
+
+class NovaStub:
+    """Nova-format stand-in whose every call reads ``cache_read`` system tokens from the prompt cache"""
+
+    def __init__(self, cache_read: int):
+        self.cache_read = cache_read
+        self.bodies = []
+
+    def invoke_model(self, modelId, body, contentType="application/json"):
+        self.bodies.append(json.loads(body))
+        payload = {
+            "output": {"message": {"content": [{"text": "ok"}]}},
+            "stopReason": "end_turn",
+            "usage": {"inputTokens": 20, "outputTokens": 5, "cacheReadInputTokenCount": self.cache_read,
+                      "cacheWriteInputTokenCount": 0}
+        }
+        return {"body": io.BytesIO(json.dumps(payload).encode())}
+
+
+def test_only_supported_models_take_a_cache_checkpoint():
+    assert supports_prompt_cache("anthropic.claude-3-5-haiku-20241022-v1:0")
+    assert supports_prompt_cache("anthropic.claude-sonnet-4-20250514-v1:0")
+    assert supports_prompt_cache(NOVA)
+    assert not supports_prompt_cache("anthropic.claude-3-haiku-20240307-v1:0")
+    assert not supports_prompt_cache("meta.llama3-8b-instruct-v1:0")
+
+
+def test_cacheable_system_block_is_marked_per_family():
+    claude = ClaudeAdapter().build_body("p", 100, 0.5, system="s", cache_system=True)
+    assert claude["system"] == [{"type": "text", "text": "s", "cache_control": {"type": "ephemeral"}}]
+    assert claude["messages"][0]["content"] == "p"
+
+    nova = NovaAdapter().build_body("p", 100, 0.5, system="s", cache_system=True)
+    assert nova["system"] == [{"text": "s"}, {"cachePoint": {"type": "default"}}]
+
+
+def test_cache_token_counts_are_extracted_per_family():
+    claude = ClaudeAdapter().extract_usage({"usage": {"input_tokens": 20, "output_tokens": 5,
+                                                      "cache_read_input_tokens": 300,
+                                                      "cache_creation_input_tokens": 0}})
+    assert claude["cache_read_tokens"] == 300 and claude["cache_write_tokens"] == 0
+
+    nova = NovaAdapter().extract_usage({"usage": {"inputTokens": 20, "outputTokens": 5,
+                                                  "cacheWriteInputTokenCount": 300}})
+    assert nova["cache_read_tokens"] == 0 and nova["cache_write_tokens"] == 300
+
+    metrics = {"inputTokenCount": 20, "outputTokenCount": 5, "cacheReadInputTokenCount": 300}
+    streamed = ModelAdapter().stream_usage({"amazon-bedrock-invocationMetrics": metrics})
+    assert streamed["cache_read_tokens"] == 300 and streamed["cache_write_tokens"] == 0
+
+
+def test_cached_tokens_are_billed_at_their_own_rates():
+    usage = {"input_tokens": 1000, "output_tokens": 100, "cache_read_tokens": 10000, "cache_write_tokens": 0}
+    assert main.usage_cost(NOVA, usage) == main.estimate_cost(NOVA, 1000 + 1000, 100)
+
+    usage = {"input_tokens": 1000, "output_tokens": 100, "cache_read_tokens": 0, "cache_write_tokens": 4000}
+    assert main.usage_cost(NOVA, usage) == main.estimate_cost(NOVA, 1000 + 5000, 100)
+
+
+def test_reads_save_and_writes_cost_extra(caching_stats):
+    main.record_prompt_caching(NOVA, {"input_tokens": 20, "cache_read_tokens": 10000}, 100.0)
+    main.record_prompt_caching(NOVA, {"input_tokens": 20, "cache_write_tokens": 10000}, 300.0)
+
+    summary = caching_stats.summary()
+    assert summary["calls"] == 2 and summary["hit_rate"] == 0.5
+    assert summary["cached_input_share"] == pytest.approx(10000 / 20040, abs=1e-4)
+    expected = main.estimate_cost(NOVA, 10000, 0) * (main.PROMPT_CACHE_READ_DISCOUNT
+                                                     - main.PROMPT_CACHE_WRITE_PREMIUM)
+    assert summary["cost_saved"] == pytest.approx(expected)
+    assert summary["p50_latency_saved_ms"] == 200.0
+
+
+def test_system_prompt_is_sent_as_a_cacheable_block_and_accounted(monkeypatch, caching_stats):
+    stub = NovaStub(cache_read=300)
+    monkeypatch.setattr(main.bedrock_invoker, "client", stub)
+    request = main.PromptRequest(description="cache my system prompt")
+
+    result = asyncio.run(main.call_bedrock_model(NOVA, main.build_user_prompt(request),
+                                                 system=main.system_prompt_for(request)))
+
+    body = stub.bodies[0]
+    assert body["system"] == [{"text": main.SYSTEM_PROMPT}, {"cachePoint": {"type": "default"}}]
+    assert main.SYSTEM_PROMPT not in body["messages"][0]["content"][0]["text"]
+    assert result["usage"]["cache_read_tokens"] == 300
+    assert caching_stats.calls == 1 and caching_stats.cache_hits == 1
+
+    monkeypatch.setattr(main, "PROMPT_CACHE_ENABLED", False)
+    asyncio.run(main.call_bedrock_model(NOVA, "p", system="s"))
+    assert stub.bodies[1]["system"] == [{"text": "s"}] and caching_stats.calls == 1
@@ -0,0 +1,174 @@
+"""
+Tests for retries and circuit breaking
+"""
+
+import asyncio
+import random
+
+import pytest
+from botocore.exceptions import ClientError, ConnectionClosedError, ReadTimeoutError
+
+import resilience
+from resilience import (
+    CircuitBreaker, CircuitOpenError, ModelBreakers, backoff_delays, is_retryable_error, resilient_call,
+    resilient_stream
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(resilience.time, "monotonic", fake)
+    return fake
+
+
+@pytest.fixture
+def breakers(monkeypatch):
+    fresh = ModelBreakers()
+    monkeypatch.setattr(resilience, "model_breakers", fresh)
+
+    async def no_sleep(model_id, attempt, delay, error):
+        pass
+
+    monkeypatch.setattr(resilience, "sleep_before_retry", no_sleep)
+    return fresh
+
+
+def client_error(code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, "InvokeModel")
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("m", failure_threshold=3, cooldown_seconds=30)
+    breaker.record_failure()
+    breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN and breaker.is_open()
+    assert not breaker.allow()
+    assert breaker.stats()["times_opened"] == 1 and breaker.stats()["short_circuited"] == 1
+
+
+def test_half_open_trial_closes_or_reopens_the_breaker(clock):
+    breaker = CircuitBreaker("m", failure_threshold=1, cooldown_seconds=30)
+    breaker.record_failure()
+
+    clock.now += 29
+    assert not breaker.allow()
+
+    clock.now += 1
+    assert not breaker.is_open()
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    # One trial at a time
+    assert breaker.is_open() and not breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.stats()["times_opened"] == 2
+    assert not breaker.allow()
+
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_released_trial_lets_the_next_call_try(clock):
+    breaker = CircuitBreaker("m", failure_threshold=1, cooldown_seconds=30)
+    breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+
+    breaker.release_trial()
+
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_backoff_delays_stay_within_bounds():
+    random.seed(7)
+    for _ in range(200):
+        delays = list(backoff_delays(attempts=5, base_ms=100, cap_ms=400))
+        assert len(delays) == 4
+        assert all(0.1 <= delay <= 0.4 for delay in delays)
+    assert list(backoff_delays(attempts=1)) == []
+
+
+def test_retryable_errors_are_transient_ones():
+    for code in ("ThrottlingException", "ServiceUnavailableException", "InternalServerException",
+                 "ModelTimeoutException", "ModelNotReadyException", "ModelStreamErrorException"):
+        assert is_retryable_error(client_error(code)), code
+    assert is_retryable_error(ConnectionClosedError(endpoint_url="https://bedrock"))
+    assert is_retryable_error(ReadTimeoutError(endpoint_url="https://bedrock"))
+
+    for code in ("ValidationException", "AccessDeniedException", "ResourceNotFoundException"):
+        assert not is_retryable_error(client_error(code)), code
+    assert not is_retryable_error(RuntimeError("boom"))
+
+
+def test_transient_failures_are_retried_then_counted_once(breakers):
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise client_error("ServiceUnavailableException")
+        return "ok"
+
+    assert asyncio.run(resilient_call("m", flaky)) == "ok"
+    assert len(attempts) == 3
+    assert breakers.get("m").consecutive_failures == 0
+
+
+def test_configuration_errors_and_throttling_are_not_breaker_failures(breakers):
+    async def fail(code):
+        raise client_error(code)
+
+    for code in ("ValidationException", "ThrottlingException"):
+        with pytest.raises(ClientError):
+            asyncio.run(resilient_call("m", lambda: fail(code)))
+    assert breakers.get("m").consecutive_failures == 0
+
+    with pytest.raises(ClientError):
+        asyncio.run(resilient_call("m", lambda: fail("ServiceUnavailableException")))
+    assert breakers.get("m").consecutive_failures == 1
+
+
+def test_stream_is_not_retried_once_it_has_yielded(breakers):
+    attempts = []
+
+    async def stream():
+        attempts.append(1)
+        yield "partial"
+        raise client_error("ServiceUnavailableException")
+
+    async def consume():
+        return [item async for item in resilient_stream("m", stream)]
+
+    with pytest.raises(ClientError):
+        asyncio.run(consume())
+    assert len(attempts) == 1
+
+
+def test_open_breaker_skips_the_call(breakers):
+    breaker = breakers.get("m")
+    breaker.failure_threshold = 1
+    breaker.record_failure()
+    called = []
+
+    async def call():
+        called.append(1)
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(resilient_call("m", call))
+    assert not called
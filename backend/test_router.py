@@ -0,0 +1,129 @@
+"""
+Tests for latency- and cost-aware model routing
+"""
+
+import asyncio
+import itertools
+
+import httpx
+
+import main
+from concurrency import AdaptiveLimiter, ModelLimiters
+from metrics import model_health
+from resilience import ModelBreakers
+from router import ModelRouter
+
+_ids = itertools.count()
+
+
+def models(*aliases):
+    """Fresh model ids per test, so the shared health samples start empty"""
+    run = next(_ids)
+    return {alias: f"test-router-{run}-{alias}" for alias in aliases}
+
+
+def cost_fn(prices):
+    return lambda model_id, input_tokens, output_tokens: prices[model_id.rsplit("-", 1)[1]] * (input_tokens + output_tokens)
+
+
+def observe(model_id, latency_ms, samples=10, errors=0):
+    for i in range(samples):
+        model_health[model_id].record_success(latency_ms, 100 + i)
+    for _ in range(errors):
+        model_health[model_id].record_error()
+
+
+def test_cheapest_model_within_the_slo_is_chosen():
+    ids = models("cheap", "pricey")
+    router = ModelRouter(ids, cost_fn({"cheap": 1, "pricey": 10}), slo_ms=1000, min_samples=5)
+    observe(ids["cheap"], 800)
+    observe(ids["pricey"], 200)
+
+    assert router.choose(100) == "cheap"
+
+
+def test_slow_cheap_model_loses_to_a_fast_one():
+    ids = models("cheap", "pricey")
+    router = ModelRouter(ids, cost_fn({"cheap": 1, "pricey": 10}), slo_ms=1000, min_samples=5)
+    observe(ids["cheap"], 3000)
+    observe(ids["pricey"], 200)
+
+    assert router.choose(100) == "pricey"
+
+    # With nothing inside the SLO the fastest model wins, whatever it costs
+    router.slo_ms = 100
+    assert router.choose(100) == "pricey"
+    assert router.recent_decisions(1)[0]["reason"] == "no model within latency SLO, fastest predicted"
+
+
+def test_unhealthy_models_are_skipped():
+    ids = models("cheap", "pricey")
+    router = ModelRouter(ids, cost_fn({"cheap": 1, "pricey": 10}), slo_ms=1000, max_error_rate=0.2,
+                         min_samples=5)
+    observe(ids["cheap"], 100, samples=5, errors=5)
+    observe(ids["pricey"], 200)
+
+    assert router.choose(100) == "pricey"
+
+
+def test_models_that_would_refuse_the_call_are_skipped():
+    ids = models("cheap", "pricey")
+    breakers, limiters = ModelBreakers(), ModelLimiters()
+    router = ModelRouter(ids, cost_fn({"cheap": 1, "pricey": 10}), slo_ms=1000, min_samples=5,
+                         breakers=breakers, limiters=limiters)
+    observe(ids["cheap"], 100)
+    observe(ids["pricey"], 200)
+
+    # Its error rate is still within bounds, but the breaker has opened
+    breaker = breakers.get(ids["cheap"])
+    breaker.failure_threshold = 1
+    breaker.record_failure()
+    assert router.choose(100) == "pricey"
+    assert not next(c for c in router.recent_decisions(1)[0]["candidates"] if c["model"] == "cheap")["available"]
+
+    breaker.record_success()
+    full = AdaptiveLimiter(ids["cheap"], initial_limit=1, min_limit=1, max_queue=0)
+    full.in_flight = 1
+    limiters._limiters[ids["cheap"]] = full
+    assert router.choose(100) == "pricey"
+
+    # With nothing able to take the call, routing falls back to the usual choice
+    breakers.get(ids["pricey"]).failure_threshold = 1
+    breakers.get(ids["pricey"]).record_failure()
+    assert router.choose(100) == "cheap"
+
+
+def test_models_without_history_are_assumed_to_meet_the_slo():
+    ids = models("cheap", "pricey")
+    router = ModelRouter(ids, cost_fn({"cheap": 1, "pricey": 10}), slo_ms=1000, min_samples=5)
+    observe(ids["pricey"], 200)
+
+    assert router.choose(100) == "cheap"
+    candidate = next(c for c in router.recent_decisions(1)[0]["candidates"] if c["model"] == "cheap")
+    assert candidate["samples"] == 0 and candidate["predicted_latency_ms"] == 1000
+
+
+def test_decisions_are_recorded_newest_first():
+    ids = models("cheap", "pricey")
+    router = ModelRouter(ids, cost_fn({"cheap": 1, "pricey": 10}), slo_ms=1000, history=2)
+
+    for input_tokens in (10, 20, 30):
+        router.choose(input_tokens)
+
+    decisions = router.recent_decisions()
+    assert [d["input_tokens"] for d in decisions] == [30, 20]
+    assert decisions[0]["chosen"] == "cheap" and decisions[0]["reason"] == "cheapest model within latency SLO"
+    assert {c["model"] for c in decisions[0]["candidates"]} == {"cheap", "pricey"}
+    assert len(router.recent_decisions(1)) == 1
+
+
+def test_decisions_endpoint_returns_the_router_record():
+    main.model_router.choose(42)
+
+    async def fetch():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            return (await client.get("/routing/decisions", params={"limit": 1})).json()
+
+    body = asyncio.run(fetch())
+    assert body["latency_slo_ms"] == main.model_router.slo_ms
+    assert len(body["decisions"]) == 1 and body["decisions"][0]["input_tokens"] == 42
@@ -0,0 +1,37 @@
+"""
+Tests for canonical cache keys and near-duplicate lookup
+"""
+
+from cache import PromptCache
+from similarity import NearDuplicateIndex, canonicalize
+from testing import result
+
+
+def test_keys_ignore_case_whitespace_and_edge_punctuation():
+    assert canonicalize("  Write a   marketing\nemail. ") == "write a marketing email"
+
+    cache = PromptCache()
+    cache.set("Write a marketing email", "", "m", result("ok"))
+
+    assert cache.get("write a marketing email.", "", "m") == result("ok")
+    assert cache.key("Write a marketing email", "", "m") == cache.key("WRITE A MARKETING EMAIL!", "", "m")
+    assert cache.get("write a marketing email", "", "other-model") is None
+
+
+def test_near_duplicates_are_served_above_the_threshold_only():
+    cache = PromptCache(max_entries=2, similar=NearDuplicateIndex(threshold=0.7))
+    cache.set("Write a marketing email for our new running shoes", "", "m", result("shoes"))
+
+    assert cache.get("Please write a marketing email for our new running shoes", "", "m") == result("shoes")
+    assert cache.get("Summarize this legal contract in plain English", "", "m") is None
+    assert cache.get("Please write a marketing email for our new running shoes", "", "other-model") is None
+
+    stats = cache.stats()["similarity"]
+    assert stats["near_hits"] == 1 and stats["near_misses"] == 2
+    assert 0.7 <= stats["mean_similarity"] < 1
+
+    # Evicted entries leave the index
+    cache.set("a", "", "m", result("a"))
+    cache.set("b", "", "m", result("b"))
+    assert cache.stats()["similarity"]["indexed"] == 2
+    assert cache.get("Please write a marketing email for our new running shoes", "", "m") is None
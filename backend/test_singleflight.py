@@ -0,0 +1,49 @@
+"""
+Tests for single-flight request coalescing
+"""
+
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    group = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        return await asyncio.gather(*(group.do("key", work) for _ in range(10)))
+
+    assert asyncio.run(run()) == ["result"] * 10
+    assert len(calls) == 1
+    assert group.stats() == {"in_flight": 0, "upstream_calls": 1, "calls_saved": 9}
+
+
+def test_errors_fan_out_and_cancelled_leader_hands_over():
+    group = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        results = await asyncio.gather(group.do("bad", fail), group.do("bad", fail), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+
+        leader = asyncio.ensure_future(group.do("key", lambda: asyncio.sleep(1)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(group.do("key", lambda: asyncio.sleep(0.01, result="retried")))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "retried"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(run())
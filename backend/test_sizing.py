@@ -0,0 +1,90 @@
+"""
+Tests for predictive max_tokens sizing and the retry after a truncated answer
+"""
+
+import asyncio
+import io
+import json
+
+import pytest
+
+import main
+from benchmark import FakeBedrockClient
+from metrics import linear_tail_prediction
+from sizing import TokenBudgetPredictor
+
+
+def test_prediction_follows_the_fit_plus_the_residual_tail():
+    samples = [(x, 2 * x + 10) for x in range(1, 21)]
+    assert linear_tail_prediction(samples, 100, 99) == pytest.approx(210)
+
+    # A slope below zero is treated as flat, and the tail covers the largest residual
+    assert linear_tail_prediction([(1, 50), (2, 40), (3, 30)], 10, 99) == pytest.approx(50)
+
+
+def test_budget_is_the_ceiling_until_there_is_enough_history():
+    budgets = TokenBudgetPredictor(min_samples=5, headroom=1.5, min_tokens=50)
+    for _ in range(4):
+        budgets.record("m", "email", 100, 200)
+    assert budgets.budget("m", "email", 100, 1000) == 1000
+
+    budgets.record("m", "email", 100, 200)
+    assert budgets.budget("m", "email", 100, 1000) == 300
+    assert budgets.budget("m", "email", 100, 250) == 250
+    assert budgets.budget("m", "other", 100, 1000) == 1000
+    assert budgets.stats()["tokens_not_reserved"] == 700
+
+
+def test_budget_never_drops_below_the_floor_and_retries_grow_to_the_ceiling():
+    budgets = TokenBudgetPredictor(min_samples=1, headroom=1.0, min_tokens=256)
+    budgets.record("m", "email", 100, 10)
+
+    assert budgets.budget("m", "email", 100, 1000) == 256
+    assert budgets.next_budget(256, 1000) == 512
+    assert budgets.next_budget(512, 1000) == 1000
+
+    budgets.record_truncation("m", "email", 256, 256)
+    assert budgets.stats()["truncations"] == 1 and budgets.stats()["retry_output_tokens"] == 256
+
+
+class TruncatingBedrock(FakeBedrockClient):
+    """Answers stop at ``needed`` output tokens; smaller budgets end with stop_reason max_tokens"""
+
+    def __init__(self, needed: int):
+        super().__init__(latency=0)
+        self.needed = needed
+        self.budgets = []
+
+    def invoke_model(self, modelId, body, contentType="application/json"):
+        max_tokens = json.loads(body)["max_tokens"]
+        self.budgets.append(max_tokens)
+        truncated = max_tokens < self.needed
+        payload = {
+            "content": [{"text": self.text[:20] if truncated else self.text}],
+            "stop_reason": "max_tokens" if truncated else "end_turn",
+            "usage": {"input_tokens": 300, "output_tokens": min(max_tokens, self.needed)}
+        }
+        return {"body": io.BytesIO(json.dumps(payload).encode())}
+
+
+def test_truncated_answer_is_retried_with_a_larger_budget(monkeypatch):
+    main.prompt_cache.clear()
+    budgets = TokenBudgetPredictor(min_samples=1, headroom=1.0, min_tokens=100)
+    stub = TruncatingBedrock(needed=350)
+    monkeypatch.setattr(main, "token_budgets", budgets)
+    monkeypatch.setattr(main.bedrock_invoker, "client", stub)
+    monkeypatch.setattr(main.hedge_policy, "enabled", False)
+
+    request = main.PromptRequest(description="Write a sizing test email", max_tokens=1000)
+    model_id = main.MODELS[request.model]
+    domain = main.sizing_domain(request)
+    budgets.record(model_id, domain, main.prompt_tokens(request), 120)
+
+    result = asyncio.run(main.run_optimization(request))
+
+    assert stub.budgets == [120, 240, 480]
+    assert result["optimized_prompt"] == "ok"
+    assert budgets.stats()["truncations"] == 2
+    # Trained on the same local input count the budget was predicted from
+    assert budgets._samples[(model_id, domain)][-1] == (main.prompt_tokens(request), 350)
+    main.prompt_cache.clear()
@@ -0,0 +1,149 @@
+"""
+Tests for cutting /optimize streams short when the client leaves or the deadline passes
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+import deadline as deadline_module
+import main
+from bedrock_client import BedrockInvoker
+from benchmark import FakeBedrockClient
+from deadline import CancellationStats, DeadlineExceeded, deadline_scope, request_deadline
+
+
+class PacedBedrock(FakeBedrockClient):
+    """Streams its answer one piece every ``piece_seconds``, counting the pieces actually generated"""
+
+    def __init__(self, pieces: int = 50, piece_seconds: float = 0.04):
+        super().__init__(latency=0, chunks=pieces)
+        self.piece_seconds = piece_seconds
+        self.streamed = 0
+
+    def invoke_model_with_response_stream(self, modelId, body, contentType="application/json"):
+        return {"body": self._events()}
+
+    def _events(self):
+        for piece in self._pieces():
+            time.sleep(self.piece_seconds)
+            self.streamed += 1
+            event = {"type": "content_block_delta", "delta": {"type": "text_delta", "text": piece}}
+            yield {"chunk": {"bytes": json.dumps(event).encode()}}
+
+
+class LeavingClient:
+    """Stands in for the Starlette request; reports a disconnect once ``after`` seconds have passed"""
+
+    def __init__(self, after: float):
+        self.leaves_at = time.monotonic() + after
+
+    async def is_disconnected(self) -> bool:
+        return time.monotonic() >= self.leaves_at
+
+
+@pytest.fixture
+def paced(monkeypatch):
+    main.prompt_cache.clear()
+    stub = PacedBedrock()
+    stats = CancellationStats()
+    # Its own invoker, so slots other tests' loops closed on can't be mistaken for leaks
+    monkeypatch.setattr(main, "bedrock_invoker", BedrockInvoker(client=stub, max_concurrency=4))
+    monkeypatch.setattr(main.hedge_policy, "enabled", False)
+    monkeypatch.setattr(main, "cancellation_stats", stats)
+    monkeypatch.setattr(deadline_module, "cancellation_stats", stats)
+    monkeypatch.setattr(deadline_module, "DISCONNECT_POLL_SECONDS", 0.01)
+    yield stub, stats
+    main.prompt_cache.clear()
+
+
+async def invoker_drained():
+    # The invoker slot is freed on the loop once the reader thread notices and closes the stream
+    for _ in range(100):
+        if main.bedrock_invoker.in_flight == 0:
+            return
+        await asyncio.sleep(0.01)
+
+
+def guarded(request: main.PromptRequest, http_request, timeout_ms: int):
+    async def run():
+        stream = main.guard_stream(http_request, main.stream_prompt_optimization(request, None),
+                                   request_deadline(timeout_ms))
+        events = [json.loads(event[len("data: "):]) async for event in stream]
+        await invoker_drained()
+        return events
+
+    return asyncio.run(run())
+
+
+def assert_released(stub: PacedBedrock, pieces: int):
+    """Every slot the abandoned call held is free again, and the model stopped generating"""
+    model_id = main.MODELS[main.DEFAULT_MODEL]
+    assert main.bedrock_invoker.in_flight == 0
+    assert main.model_limiters.get(model_id).in_flight == 0
+    assert main.optimization_flights.stats()["in_flight"] == 0
+    assert stub.streamed < pieces
+
+
+def test_client_disconnect_cancels_the_bedrock_stream(paced):
+    stub, stats = paced
+
+    events = guarded(main.PromptRequest(description="client leaves early"), LeavingClient(after=0.2), 60000)
+
+    assert "result" not in [event["type"] for event in events]
+    assert stats.stats()["cancelled_by_stage"] == {"model": 1}
+    assert_released(stub, 50)
+
+
+def test_deadline_mid_stream_ends_with_a_timeout_event(paced):
+    stub, stats = paced
+
+    events = guarded(main.PromptRequest(description="runs out of time"), LeavingClient(after=60), 200)
+
+    assert events[-1]["type"] == "error" and "deadline exceeded during model" in events[-1]["message"]
+    assert stats.stats()["expired_by_stage"] == {"model": 1}
+    assert_released(stub, 50)
+
+
+def test_follower_takes_over_from_a_leader_that_ran_out_of_time(paced):
+    stub, _ = paced
+    body = {"description": "leader times out, follower finishes"}
+
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            leader = asyncio.ensure_future(client.post("/optimize", json={**body, "timeout_ms": 200}))
+            await asyncio.sleep(0.05)
+            follower = await client.post("/optimize-sync", json=body)
+            leader = await leader
+            await invoker_drained()
+            return leader, follower
+
+    leader, follower = asyncio.run(send())
+
+    assert "deadline exceeded" in leader.text
+    assert follower.status_code == 200 and follower.json()["optimized_prompt"] == "ok"
+    assert_released(stub, 50)
+
+
+def test_leader_out_of_time_before_the_model_hands_the_flight_over(paced):
+    request = main.PromptRequest(description="expired before the model stage")
+    key = main.optimization_key(request)
+    assert isinstance(main.flight_error(request, DeadlineExceeded("model")), asyncio.CancelledError)
+
+    async def run():
+        # Joined the way stream_prompt_optimization joins before streaming
+        flight, _ = main.optimization_flights.join(key)
+        follower = asyncio.ensure_future(
+            main.optimization_flights.wait(key, flight, lambda: main.run_optimization(request))
+        )
+        with deadline_scope(request_deadline(1)):
+            await asyncio.sleep(0.01)
+            with pytest.raises(DeadlineExceeded):
+                async for _ in main.stream_model_optimization(request, key):
+                    pass
+        return await follower
+
+    assert asyncio.run(run())["optimized_prompt"] == "ok"
@@ -0,0 +1,116 @@
+"""
+Tests for local token counts and provider usage accounting
+"""
+
+import asyncio
+import io
+import json
+
+import httpx
+import pytest
+
+import main
+import tokens
+from benchmark import FakeBedrockClient
+from tokens import TokenAccounting, count_static_tokens, count_tokens
+
+
+@pytest.fixture
+def heuristic(monkeypatch):
+    monkeypatch.setattr(tokens, "_ENCODING", None)
+    yield
+    # Don't leave heuristic counts memoized for tests using tiktoken
+    count_static_tokens.cache_clear()
+
+
+@pytest.fixture
+def accounting(monkeypatch):
+    main.prompt_cache.clear()
+    fresh = TokenAccounting()
+    monkeypatch.setattr(main, "token_accounting", fresh)
+    monkeypatch.setattr(main.hedge_policy, "enabled", False)
+    yield fresh
+    main.prompt_cache.clear()
+
+
+class UsageFreeBedrock(FakeBedrockClient):
+    """Responses without a usage block, like some providers send"""
+
+    def invoke_model(self, modelId, body, contentType="application/json"):
+        return {"body": io.BytesIO(json.dumps({"content": [{"text": self.text}]}).encode())}
+
+
+def test_heuristic_counts_words_by_length_digits_in_runs_and_each_mark(heuristic):
+    assert count_tokens("") == 0
+    assert count_tokens("Hi, you!") == 4
+    # Twelve letters are three tokens, six digits two
+    assert count_tokens("Internationa 123456") == 3 + 2
+    assert count_tokens("a  b\n\tc") == 3
+
+
+def test_heuristic_is_closer_than_words_times_1_3_on_punctuated_text(heuristic):
+    text = 'Return JSON: {"reasoning_trace": ["Step 1: ..."], "optimized_prompt": "..."}'
+    # The old estimate ignored the punctuation that makes up most of a JSON answer
+    assert count_tokens(text) > len(text.split()) * 1.3
+
+
+def test_static_counts_are_memoized(heuristic):
+    count_static_tokens.cache_clear()
+    count_static_tokens(main.SYSTEM_PROMPT)
+    count_static_tokens(main.SYSTEM_PROMPT)
+
+    assert count_static_tokens(main.SYSTEM_PROMPT) == count_tokens(main.SYSTEM_PROMPT)
+    assert count_static_tokens.cache_info().hits == 2
+
+
+def test_reported_usage_wins_and_missing_counts_are_estimated(heuristic):
+    accounting = TokenAccounting()
+
+    reported = accounting.resolve({"input_tokens": 300, "output_tokens": 120, "cache_read_tokens": 0}, 10, "out")
+    estimated = accounting.resolve({}, 10, "two words")
+    partial = accounting.resolve({"input_tokens": 300}, 10, "two words")
+
+    assert reported == {"input_tokens": 300, "output_tokens": 120, "cache_read_tokens": 0}
+    assert estimated == {"input_tokens": 10, "output_tokens": count_tokens("two words")}
+    assert partial == {"input_tokens": 300, "output_tokens": count_tokens("two words")}
+    stats = accounting.stats()
+    assert stats["reported"] == 1 and stats["estimated"] == 2 and stats["reported_share"] == 0.3333
+    assert stats["tokenizer"] == "heuristic"
+
+
+def send(*calls):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            return [await client.post(path, json=body) for path, body in calls]
+
+    return asyncio.run(run())
+
+
+def test_sync_endpoint_bills_reported_usage(monkeypatch, accounting):
+    monkeypatch.setattr(main.bedrock_invoker, "client", FakeBedrockClient(latency=0))
+
+    sync, = send(("/optimize-sync", {"description": "bill what bedrock reports"}))
+
+    # FakeBedrockClient reports 300 input and 120 output tokens
+    assert sync.json()["cost_estimate"] == main.estimate_cost(main.MODELS[main.DEFAULT_MODEL], 300, 120)
+    assert accounting.reported == 1 and accounting.estimated == 0
+
+
+def test_endpoints_fall_back_to_local_counts(monkeypatch, accounting):
+    model_id = main.MODELS[main.DEFAULT_MODEL]
+    text = FakeBedrockClient().text
+    sync_request = main.PromptRequest(description="bill what we count ourselves")
+    stream_request = main.PromptRequest(description="bill what we count while streaming")
+
+    monkeypatch.setattr(main.bedrock_invoker, "client", UsageFreeBedrock(latency=0))
+    sync, = send(("/optimize-sync", sync_request.model_dump()))
+    # The stream is abandoned once the answer is complete, before Bedrock's closing metrics chunk
+    monkeypatch.setattr(main.bedrock_invoker, "client", FakeBedrockClient(latency=0))
+    stream, = send(("/optimize", stream_request.model_dump()))
+
+    assert sync.json()["cost_estimate"] == main.estimate_cost(model_id, main.prompt_tokens(sync_request),
+                                                              count_tokens(text))
+    result = [json.loads(line[6:]) for line in stream.text.splitlines() if '"type": "result"' in line][0]
+    assert result["cost_estimate"] == main.estimate_cost(model_id, main.prompt_tokens(stream_request),
+                                                         count_tokens(text))
+    assert accounting.reported == 0 and accounting.estimated == 2
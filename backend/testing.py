@@ -0,0 +1,43 @@
+"""
+Shared helpers for the backend tests
+"""
+
+import json
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from benchmark import FakeBedrockClient
+
+
+def result(text: str) -> dict:
+    """A cacheable optimization result"""
+    return {"optimized_prompt": text, "reasoning_trace": ["Step 1: ok"], "cost_estimate": 0.0}
+
+
+class StubBedrock(FakeBedrockClient):
+    """Records prompts and peak concurrency; rejects prompts containing 'bad' and stalls on ones containing 'slow'"""
+
+    def __init__(self, latency: float = 0.05):
+        super().__init__(latency=latency)
+        self.prompts = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def invoke_model(self, modelId, body, contentType="application/json"):
+        prompt = json.loads(body)["messages"][0]["content"]
+        with self._lock:
+            self.prompts.append(prompt)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            if "bad" in prompt:
+                raise ClientError({"Error": {"Code": "ValidationException", "Message": "bad"}}, "InvokeModel")
+            if "slow" in prompt:
+                time.sleep(0.5)
+            return super().invoke_model(modelId, body, contentType)
+        finally:
+            with self._lock:
+                self.active -= 1
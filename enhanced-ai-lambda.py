@@ -2,6 +2,7 @@ import json
 import boto3
 from datetime import datetime
 import logging
+import os
 import re
 from typing import Dict, List, Tuple
 
@@ -13,6 +14,15 @@ logger.setLevel(logging.INFO)
 bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1')
 dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
 
+BEDROCK_MODEL_ID = os.environ.get('BEDROCK_MODEL_ID', 'anthropic.claude-3-haiku-20240307-v1:0')
+# Claude models that accept a prompt-cache checkpoint on Bedrock
+PROMPT_CACHE_MODEL_PREFIXES = (
+    'anthropic.claude-3-5-haiku',
+    'anthropic.claude-3-7-sonnet',
+    'anthropic.claude-sonnet-4',
+    'anthropic.claude-opus-4',
+)
+
 # Advanced system prompt for elite prompt engineering
 ADVANCED_SYSTEM_PROMPT = """You are an elite prompt engineering specialist with deep expertise in cognitive science, AI model behavior, and optimization techniques. Your mission is to transform user prompts into highly effective, production-ready instructions that maximize AI model performance.
 
@@ -367,17 +377,21 @@ def optimize_with_advanced_bedrock(user_prompt: str, domain: str) -> str:
     Use Amazon Bedrock Claude-3 Haiku with advanced system prompt
     """
     
+    # The static instructions go in the system block so models with prompt caching can reuse them
+    system_block = {"type": "text", "text": ADVANCED_SYSTEM_PROMPT}
+    if BEDROCK_MODEL_ID.startswith(PROMPT_CACHE_MODEL_PREFIXES):
+        system_block["cache_control"] = {"type": "ephemeral"}
+    
     # Prepare the request with advanced system prompt
     body = {
         "anthropic_version": "bedrock-2023-05-31",
         "max_tokens": 1500,
         "temperature": 0.2,  # Lower temperature for more consistent optimization
+        "system": [system_block],
         "messages": [
             {
                 "role": "user",
-                "content": f"""{ADVANCED_SYSTEM_PROMPT}
-
-DOMAIN CONTEXT: This prompt appears to be in the {domain} domain.
+                "content": f"""DOMAIN CONTEXT: This prompt appears to be in the {domain} domain.
 
 ORIGINAL PROMPT TO OPTIMIZE:
 "{user_prompt}"
@@ -389,13 +403,16 @@ OPTIMIZED PROMPT:"""
     
     # Call Bedrock with enhanced configuration
     response = bedrock_runtime.invoke_model(
-        modelId="anthropic.claude-3-haiku-20240307-v1:0",
+        modelId=BEDROCK_MODEL_ID,
         body=json.dumps(body),
         contentType="application/json"
     )
     
     # Parse response
     response_body = json.loads(response['body'].read())
+    usage = response_body.get('usage', {})
+    logger.info(f"Prompt cache: {usage.get('cache_read_input_tokens', 0)} tokens read, "
+                f"{usage.get('cache_creation_input_tokens', 0)} written, {usage.get('input_tokens', 0)} uncached")
     optimized_prompt = response_body['content'][0]['text'].strip()
     
     return optimized_prompt
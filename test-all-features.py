@@ -96,6 +96,30 @@ def test_caching():
     final_stats = response.json()
     print(f"✅ Final cache entries: {final_stats['total_entries']}")
 
+def test_batch_optimization(model):
+    """Test batch optimization"""
+    print(f"\n📦 Testing batch optimization...")
+    
+    payload = {
+        "requests": [
+            {"description": "Create a prompt for summarizing meeting notes", "model": model, "max_tokens": 300},
+            {"description": "Create a prompt for drafting customer support replies", "model": model, "max_tokens": 300},
+            {"description": "Create a prompt for summarizing meeting notes", "model": model, "max_tokens": 300}
+        ]
+    }
+    
+    start_time = time.time()
+    response = requests.post(f"{BASE_URL}/optimize-batch", json=payload, stream=True)
+    assert response.status_code == 200
+    
+    results = [json.loads(line) for line in response.iter_lines() if line]
+    end_time = time.time()
+    
+    assert sorted(r['index'] for r in results) == [0, 1, 2]
+    succeeded = [r for r in results if r['status'] == 'ok']
+    print(f"✅ Batch of {len(results)} completed in {end_time - start_time:.2f}s")
+    print(f"✅ Succeeded: {len(succeeded)}, from cache: {sum(r['cached'] for r in succeeded)}")
+
 def test_prompt_library():
     """Test prompt library functionality"""
     print(f"\n📚 Testing prompt library...")
@@ -233,6 +257,7 @@ def main():
         
         # Enhanced features
         test_caching()
+        test_batch_optimization(model)
         test_prompt_library()
         test_usage_stats()
         
@@ -247,6 +272,7 @@ def main():
         print("  ✅ Synchronous Optimization")
         print("  ✅ Streaming Optimization")
         print("  ✅ Caching System")
+        print("  ✅ Batch Optimization")
         print("  ✅ Prompt Library")
         print("  ✅ Usage Statistics")
         print("  ✅ Error Handling")
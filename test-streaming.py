@@ -40,11 +40,21 @@ def test_streaming_optimization():
                         if data.get('type') == 'status':
                             print(f"📊 Status: {data['message']}")
                         
+                        elif data.get('type') == 'prompt':
+                            print(data['content'], end='', flush=True)
+                        
                         elif data.get('type') == 'reasoning':
                             step_content = data['content']
                             print(f"🧠 Step {data['step']}: {step_content}")
                             reasoning_steps.append(step_content)
                         
+                        elif data.get('type') == 'draft':
+                            print(f"📝 Draft ({data['ms']}ms, rule-based): {data['optimized_prompt'][:80]}...")
+                        
+                        elif data.get('type') == 'restart':
+                            print(f"\n🔁 {data['message']}")
+                            reasoning_steps = []
+                        
                         elif data.get('type') == 'result':
                             result = data
                             print("\n" + "="*60)
@@ -55,6 +65,7 @@ def test_streaming_optimization():
                             print(f"💰 Cost: ${result['cost_estimate']}")
                             print(f"🤖 Model: {result['model_used']}")
                             print(f"⏰ Time: {result['timestamp']}")
+                            print(f"⚡ Time to first byte: {result.get('ttfb_ms')}ms")
                         
                         elif data.get('type') == 'complete':
                             print("\n✅ Optimization complete!")